@@ -23,6 +23,20 @@ chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
     return true;
   }
 
+  if (message.action === 'sendToDesktop') {
+    console.log(LOG, 'sendToDesktop:', message.job && message.job.url);
+    sendToDesktop(message.job)
+      .then(jobs => sendResponse({ success: true, jobs }))
+      .catch(err => sendResponse({ success: false, error: err.message, needToken: !!err.needToken }));
+    return true;
+  }
+
+  if (message.action === 'setDesktopToken') {
+    chrome.storage.local.set({ desktopToken: message.token.trim() })
+      .then(() => sendResponse({ success: true }));
+    return true;
+  }
+
   if (message.action === 'downloadSubtitle') {
     console.log(LOG, 'downloadSubtitle');
     fetchSubtitle(message.url)
@@ -110,6 +124,45 @@ async function fetchSubtitle(url) {
   return resp.text();
 }
 
+/* ═══════════════════════════════════════
+   Desktop Handoff — 桌面版本地接口
+   ═══════════════════════════════════════ */
+const DESKTOP_PORT = 17865;
+
+async function sendToDesktop(job) {
+  const { desktopToken, desktopPort } = await chrome.storage.local.get(['desktopToken', 'desktopPort']);
+  if (!desktopToken) {
+    const err = new Error('请先填写桌面版「扩展接入」的令牌');
+    err.needToken = true;
+    throw err;
+  }
+
+  let resp;
+  try {
+    resp = await fetch(`http://127.0.0.1:${desktopPort || DESKTOP_PORT}/jobs`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': 'Bearer ' + desktopToken,
+      },
+      body: JSON.stringify(job)
+    });
+  } catch (err) {
+    throw new Error('未连接到桌面版，请在桌面版中点击「扩展接入」');
+  }
+
+  const data = await resp.json().catch(() => ({}));
+  if (resp.status === 401) {
+    const err = new Error('令牌无效，请重新填写');
+    err.needToken = true;
+    throw err;
+  }
+  if (!resp.ok || !data.success) {
+    throw new Error(data.error || `桌面版返回 ${resp.status}`);
+  }
+  return data.jobs;
+}
+
 /* ═══════════════════════════════════════
    Extension Install / Update
    ═══════════════════════════════════════ */
@@ -326,7 +326,7 @@
 
     const combined = videos.filter(f => f.combined);
     const videoOnly = videos.filter(f => !f.combined);
-    let html = '';
+    let html = desktopHandoffHtml();
 
     if (combined.length > 0) {
       html += '<div class="wr-section-header">视频+音频 (可直接播放)</div>';
@@ -339,6 +339,7 @@
 
     mainContent.innerHTML = html;
     bindDownloadBtns(title);
+    bindDesktopHandoff();
   }
 
   function renderAudioFormats(formats, title) {
@@ -444,6 +445,62 @@
     });
   }
 
+  /* ═══════════════════════════════════════
+     Desktop Handoff — 交给桌面版下载（格式选择与音视频合并由桌面引擎完成）
+     ═══════════════════════════════════════ */
+  function desktopHandoffHtml() {
+    return `
+      <div class="wr-section-header">交给桌面版 (自动合并音频)</div>
+      <div class="wr-desktop-row">
+        <button class="wr-sub-btn wr-desktop-btn" data-height="">最佳</button>
+        <button class="wr-sub-btn wr-desktop-btn" data-height="2160">4K</button>
+        <button class="wr-sub-btn wr-desktop-btn" data-height="1080">1080p</button>
+        <span class="wr-desktop-status"></span>
+      </div>
+      <div class="wr-desktop-token" style="display:none;">
+        <input class="wr-desktop-input" type="text" placeholder="粘贴桌面版「扩展接入」复制的令牌" spellcheck="false">
+        <button class="wr-sub-btn wr-desktop-save">保存</button>
+      </div>
+    `;
+  }
+
+  function bindDesktopHandoff() {
+    const status = mainContent.querySelector('.wr-desktop-status');
+    const tokenRow = mainContent.querySelector('.wr-desktop-token');
+    const input = mainContent.querySelector('.wr-desktop-input');
+    let pendingHeight = null;
+
+    async function send(height) {
+      pendingHeight = height;
+      status.textContent = '发送中...';
+      const job = {
+        kind: 'best',
+        url: `https://www.youtube.com/watch?v=${videoData.videoId}`,
+        max_height: height ? parseInt(height, 10) : null,
+      };
+      const resp = await chrome.runtime.sendMessage({ action: 'sendToDesktop', job });
+      if (resp && resp.success) {
+        status.textContent = '✓ 已加入桌面版下载队列';
+        tokenRow.style.display = 'none';
+        return;
+      }
+      status.textContent = resp ? resp.error : '无响应';
+      if (resp && resp.needToken) {
+        tokenRow.style.display = '';
+        input.focus();
+      }
+    }
+
+    mainContent.querySelectorAll('.wr-desktop-btn').forEach(btn => {
+      btn.addEventListener('click', () => send(btn.dataset.height));
+    });
+    mainContent.querySelector('.wr-desktop-save').addEventListener('click', async () => {
+      if (!input.value.trim()) return;
+      await chrome.runtime.sendMessage({ action: 'setDesktopToken', token: input.value });
+      send(pendingHeight);
+    });
+  }
+
   async function downloadSubtitle(caption, fmt, title) {
     const subUrl = caption.baseUrl + (fmt === 'srt' ? '&fmt=srv3' : '&fmt=vtt');
 
@@ -0,0 +1,248 @@
+"""
+下载引擎离线基准：本地媒体服务器（benchmarks/media_server.py）+ 测试提取器代替 YouTube，无需联网
+
+info_cold          — fetch_video_info 完整提取（元数据接口 + DASH 清单）的延迟
+info_warm          — 命中元数据缓存时的延迟
+video_progressive  — download_video 渐进式单流（分段并行下载）
+video_single_conn  — 同上，connections=1（yt-dlp HttpFD）
+audio              — download_audio
+dash_video         — download_video DASH 分片流（有 ffmpeg 时为真实 fMP4 分片，含 yt-dlp 的 MOOV 修复）
+best_merged        — download_best 视频 + 音频，分流下载后合并（需要 ffmpeg）
+best_stream_merge  — 同上，stream_merge=True（需要 ffmpeg）
+subtitles          — download_subtitles 两种语言并转换为 SRT
+hook_overhead      — video_progressive 中进度回调的调用次数与耗时
+scaling            — 1 / 2 / 4 / 8 个并发任务的总吞吐
+
+每个连接的速率与请求延迟可调，用于模拟 CDN 的单连接限速。结果以 JSON 写入 --output 以便跟踪性能回归。
+
+用法：python benchmarks/bench_engine.py [--size-mb N] [--throughput MB/s] [--latency MS] [--repeat N]
+                                        [--jobs 1,2,4,8] [--output FILE] [--json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# 元数据缓存、下载索引等写入临时的应用数据目录，不影响真实数据，也保证每次都是冷启动
+_APPDATA = tempfile.mkdtemp(prefix='ytdl-bench-')
+os.environ['APPDATA'] = _APPDATA
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp  # noqa: E402
+import ytdl_engine  # noqa: E402
+from media_server import BenchIE, MediaServer, find_ffmpeg, make_media  # noqa: E402
+
+_ids = iter(range(1, 1 << 30))
+
+
+# ─── Harness ───
+
+class Bench:
+    def __init__(self, server, workdir, repeat):
+        self.server = server
+        self.workdir = workdir
+        self.repeat = repeat
+
+    def new_url(self, prefetch=True):
+        """每次测量使用新的视频 id：不会命中下载索引或已下载的文件"""
+        url = self.server.watch_url(f'v{next(_ids)}')
+        if prefetch:
+            ytdl_engine.fetch_video_info(url)
+        return url
+
+    def out_dir(self):
+        path = os.path.join(self.workdir, f'out{next(_ids)}')
+        os.makedirs(path)
+        return path
+
+    def transfer(self, fn, size):
+        """重复运行下载函数，返回耗时中位数与吞吐"""
+        times = []
+        for _ in range(self.repeat):
+            url, out = self.new_url(), self.out_dir()
+            start = time.perf_counter()
+            fn(url, out)
+            times.append(time.perf_counter() - start)
+            shutil.rmtree(out, ignore_errors=True)
+        seconds = statistics.median(times)
+        return {'seconds': round(seconds, 3), 'mb': round(size / 1e6, 1), 'mb_per_s': round(size / seconds / 1e6, 1)}
+
+    def latency(self, fn):
+        times = []
+        for _ in range(self.repeat):
+            times.append(fn())
+        return {'median_ms': round(statistics.median(times) * 1000, 2),
+                'min_ms': round(min(times) * 1000, 2), 'max_ms': round(max(times) * 1000, 2)}
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+# ─── Cases ───
+
+def case_info(bench):
+    cold = bench.latency(lambda: _timed(ytdl_engine.fetch_video_info, bench.new_url(prefetch=False), False))
+    url = bench.new_url()
+    warm = bench.latency(lambda: _timed(ytdl_engine.fetch_video_info, url))
+    return {'info_cold': cold, 'info_warm': warm}
+
+
+def case_downloads(bench, has_media):
+    files = bench.server.files
+    sizes = {name: f.size for name, f in files.items()}
+    dash_size = bench.server.dash_size()
+    cases = {
+        'video_progressive': (lambda url, out: ytdl_engine.download_video(url, 'syn-v', out, merge_audio=False),
+                              sizes['syn-v']),
+        'video_single_conn': (lambda url, out: ytdl_engine.download_video(url, 'syn-v', out, merge_audio=False,
+                                                                          connections=1), sizes['syn-v']),
+        'audio': (lambda url, out: ytdl_engine.download_audio(url, 'syn-a', out), sizes['syn-a']),
+        'dash_video': (lambda url, out: ytdl_engine.download_video(url, 'dash-v1', out, merge_audio=False),
+                       dash_size),
+    }
+    if has_media:
+        merged = sizes['media-v'] + sizes['media-a']
+        cases['best_merged'] = (lambda url, out: ytdl_engine.download_best(url, out, max_height=720), merged)
+        cases['best_stream_merge'] = (lambda url, out: ytdl_engine.download_best(url, out, max_height=720,
+                                                                                 stream_merge=True), merged)
+    results = {name: bench.transfer(fn, size) for name, (fn, size) in cases.items()}
+    if not has_media:
+        results['best_merged'] = results['best_stream_merge'] = {'skipped': 'ffmpeg not found'}
+    return results
+
+
+def case_subtitles(bench):
+    return {'subtitles': bench.transfer(
+        lambda url, out: ytdl_engine.download_subtitles(url, out, langs=['en', 'de'], fmts=('srt',)),
+        len(bench.server._subtitle) * 2)}
+
+
+def case_hook_overhead(bench):
+    """在一次真实下载中统计 _ProgressHook 的调用次数与累计耗时"""
+    hook = ytdl_engine._ProgressHook
+    original = hook.__call__
+    calls = [0, 0.0]
+    lock = threading.Lock()
+
+    def timed(self, d):
+        start = time.perf_counter()
+        try:
+            return original(self, d)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                calls[0] += 1
+                calls[1] += elapsed
+
+    url, out = bench.new_url(), bench.out_dir()
+    hook.__call__ = timed
+    try:
+        wall = _timed(ytdl_engine.download_video, url, 'syn-v', out, merge_audio=False)
+    finally:
+        hook.__call__ = original
+    shutil.rmtree(out, ignore_errors=True)
+    count, total = calls
+    return {'hook_overhead': {'calls': count, 'total_ms': round(total * 1000, 2),
+                              'us_per_call': round(total / count * 1e6, 2) if count else 0,
+                              'share_of_wall': round(total / wall, 4)}}
+
+
+def case_scaling(bench, job_counts):
+    """n 个视频任务同时运行（并发上限 = n）的总吞吐"""
+    size = bench.server.files['syn-v'].size
+    results = {}
+    for n in job_counts:
+        ytdl_engine.set_max_concurrent(n)
+        urls = [bench.new_url() for _ in range(n)]
+        outs = [bench.out_dir() for _ in range(n)]
+        done = threading.Semaphore(0)
+        start = time.perf_counter()
+        for url, out in zip(urls, outs):
+            job_id = ytdl_engine.submit_job('video', url=url, format_id='syn-v', output_dir=out, merge_audio=False)
+            ytdl_engine.add_job_callback(job_id, lambda snapshot: done.release())
+        for _ in range(n):
+            done.acquire()
+        seconds = time.perf_counter() - start
+        for out in outs:
+            shutil.rmtree(out, ignore_errors=True)
+        results[str(n)] = {'seconds': round(seconds, 3), 'mb_per_s': round(size * n / seconds / 1e6, 1)}
+    ytdl_engine.set_max_concurrent(ytdl_engine.DEFAULT_MAX_CONCURRENT)
+    return {'scaling': results}
+
+
+# ─── Entry ───
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64, help='合成视频流的大小（MB），音频为其 1/8')
+    parser.add_argument('--throughput', type=float, default=0, help='每个连接的速率上限（MB/s），0 为不限速')
+    parser.add_argument('--latency', type=float, default=0, help='每个请求的延迟（毫秒）')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测量的重复次数（取中位数）')
+    parser.add_argument('--jobs', default='1,2,4,8', help='并发扩展测试的任务数')
+    parser.add_argument('--media-seconds', type=int, default=20, help='真实媒体（合并测试）的时长')
+    parser.add_argument('--output', help='将结果写入 JSON 文件')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    workdir = os.path.join(_APPDATA, 'work')
+    ffmpeg = find_ffmpeg()
+    media = make_media(os.path.join(_APPDATA, 'media'), args.media_seconds, ffmpeg) if ffmpeg else None
+    ytdl_engine.register_extractor(BenchIE)
+    ytdl_engine.set_download_reuse(False)
+
+    results = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'yt_dlp': yt_dlp.version.__version__, 'ffmpeg': bool(ffmpeg)},
+        'settings': {'size_mb': args.size_mb, 'throughput_mb_s': args.throughput, 'latency_ms': args.latency,
+                     'repeat': args.repeat},
+    }
+    server = MediaServer(throughput=args.throughput * 1e6, latency=args.latency / 1000,
+                         size_mb=args.size_mb, media=media)
+    try:
+        with server:
+            bench = Bench(server, workdir, args.repeat)
+            results.update(case_info(bench))
+            results.update(case_downloads(bench, media is not None))
+            results.update(case_subtitles(bench))
+            results.update(case_hook_overhead(bench))
+            results.update(case_scaling(bench, [int(n) for n in args.jobs.split(',') if n.strip()]))
+            results['server'] = server.stats()
+    finally:
+        ytdl_engine._postprocessor.shutdown()
+        shutil.rmtree(_APPDATA, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(results, fp, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    print(f'{"case":<20}{"seconds":>10}{"MB":>9}{"MB/s":>9}')
+    for name in ('video_progressive', 'video_single_conn', 'audio', 'dash_video', 'best_merged',
+                 'best_stream_merge', 'subtitles'):
+        r = results[name]
+        if 'skipped' in r:
+            print(f'{name:<20}{"-":>10}  {r["skipped"]}')
+        else:
+            print(f'{name:<20}{r["seconds"]:>10.3f}{r["mb"]:>9.1f}{r["mb_per_s"]:>9.1f}')
+    for name in ('info_cold', 'info_warm'):
+        r = results[name]
+        print(f'{name:<20}{r["median_ms"]:>10.2f} ms (min {r["min_ms"]}, max {r["max_ms"]})')
+    h = results['hook_overhead']
+    print(f'hook_overhead       {h["calls"]} calls, {h["us_per_call"]} us/call, '
+          f'{h["share_of_wall"] * 100:.2f}% of wall time')
+    print('scaling (jobs → MB/s): ' + ', '.join(f'{n} → {r["mb_per_s"]}' for n, r in results['scaling'].items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+进度回调微基准：比较每个数据块的记录开销
+
+before — 旧实现：全局锁 + 每次调用都格式化速度 / ETA 字符串并重建字段
+after  — 当前实现：_ProgressHook 只写入原始数值，读取时才计算 EWMA 与字符串
+
+用法：python benchmarks/bench_progress_hook.py [--calls N] [--threads N] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ytdl_engine  # noqa: E402
+
+
+# ─── Baseline: the hook as it was before numeric recording ───
+
+_old_progress = {'status': 'idle', 'percent': 0, 'speed': '', 'eta': '', 'filename': '', 'error': ''}
+_old_lock = threading.Lock()
+
+
+def _old_set_progress(**kw):
+    with _old_lock:
+        _old_progress.update(kw)
+
+
+def old_progress_hook(d):
+    if d['status'] == 'downloading':
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        downloaded = d.get('downloaded_bytes', 0)
+        pct = (downloaded / total * 100) if total > 0 else 0
+        speed = d.get('_speed_str', d.get('speed', ''))
+        if isinstance(speed, (int, float)):
+            speed = f"{speed / 1024 / 1024:.1f} MB/s"
+        eta = d.get('_eta_str', d.get('eta', ''))
+        if isinstance(eta, (int, float)):
+            m, s = divmod(int(eta), 60)
+            eta = f"{m}:{s:02d}"
+        _old_set_progress(status='downloading', percent=round(pct, 1), speed=str(speed), eta=str(eta))
+    elif d['status'] == 'finished':
+        _old_set_progress(status='merging', percent=99, speed='', eta='')
+
+
+# ─── Harness ───
+
+def _make_events(n, total=500 << 20):
+    info = {'format_id': '137'}
+    step = total // n
+    return [{
+        'status': 'downloading',
+        'downloaded_bytes': i * step,
+        'total_bytes': total,
+        'speed': 12.5 * 1024 * 1024,
+        'eta': (n - i) // 100,
+        'filename': '/tmp/video.f137.mp4',
+        'info_dict': info,
+    } for i in range(n)]
+
+
+def _run(hook, events, threads):
+    def work():
+        for d in events:
+            hook(d)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return (time.perf_counter() - start) / (len(events) * threads) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200_000, help='每个线程的回调次数')
+    parser.add_argument('--threads', type=int, default=4, help='并发下载线程数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    events = _make_events(args.calls)
+    results = {}
+    for threads in (1, args.threads):
+        results[f'before_{threads}t_ns'] = _run(old_progress_hook, events, threads)
+
+        job_id = ytdl_engine._manager.create('bench', '')
+        results[f'after_{threads}t_ns'] = _run(ytdl_engine._ProgressHook(job_id), events, threads)
+
+        # 同时开启事件推送（界面打开时的实际情况）
+        ytdl_engine.set_event_sink(lambda batch: None)
+        job_id = ytdl_engine._manager.create('bench', '')
+        results[f'after_events_{threads}t_ns'] = _run(ytdl_engine._ProgressHook(job_id), events, threads)
+        ytdl_engine.set_event_sink(None)
+
+    if args.json:
+        print(json.dumps({k: round(v, 1) for k, v in results.items()}, indent=2))
+        return
+    print(f'{"variant":<24}{"ns / call":>12}')
+    for key, value in results.items():
+        print(f'{key[:-3]:<24}{value:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+启动基准：测量窗口出现前的导入开销与首帧时间，防止 yt-dlp 重新回到启动关键路径上
+
+interpreter   — 对照：空解释器启动（python -c pass）
+main_import   — import main：窗口创建前必须完成的导入（关键路径）
+engine_import — import ytdl_engine：后台线程中进行的导入（含 yt-dlp）
+engine_warmup — import ytdl_engine + warmup()：后台预热完成的总耗时
+first_paint   — 进程启动到页面加载完成（需要 pywebview 与图形环境）
+
+另外用 -X importtime 列出关键路径上最重的顶层模块；关键路径上出现 yt_dlp 时以状态码 1 退出。
+
+用法：python benchmarks/bench_startup.py [--repeat N] [--budget MS] [--no-window] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# pywebview 未安装时用空模块占位，只为测量应用自身模块的导入（main 在模块级不访问 webview）
+_WEBVIEW_PLACEHOLDER = (
+    "import sys, importlib.util\n"
+    "if importlib.util.find_spec('webview') is None:\n"
+    "    sys.modules['webview'] = type(sys)('webview')\n"
+)
+
+_SNIPPETS = {
+    'interpreter': 'pass',
+    'main_import': _WEBVIEW_PLACEHOLDER + 'import main',
+    'engine_import': 'import ytdl_engine',
+    'engine_warmup': 'import ytdl_engine; ytdl_engine.warmup()',
+}
+
+_FIRST_PAINT = """
+import sys, time, webview
+import main
+_create = webview.create_window
+def create_window(*args, **kwargs):
+    window = _create(*args, **kwargs)
+    def loaded():
+        print('PAINT', time.time(), flush=True)
+        window.destroy()
+    window.events.loaded += loaded
+    return window
+webview.create_window = create_window
+main.main()
+"""
+
+
+# ─── Harness ───
+
+def _run(code, extra_args=()):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *extra_args, '-c', code], cwd=APP_DIR, env=env,
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed')
+    return elapsed, proc
+
+
+def wall_clock(code, repeat):
+    # 第一次运行会生成字节码缓存，不计入结果
+    _run(code)
+    return statistics.median(_run(code)[0] for _ in range(repeat)) * 1000
+
+
+def import_profile(code):
+    """解析 -X importtime 输出，返回 {顶层模块: 累计微秒} 与全部已导入模块名"""
+    _, proc = _run(code, ('-X', 'importtime'))
+    top, names = {}, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        names.add(name.strip())
+        if not name.startswith('  '):          # 缩进表示被其它模块嵌套导入
+            top[name.strip()] = int(cumulative)
+    return top, names
+
+
+def first_paint(repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        proc = subprocess.run([sys.executable, '-c', _FIRST_PAINT], cwd=APP_DIR,
+                              capture_output=True, text=True, timeout=60)
+        painted = [line for line in proc.stdout.splitlines() if line.startswith('PAINT ')]
+        if not painted:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'no window')
+        times.append((float(painted[0].split()[1]) - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='每项测量的重复次数（取中位数）')
+    parser.add_argument('--budget', type=float, default=0,
+                        help='main_import 的耗时上限（毫秒，扣除解释器启动），超出时以状态码 1 退出')
+    parser.add_argument('--no-window', action='store_true', help='跳过首帧测量')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    results = {name: round(wall_clock(code, args.repeat), 1) for name, code in _SNIPPETS.items()}
+    top, names = import_profile(_SNIPPETS['main_import'])
+    heaviest = sorted(top.items(), key=lambda kv: -kv[1])[:8]
+    results['critical_path_top_ms'] = {name: round(us / 1000, 1) for name, us in heaviest}
+    results['yt_dlp_on_critical_path'] = any(n == 'yt_dlp' or n.startswith('yt_dlp.') for n in names)
+
+    results['first_paint'] = None
+    if not args.no_window:
+        try:
+            results['first_paint'] = round(first_paint(args.repeat), 1)
+        except Exception as e:
+            results['first_paint_error'] = str(e)
+
+    overhead = results['main_import'] - results['interpreter']
+    failed = results['yt_dlp_on_critical_path'] or (args.budget and overhead > args.budget)
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print(f'{"case":<16}{"ms":>10}')
+        for name in (*_SNIPPETS, 'first_paint'):
+            value = results[name]
+            print(f'{name:<16}{value:>10.1f}' if value is not None else
+                  f'{name:<16}{"-":>10}  {results.get("first_paint_error", "skipped")}')
+        print('\n关键路径上最重的顶层模块 (ms):')
+        for name, ms in results['critical_path_top_ms'].items():
+            print(f'  {name:<30}{ms:>8.1f}')
+        if results['yt_dlp_on_critical_path']:
+            print('\n[回归] yt_dlp 出现在窗口创建之前的导入路径上')
+        elif failed:
+            print(f'\n[回归] main_import 超出预算：{overhead:.1f} ms > {args.budget:g} ms')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+字幕管线基准：在长时间（默认 10 小时）的合成自动字幕上测量解析 / 转换 / 双语合并的吞吐与峰值内存
+
+vtt_parse          — 逐条解析滚动式自动字幕 VTT
+vtt_to_srt_dedupe  — VTT → SRT，同时去除滚动重复行
+json3_to_srt       — 流式解析 JSON3 → SRT
+srv3_to_vtt        — SRV3 (XML) → VTT
+bilingual_merge    — 两条 10 小时字幕合并为双语 SRT
+json3_load_all     — 对照：json.load 整个 JSON3 文档的峰值内存
+
+用法：python benchmarks/bench_subtitles.py [--hours N] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import subtitles  # noqa: E402
+
+_WORDS = 'the quick brown fox jumps over a lazy dog while we talk about subtitles and streams'.split()
+
+
+# ─── Synthetic captions ───
+
+def _ts(ms):
+    return subtitles._format_timestamp(ms, '.')
+
+
+def _line(i):
+    return ' '.join(_WORDS[(i + k) % len(_WORDS)] for k in range(6))
+
+
+def write_auto_vtt(path, hours):
+    """YouTube 风格的滚动自动字幕：每 2.5 秒一行新文字，附带 10ms 过渡 cue"""
+    n = int(hours * 3600 / 2.5)
+    with open(path, 'w', encoding='utf-8') as fp:
+        fp.write('WEBVTT\nKind: captions\nLanguage: en\n\n')
+        for i in range(n):
+            t = i * 2500
+            prev = _line(i - 1) if i else ' '
+            words = _line(i).split(' ')
+            timed = words[0] + ''.join(f'<{_ts(t + 300 * k)}><c> {w}</c>' for k, w in enumerate(words[1:], 1))
+            fp.write(f'{_ts(t)} --> {_ts(t + 2490)} align:start position:0%\n{prev}\n{timed}\n\n')
+            fp.write(f'{_ts(t + 2490)} --> {_ts(t + 2500)} align:start position:0%\n{_line(i)}\n \n\n')
+    return n
+
+
+def write_json3(path, hours, offset=0):
+    n = int(hours * 3600 / 2.5)
+    with open(path, 'w', encoding='utf-8') as fp:
+        fp.write('{"wireMagic":"pb3","pens":[{}],"wsWinStyles":[{}],"events":[\n')
+        for i in range(n):
+            event = {'tStartMs': i * 2500 + offset, 'dDurationMs': 2400, 'wWinId': 1,
+                     'segs': [{'utf8': w if k == 0 else ' ' + w, 'tOffsetMs': 300 * k}
+                              for k, w in enumerate(_line(i + 7).split(' '))]}
+            fp.write(('' if i == 0 else ',\n') + json.dumps(event))
+        fp.write('\n]}\n')
+    return n
+
+
+def write_srv3(path, hours):
+    n = int(hours * 3600 / 2.5)
+    with open(path, 'w', encoding='utf-8') as fp:
+        fp.write('<?xml version="1.0" encoding="utf-8" ?><timedtext format="3"><head><pen id="1"/></head><body>\n')
+        for i in range(n):
+            segs = ''.join(f'<s t="{300 * k}">{w}</s>' for k, w in enumerate(_line(i + 3).split(' ')))
+            fp.write(f'<p t="{i * 2500}" d="2400">{segs}</p>\n')
+        fp.write('</body></timedtext>\n')
+    return n
+
+
+# ─── Harness ───
+
+def _measure(fn, size):
+    # 计时与内存跟踪分开运行：tracemalloc 会显著拖慢分配密集的代码
+    start = time.perf_counter()
+    cues = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'cues': cues,
+        'seconds': round(elapsed, 3),
+        'mb_per_s': round(size / elapsed / 1e6, 1),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hours', type=float, default=10, help='合成字幕的时长（小时）')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vtt = os.path.join(tmp, 'auto.en.vtt')
+        js3 = os.path.join(tmp, 'zh.json3')
+        srv = os.path.join(tmp, 'ja.srv3')
+        out = os.path.join(tmp, 'out')
+        write_auto_vtt(vtt, args.hours)
+        write_json3(js3, args.hours, offset=400)
+        write_srv3(srv, args.hours)
+
+        def vtt_parse():
+            with open(vtt, 'rb') as fp:
+                return sum(1 for _ in subtitles.parse(fp, 'vtt'))
+
+        def json3_load_all():
+            with open(js3, encoding='utf-8') as fp:
+                return len(json.load(fp)['events'])
+
+        cases = {
+            'vtt_parse': (vtt_parse, vtt),
+            'vtt_to_srt_dedupe': (lambda: subtitles.convert(vtt, out + '.srt', dedupe=True), vtt),
+            'json3_to_srt': (lambda: subtitles.convert(js3, out + '.srt'), js3),
+            'srv3_to_vtt': (lambda: subtitles.convert(srv, out + '.vtt'), srv),
+            'bilingual_merge': (lambda: subtitles.merge_files(vtt, js3, out + '.srt', dedupe=True), vtt),
+            'json3_load_all': (json3_load_all, js3),
+        }
+        results = {'hours': args.hours,
+                   'input_mb': {os.path.basename(p): round(os.path.getsize(p) / 1e6, 1) for p in (vtt, js3, srv)}}
+        for name, (fn, src) in cases.items():
+            results[name] = _measure(fn, os.path.getsize(src))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{args.hours:g} 小时字幕，输入大小 (MB): {results["input_mb"]}')
+    print(f'{"case":<20}{"cues":>10}{"seconds":>10}{"MB/s":>8}{"peak KB":>11}')
+    for name in cases:
+        r = results[name]
+        print(f'{name:<20}{r["cues"]:>10}{r["seconds"]:>10.3f}{r["mb_per_s"]:>8.1f}{r["peak_kb"]:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""
+离线基准用的本地媒体服务器：代替 YouTube 提供合成的渐进式文件、DASH 清单与分片、字幕文件，
+可限制每个连接的吞吐并为每个请求注入延迟。配合测试提取器 BenchIE，下载引擎的各条路径无需联网即可运行。
+
+/watch/<id>               — 视频页，由 BenchIE 匹配（任意 id 都有效，每个 id 对应一份独立的元数据）
+/api/<id>.json            — 视频元数据：格式列表与字幕
+/media/<name>             — 渐进式文件，支持 Range / HEAD
+/dash/<id>.mpd            — DASH 清单；/dash/<rep>/init.mp4 与 /dash/<rep>/<n>.m4s 为分片
+/subs/<lang>.vtt          — 字幕
+
+syn-v / syn-a 为合成字节（测量传输，不可播放）；安装了 ffmpeg 时另外生成可合并的真实媒体 media-v / media-a，
+DASH 分片也改为由 media-v 切出的真实 fMP4（yt-dlp 会用 ffmpeg 修复 DASH 下载的 MOOV，合成字节无法通过）。
+
+用法：python benchmarks/media_server.py [--port N] [--throughput MB/s] [--latency MS] [--size-mb N]
+"""
+
+import argparse
+import http.server
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from yt_dlp.extractor.common import InfoExtractor
+
+_BLOCK = 1 << 20
+_CHUNK = 64 << 10
+_SUB_LANGS = ('en', 'de')
+
+
+# ─── Content ───
+
+class SyntheticFile:
+    """确定性的伪随机内容：1 MiB 随机块循环，按需切片，不占用磁盘"""
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self._block = random.Random(seed).randbytes(_BLOCK)
+
+    def read(self, start, length):
+        out = bytearray()
+        while length > 0:
+            offset = start % _BLOCK
+            n = min(length, _BLOCK - offset)
+            out += self._block[offset:offset + n]
+            start += n
+            length -= n
+        return bytes(out)
+
+
+class DiskFile:
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def read(self, start, length):
+        with open(self.path, 'rb') as fp:
+            fp.seek(start)
+            return fp.read(length)
+
+
+def make_media(directory, seconds=20, ffmpeg='ffmpeg'):
+    """用 ffmpeg 生成可合并的视频流（仅视频）、音频流（仅音频）与视频的 DASH 分片，返回 {名称: 路径}"""
+    os.makedirs(directory, exist_ok=True)
+    video = os.path.join(directory, 'media-v.mp4')
+    audio = os.path.join(directory, 'media-a.m4a')
+    common = [ffmpeg, '-y', '-hide_banner', '-loglevel', 'error']
+    subprocess.run(common + ['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+                             '-c:v', 'mpeg4', '-q:v', '3', '-movflags', '+faststart', video], check=True)
+    subprocess.run(common + ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                             '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', audio], check=True)
+    dash = os.path.join(directory, 'dash')
+    os.makedirs(dash, exist_ok=True)
+    subprocess.run(common + ['-i', video, '-c', 'copy', '-f', 'dash', '-seg_duration', '1', '-use_template', '1',
+                             '-use_timeline', '0', '-init_seg_name', 'init.mp4', '-media_seg_name', '$Number$.m4s',
+                             os.path.join(dash, 'manifest.mpd')], check=True)
+    return {'media-v': video, 'media-a': audio, 'dash': dash}
+
+
+def _vtt(cues):
+    lines = ['WEBVTT', '']
+    for i in range(cues):
+        start, end = i * 2000, i * 2000 + 1900
+        lines += [f'{_ts(start)} --> {_ts(end)}', f'cue {i} lorem ipsum dolor sit amet', '']
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _ts(ms):
+    h, rem = divmod(ms, 3600000)
+    m, rem = divmod(rem, 60000)
+    return f'{h:02d}:{m:02d}:{rem // 1000:02d}.{rem % 1000:03d}'
+
+
+# ═══════════════════════════════════════
+#  Server
+# ═══════════════════════════════════════
+
+class MediaServer:
+    """
+    在后台线程中运行的本地 HTTP 服务器（HTTP/1.1 长连接）。
+    throughput 为每个连接的速率上限（字节/秒，0 为不限速），latency 为每个请求首字节前的延迟（秒）。
+    """
+
+    def __init__(self, throughput=0, latency=0, size_mb=64, fragment_kb=512, duration=60,
+                 media=None, subtitle_cues=1800, port=0):
+        self.throughput = throughput
+        self.latency = latency
+        self.duration = duration
+        self.fragment_size = fragment_kb << 10
+        self.files = {
+            'syn-v': SyntheticFile(size_mb << 20, seed=1),
+            'syn-a': SyntheticFile(max(1, size_mb // 8) << 20, seed=2),
+        }
+        media = dict(media or {})
+        dash = media.pop('dash', None)
+        for name, path in media.items():
+            self.files[name] = DiskFile(path)
+        if dash:
+            self._dash = {name: DiskFile(os.path.join(dash, name)) for name in os.listdir(dash)
+                          if name == 'init.mp4' or name.endswith('.m4s')}
+            self.fragments = len(self._dash) - 1
+        else:
+            self.fragments = math.ceil(size_mb * (1 << 20) / self.fragment_size)
+            fragment = SyntheticFile(self.fragment_size, seed=3)
+            self._dash = {'init.mp4': SyntheticFile(1024, seed=4),
+                          **{f'{n}.m4s': fragment for n in range(1, self.fragments + 1)}}
+        self._subtitle = _vtt(subtitle_cues)
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def watch_url(self, video_id):
+        return f'{self.base_url}/watch/{video_id}'
+
+    def dash_size(self):
+        """DASH 视频的总字节数（初始化分片 + 全部媒体分片）"""
+        return sum(f.size for f in self._dash.values())
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'bytes_sent': self.bytes_sent}
+
+    # ─── Catalog ───
+
+    def metadata(self, video_id):
+        # 合成格式不可播放：降低其 preference，yt-dlp 的格式排序与 download_best 都优先选真实媒体
+        formats = [
+            {'format_id': 'syn-v', 'url': f'{self.base_url}/media/syn-v', 'ext': 'mp4', 'protocol': 'http',
+             'vcodec': 'avc1.4d401f', 'acodec': 'none', 'width': 854, 'height': 480, 'fps': 30,
+             'filesize': self.files['syn-v'].size, 'tbr': self._kbps('syn-v'), 'preference': -10},
+            {'format_id': 'syn-a', 'url': f'{self.base_url}/media/syn-a', 'ext': 'm4a', 'protocol': 'http',
+             'vcodec': 'none', 'acodec': 'mp4a.40.2', 'filesize': self.files['syn-a'].size,
+             'abr': 64, 'tbr': 64, 'preference': -10},
+        ]
+        if 'media-v' in self.files:
+            formats += [
+                {'format_id': 'media-v', 'url': f'{self.base_url}/media/media-v', 'ext': 'mp4',
+                 'protocol': 'http', 'vcodec': 'mp4v.20.9', 'acodec': 'none', 'width': 1280, 'height': 720,
+                 'fps': 30, 'filesize': self.files['media-v'].size, 'tbr': self._kbps('media-v')},
+                {'format_id': 'media-a', 'url': f'{self.base_url}/media/media-a', 'ext': 'm4a',
+                 'protocol': 'http', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+                 'filesize': self.files['media-a'].size, 'abr': 128, 'tbr': 128},
+            ]
+        return {
+            'id': video_id,
+            'title': f'Bench {video_id}',
+            'duration': self.duration,
+            'formats': formats,
+            'subtitles': {lang: [{'ext': 'vtt', 'url': f'{self.base_url}/subs/{lang}.vtt'}] for lang in _SUB_LANGS},
+        }
+
+    def manifest(self, video_id):
+        # 总时长取分片时长的整数倍，yt-dlp 由两者相除得到的分片数才与实际一致
+        seg_ms = max(1, self.duration * 1000 // self.fragments)
+        bandwidth = int(self.dash_size() * 8 * 1000 / (seg_ms * self.fragments))
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" minBufferTime="PT2S" '
+            f'mediaPresentationDuration="PT{seg_ms * self.fragments / 1000:.3f}S" '
+            'profiles="urn:mpeg:dash:profile:isoff-live:2011">\n'
+            ' <Period>\n'
+            '  <AdaptationSet mimeType="video/mp4" contentType="video">\n'
+            f'   <Representation id="v1" bandwidth="{bandwidth}" width="640" height="360" codecs="avc1.4d401e">\n'
+            f'    <SegmentTemplate timescale="1000" duration="{seg_ms}" startNumber="1" '
+            'initialization="v1/init.mp4" media="v1/$Number$.m4s"/>\n'
+            '   </Representation>\n'
+            '  </AdaptationSet>\n'
+            ' </Period>\n'
+            '</MPD>\n').encode('utf-8')
+
+    def _kbps(self, name):
+        return round(self.files[name].size * 8 / 1000 / self.duration)
+
+    # ─── Requests ───
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._serve(head=True)
+
+            def do_GET(self):
+                self._serve(head=False)
+
+            def _serve(self, head):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                path = self.path.split('?', 1)[0]
+                body, ctype = server._route(path)
+                if body is None:
+                    self._send(404, b'not found', 'text/plain', head)
+                elif isinstance(body, bytes):
+                    self._send(200, body, ctype, head)
+                else:
+                    self._send_file(body, ctype, head)
+
+            def _send(self, code, data, ctype, head):
+                self.send_response(code)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if not head:
+                    self._write(lambda start, n: data[start:start + n], 0, len(data))
+
+            def _send_file(self, f, ctype, head):
+                start, end = 0, f.size - 1
+                m = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range') or '')
+                if m and (m.group(1) or m.group(2)):
+                    if m.group(1):
+                        start = int(m.group(1))
+                        end = min(int(m.group(2)), f.size - 1) if m.group(2) else f.size - 1
+                    else:
+                        start = max(0, f.size - int(m.group(2)))
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{f.size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{f.size}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                if not head:
+                    self._write(f.read, start, end - start + 1)
+
+            def _write(self, read, start, length):
+                rate = server.throughput
+                began = time.monotonic()
+                sent = 0
+                try:
+                    while sent < length:
+                        chunk = read(start + sent, min(_CHUNK, length - sent))
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                        if rate:
+                            ahead = sent / rate - (time.monotonic() - began)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                finally:
+                    with server._lock:
+                        server.bytes_sent += sent
+
+        return Handler
+
+    def _route(self, path):
+        m = re.match(r'/(watch|api|media|dash|subs)/(.+)$', path)
+        if not m:
+            return None, None
+        kind, rest = m.groups()
+        if kind == 'watch':
+            return f'<html><title>Bench {rest}</title></html>'.encode('utf-8'), 'text/html; charset=utf-8'
+        if kind == 'api' and rest.endswith('.json'):
+            return json.dumps(self.metadata(rest[:-5])).encode('utf-8'), 'application/json'
+        if kind == 'media':
+            f = self.files.get(rest)
+            return (f, 'video/mp4') if f is not None else (None, None)
+        if kind == 'subs':
+            return self._subtitle, 'text/vtt; charset=utf-8'
+        if kind == 'dash':
+            if rest.endswith('.mpd'):
+                return self.manifest(rest[:-4]), 'application/dash+xml'
+            f = self._dash.get(rest.split('/', 1)[-1])
+            if f is not None:
+                return f, 'video/mp4'
+        return None, None
+
+
+# ═══════════════════════════════════════
+#  Test extractor
+# ═══════════════════════════════════════
+
+class BenchIE(InfoExtractor):
+    """测试提取器：像 YouTube 提取器一样先请求一次元数据接口，再解析 DASH 清单"""
+
+    IE_NAME = 'bench'
+    _VALID_URL = r'https?://127\.0\.0\.1:\d+/watch/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        base = url[:url.index('/watch/')]
+        meta = self._download_json(f'{base}/api/{video_id}.json', video_id)
+        meta['formats'] += self._extract_mpd_formats(f'{base}/dash/{video_id}.mpd', video_id,
+                                                     mpd_id='dash', fatal=False)
+        meta['webpage_url'] = url
+        return meta
+
+
+def find_ffmpeg():
+    return shutil.which('ffmpeg')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--throughput', type=float, default=0, help='每个连接的速率上限（MB/s），0 为不限速')
+    parser.add_argument('--latency', type=float, default=0, help='每个请求的延迟（毫秒）')
+    parser.add_argument('--size-mb', type=int, default=64, help='合成视频流的大小（MB）')
+    parser.add_argument('--media-dir', help='生成真实媒体的目录（需要 ffmpeg）')
+    args = parser.parse_args()
+
+    media = None
+    ffmpeg = find_ffmpeg()
+    if args.media_dir and ffmpeg:
+        media = make_media(args.media_dir, ffmpeg=ffmpeg)
+    server = MediaServer(throughput=args.throughput * 1e6, latency=args.latency / 1000, size_mb=args.size_mb,
+                         media=media, port=args.port).start()
+    print(f'serving on {server.base_url}  e.g. {server.watch_url("demo")}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -34,6 +34,7 @@ pyinstaller ^
     --hidden-import "clr" ^
     --hidden-import "webview" ^
     --hidden-import "yt_dlp" ^
+    --hidden-import "ytdl_engine" ^
     main.py
 
 if errorlevel 1 (
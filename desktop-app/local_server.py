@@ -0,0 +1,430 @@
+"""
+威软YouTube视频下载工具 - 本地 HTTP 接口
+供浏览器扩展 / 油猴脚本把下载交给桌面引擎（格式选择、音视频合并、续传都由 ytdl_engine 完成）。
+基于 asyncio，只监听本机地址，除 /health 外所有请求都需要令牌。
+
+    GET  /health                  探测桌面端是否在运行（无需令牌）
+    POST /jobs                    提交任务：单个对象、对象数组或 {"jobs": [...]}
+    GET  /jobs                    全部任务进度；GET /jobs/<id> 单个任务
+    POST /jobs/<id>/pause         暂停；/resume 继续；/cancel 取消（?delete_files=1 删除未完成文件）
+    GET  /info?url=...            视频信息（与桌面界面相同的格式列表）
+    GET  /events[?job=<id>...]    Server-Sent Events 进度推送
+
+令牌通过 Authorization: Bearer <token> 传递；EventSource 无法设置请求头，可改用 ?token=。
+任务对象示例：{"kind": "best", "url": "...", "max_height": 2160}（最高 4K，自动合并音频）。
+
+    python local_server.py [--port 17865] [-o DIR]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import sys
+import threading
+import urllib.parse
+
+import ytdl_engine
+
+DEFAULT_PORT = 17865
+CONFIG_PATH = os.path.join(ytdl_engine.APP_DATA_DIR, 'local_server.json')
+
+_MAX_BODY = 1 << 20
+_MAX_JOBS_PER_REQUEST = 200
+_READ_TIMEOUT = 15
+_HEARTBEAT = 15             # SSE 心跳间隔（秒），防止空闲连接被中间层关闭
+_LOCAL_HOSTS = ('127.0.0.1', 'localhost', '[::1]', '::1')
+_EXTENSION_ORIGINS = ('chrome-extension://', 'moz-extension://', 'safari-web-extension://')
+
+# 每种任务允许由客户端指定的参数（下载目录由桌面端决定）及必填参数
+_JOB_PARAMS = {
+    'best': ('url', 'max_height', 'stream_merge'),
+    'video': ('url', 'format_id', 'merge_audio', 'stream_merge'),
+    'audio': ('url', 'format_id'),
+    'subtitle': ('url', 'lang', 'fmt', 'is_auto'),
+    'subtitles': ('url', 'langs', 'auto_langs', 'fmts', 'bilingual'),
+}
+_REQUIRED_PARAMS = {
+    'video': ('format_id',),
+    'audio': ('format_id',),
+    'subtitle': ('lang', 'fmt'),
+}
+
+_JOB_ACTIONS = {
+    'pause': lambda job_id, delete_files: ytdl_engine.pause_job(job_id),
+    'resume': lambda job_id, delete_files: ytdl_engine.resume_job(job_id),
+    'cancel': ytdl_engine.cancel_job,
+}
+
+_STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+    403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def load_config(path=CONFIG_PATH):
+    """读取（首次运行时生成）端口与令牌；令牌持久化，扩展只需配置一次"""
+    try:
+        with open(path, encoding='utf-8') as fp:
+            config = json.load(fp)
+    except (OSError, ValueError):
+        config = {}
+    if not config.get('token'):
+        config = {'port': config.get('port') or DEFAULT_PORT, 'token': secrets.token_urlsafe(24)}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump(config, fp)
+    config.setdefault('port', DEFAULT_PORT)
+    return config
+
+
+class _Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method, target, headers, body):
+        parsed = urllib.parse.urlsplit(target)
+        self.method = method
+        self.path = parsed.path.rstrip('/') or '/'
+        self.query = urllib.parse.parse_qs(parsed.query)
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        try:
+            return json.loads(self.body.decode('utf-8') or 'null')
+        except (UnicodeDecodeError, ValueError) as e:
+            raise HttpError(400, f'无效的 JSON: {e}')
+
+
+class _EventClient:
+    """一个 SSE 连接：待发送的任务记录按 id 合并，慢客户端只会丢掉中间状态，不会阻塞其它连接"""
+
+    def __init__(self, job_ids):
+        self.job_ids = set(job_ids)
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def offer(self, batch):
+        for snap in batch:
+            if not self.job_ids or snap['id'] in self.job_ids:
+                self.pending[snap['id']] = snap
+        if self.pending:
+            self.ready.set()
+
+    def take(self):
+        batch = list(self.pending.values())
+        self.pending.clear()
+        self.ready.clear()
+        return batch
+
+
+class LocalServer:
+    """
+    本地 HTTP 接口服务器：在独立线程中运行 asyncio 事件循环。
+    引擎调用（提交任务、获取信息）放到线程池执行，多个标签页的请求互不阻塞；
+    进度由 publish(batch) 注入（即引擎的事件接收器），广播给所有 SSE 连接。
+    """
+
+    def __init__(self, output_dir, port=None, token=None, host='127.0.0.1'):
+        config = load_config() if port is None or token is None else {}
+        self.host = host
+        self.port = port if port is not None else config['port']
+        self.token = token or config['token']
+        self.output_dir = output_dir
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._clients = set()
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def start(self):
+        """启动服务器，监听成功后返回（端口被占用时抛出 OSError）"""
+        if self._thread is not None:
+            return
+        started = threading.Event()
+        failure = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                self._server = loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port, limit=64 << 10))
+                self.port = self._server.sockets[0].getsockname()[1]
+            except OSError as e:
+                failure.append(e)
+                started.set()
+                loop.close()
+                return
+            self._loop = loop
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                self._server.close()
+                # 结束仍在进行的连接（主要是 SSE 长连接）
+                tasks = asyncio.all_tasks(loop)
+                for task in tasks:
+                    task.cancel()
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                loop.close()
+                self._server = None
+                self._loop = None
+
+        self._thread = threading.Thread(target=run, name='local-server', daemon=True)
+        self._thread.start()
+        started.wait()
+        if failure:
+            self._thread = None
+            raise failure[0]
+
+    def stop(self):
+        loop, thread = self._loop, self._thread
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(5)
+        self._thread = None
+
+    def info(self):
+        return {'running': self.running, 'host': self.host, 'port': self.port, 'token': self.token}
+
+    def publish(self, batch):
+        """引擎事件接收器（在推送线程中调用）：转交事件循环广播"""
+        loop = self._loop
+        if loop is not None and self._clients:
+            loop.call_soon_threadsafe(self._broadcast, batch)
+
+    def _broadcast(self, batch):
+        for client in self._clients:
+            client.offer(batch)
+
+    # ─── Connection ───
+
+    async def _handle(self, reader, writer):
+        origin = None
+        try:
+            request = await asyncio.wait_for(self._read_request(reader), _READ_TIMEOUT)
+            origin = request.headers.get('origin')
+            if request.method == 'OPTIONS':
+                await self._respond(writer, 204, None, origin)
+                return
+            self._check_access(request)
+            if request.path == '/events':
+                await self._stream_events(request, writer, origin)
+                return
+            status, payload = await self._route(request)
+            await self._respond(writer, status, payload, origin)
+        except HttpError as e:
+            await self._respond(writer, e.status, {'success': False, 'error': str(e)}, origin)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError,
+                asyncio.CancelledError):
+            # 客户端断开或服务器停止
+            pass
+        except Exception as e:
+            await self._respond(writer, 500, {'success': False, 'error': str(e)}, origin)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, '无效的请求行')
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length > _MAX_BODY:
+            raise HttpError(413, '请求体过大')
+        body = await reader.readexactly(length) if length else b''
+        return _Request(method.upper(), target, headers, body)
+
+    def _check_access(self, request):
+        # 校验 Host 防止 DNS 重绑定：恶意网页把自己的域名解析到 127.0.0.1 后也无法访问
+        host = request.headers.get('host', '')
+        hostname = host.rsplit(':', 1)[0] if not host.endswith(']') else host
+        if hostname not in _LOCAL_HOSTS:
+            raise HttpError(403, '只接受本机请求')
+        if request.path == '/health':
+            return
+        auth = request.headers.get('authorization', '')
+        token = auth[7:] if auth.lower().startswith('bearer ') else (request.query.get('token') or [''])[0]
+        if not secrets.compare_digest(token.encode(), self.token.encode()):
+            raise HttpError(401, '令牌无效')
+
+    async def _respond(self, writer, status, payload, origin):
+        body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = [
+            f'HTTP/1.1 {status} {_STATUS_TEXT.get(status, "")}',
+            'Content-Type: application/json; charset=utf-8',
+            f'Content-Length: {len(body)}',
+            'Connection: close',
+            *self._cors_headers(origin),
+        ]
+        try:
+            writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    @staticmethod
+    def _cors_headers(origin):
+        # 只对扩展页面开放跨域；普通网页即使拿到端口也读不到响应
+        if not origin or not origin.startswith(_EXTENSION_ORIGINS):
+            return []
+        return [
+            f'Access-Control-Allow-Origin: {origin}',
+            'Access-Control-Allow-Methods: GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers: Authorization, Content-Type',
+            'Access-Control-Max-Age: 600',
+            'Vary: Origin',
+        ]
+
+    # ─── Routes ───
+
+    async def _route(self, request):
+        loop = asyncio.get_running_loop()
+        method, path = request.method, request.path
+        if path == '/health':
+            return 200, {'success': True, 'app': 'weiruan-ytdl'}
+        if path == '/jobs':
+            if method == 'POST':
+                commands = self._parse_jobs(request.json())
+                jobs = await loop.run_in_executor(None, self._submit_all, commands)
+                return 201, {'success': True, 'jobs': jobs}
+            if method == 'GET':
+                return 200, {'success': True, 'jobs': ytdl_engine.get_progress()}
+            raise HttpError(405, '不支持的方法')
+        if path.startswith('/jobs/'):
+            job_id, _, action = urllib.parse.unquote(path[len('/jobs/'):]).partition('/')
+            if ytdl_engine.get_progress(job_id) is None:
+                raise HttpError(404, '任务不存在')
+            if not action and method == 'GET':
+                return 200, {'success': True, 'job': ytdl_engine.get_progress(job_id)}
+            if action in _JOB_ACTIONS and method == 'POST':
+                delete_files = (request.query.get('delete_files') or ['0'])[0] in ('1', 'true')
+                ok = _JOB_ACTIONS[action](job_id, delete_files)
+                return 200, {'success': ok, 'job': ytdl_engine.get_progress(job_id)}
+            raise HttpError(405 if not action else 404, '不支持的操作')
+        if path == '/info' and method == 'GET':
+            url = (request.query.get('url') or [''])[0]
+            if not url:
+                raise HttpError(400, '缺少 url')
+            data = await loop.run_in_executor(None, ytdl_engine.fetch_video_info, url)
+            return 200, {'success': True, 'data': data}
+        raise HttpError(404, '未知接口')
+
+    def _parse_jobs(self, payload):
+        if isinstance(payload, dict) and 'jobs' in payload:
+            payload = payload['jobs']
+        commands = payload if isinstance(payload, list) else [payload]
+        if not commands or len(commands) > _MAX_JOBS_PER_REQUEST:
+            raise HttpError(400, f'每次提交 1 到 {_MAX_JOBS_PER_REQUEST} 个任务')
+        parsed = []
+        for cmd in commands:
+            if not isinstance(cmd, dict):
+                raise HttpError(400, '任务必须是对象')
+            kind = cmd.get('kind', 'best')
+            allowed = _JOB_PARAMS.get(kind)
+            if allowed is None:
+                raise HttpError(400, f'未知任务类型: {kind}')
+            unknown = set(cmd) - set(allowed) - {'kind', 'priority', 'ref'}
+            if unknown:
+                raise HttpError(400, f'不支持的参数: {", ".join(sorted(unknown))}')
+            missing = [k for k in ('url',) + _REQUIRED_PARAMS.get(kind, ()) if cmd.get(k) in (None, '')]
+            if missing:
+                raise HttpError(400, f'缺少参数: {", ".join(missing)}')
+            parsed.append(cmd)
+        return parsed
+
+    def _submit_all(self, commands):
+        jobs = []
+        for cmd in commands:
+            params = {k: v for k, v in cmd.items() if k not in ('kind', 'ref')}
+            kind = cmd.get('kind', 'best')
+            try:
+                job_id = ytdl_engine.submit_job(kind, output_dir=self.output_dir, **params)
+            except (TypeError, ValueError) as e:
+                jobs.append({'error': str(e), 'ref': cmd.get('ref')})
+                continue
+            jobs.append({'id': job_id, 'kind': kind, 'url': cmd['url'], 'ref': cmd.get('ref')})
+        return jobs
+
+    # ─── Server-Sent Events ───
+
+    async def _stream_events(self, request, writer, origin):
+        if request.method != 'GET':
+            raise HttpError(405, '不支持的方法')
+        client = _EventClient(request.query.get('job', ()))
+        headers = [
+            'HTTP/1.1 200 OK',
+            'Content-Type: text/event-stream; charset=utf-8',
+            'Cache-Control: no-cache',
+            'Connection: keep-alive',
+            *self._cors_headers(origin),
+        ]
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+        # 先发送一次当前状态，之后只推送变化
+        client.offer(ytdl_engine.get_progress())
+        self._clients.add(client)
+        try:
+            while True:
+                if client.pending:
+                    data = json.dumps(client.take(), ensure_ascii=False)
+                    writer.write(f'event: progress\ndata: {data}\n\n'.encode('utf-8'))
+                else:
+                    writer.write(b': keep-alive\n\n')
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(client.ready.wait(), _HEARTBEAT)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._clients.discard(client)
+
+
+# ═══════════════════════════════════════
+#  Entry
+# ═══════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='威软YouTube下载引擎 - 本地 HTTP 接口')
+    parser.add_argument('--port', type=int, help=f'监听端口（默认读取配置，首次为 {DEFAULT_PORT}）')
+    parser.add_argument('-o', '--output-dir', default=os.path.join(os.path.expanduser('~'), 'Downloads'),
+                        help='下载目录')
+    parser.add_argument('--journal', action='store_true', help='启用任务日志并恢复上次未完成的任务')
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    server = LocalServer(args.output_dir, port=args.port or config['port'], token=config['token'])
+    if args.journal:
+        ytdl_engine.enable_journal()
+        ytdl_engine.resume_jobs()
+    ytdl_engine.set_event_sink(server.publish)
+    server.start()
+    print(f'本地接口已启动: http://{server.host}:{server.port}  令牌: {server.token}', file=sys.stderr)
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
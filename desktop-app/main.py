@@ -8,9 +8,10 @@
 import os
 import sys
 import json
+import itertools
+import importlib
 import threading
 import webview
-import ytdl_engine
 
 # ─── Paths ───
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,6 +19,41 @@ UI_DIR = os.path.join(BASE_DIR, 'ui')
 
 BRAND = '威软YouTube视频下载工具'
 VERSION = '1.0.0'
+PROGRESS_RATE = 10      # 进度推送到界面的最大频率（次/秒）
+
+
+# ─── Engine (lazy) ───
+# 导入 yt-dlp 及其提取器注册表需要数百毫秒；窗口先显示，引擎在后台线程中导入并预热
+
+class _LazyModule:
+    """首次访问属性时才导入的模块代理；后台导入进行中时访问会等待导入完成（导入锁）"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._name] = module      # 之后直接访问真实模块
+        return getattr(module, attr)
+
+
+ytdl_engine = _LazyModule('ytdl_engine')
+
+
+def _warm_up_engine(api):
+    """后台线程：导入引擎、接入进度推送、恢复未完成任务，并预加载 YouTube 提取器"""
+    api.attach_engine()
+    # 恢复上次未完成的下载任务（从 .part 文件续传）
+    ytdl_engine.enable_journal()
+    resumed = ytdl_engine.resume_jobs()
+    if resumed:
+        print(f'[恢复任务] {len(resumed)} 个未完成的下载已重新排队')
+    if '--serve' in sys.argv:
+        api.start_local_server()
+    try:
+        ytdl_engine.warmup()
+    except Exception as e:
+        print(f'[预热失败] {e}')
 
 
 class Api:
@@ -30,11 +66,25 @@ class Api:
         self._window = None
         self._current_url = ''
         self._video_info = None
+        self._playlist_iter = None
+        self._playlist_lock = threading.Lock()
         self._download_dir = os.path.join(os.path.expanduser('~'), 'Downloads')
+        self._server = None
 
     def set_window(self, window):
         self._window = window
 
+    def attach_engine(self):
+        ytdl_engine.set_event_sink(self._push_progress, PROGRESS_RATE)
+
+    def _push_progress(self, batch):
+        """将变化的任务进度批量推送到页面 (window.onProgressEvents)，并转发给本地接口的 SSE 连接"""
+        if self._server is not None:
+            self._server.publish(batch)
+        if self._window:
+            payload = json.dumps(batch, ensure_ascii=False)
+            self._window.evaluate_js(f'window.onProgressEvents && window.onProgressEvents({payload})')
+
     # ─── Video Info ───
 
     def fetch_info(self, url):
@@ -47,57 +97,152 @@ class Api:
         except Exception as e:
             return json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
 
+    def estimate_sizes(self, probe=False):
+        """预测当前视频各格式、组合与预设的下载大小"""
+        try:
+            data = ytdl_engine.estimate_sizes(self._current_url, probe=bool(probe))
+            return json.dumps({'success': True, 'data': data}, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+
+    def get_cache_stats(self):
+        """获取视频信息缓存的命中统计"""
+        return json.dumps(ytdl_engine.cache_stats(), ensure_ascii=False)
+
+    # ─── Playlist / Channel ───
+
+    def fetch_playlist(self, url, count=50):
+        """获取播放列表 / 频道信息与第一页条目"""
+        try:
+            with self._playlist_lock:
+                if self._playlist_iter is not None:
+                    self._playlist_iter.close()
+                self._playlist_iter = ytdl_engine.fetch_playlist_info(url.strip())
+                meta = next(self._playlist_iter)
+                entries = list(itertools.islice(self._playlist_iter, int(count)))
+            data = dict(meta, entries=entries, has_more=len(entries) == int(count))
+            return json.dumps({'success': True, 'data': data}, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+
+    def fetch_playlist_more(self, count=50):
+        """获取播放列表的下一页条目"""
+        try:
+            with self._playlist_lock:
+                if self._playlist_iter is None:
+                    return json.dumps({'success': True, 'data': {'entries': [], 'has_more': False}})
+                entries = list(itertools.islice(self._playlist_iter, int(count)))
+            data = {'entries': entries, 'has_more': len(entries) == int(count)}
+            return json.dumps({'success': True, 'data': data}, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+
     # ─── Downloads ───
 
     def download_format(self, format_id, fmt_type):
-        """下载指定格式 (在后台线程执行)"""
-        def _do():
-            try:
-                url = self._current_url
-                out = self._download_dir
-                if fmt_type == 'audio':
-                    ytdl_engine.download_audio(url, format_id, out)
-                elif fmt_type == 'combined':
-                    ytdl_engine.download_video(url, format_id, out, merge_audio=False)
-                else:
-                    ytdl_engine.download_video(url, format_id, out, merge_audio=True)
-            except Exception as e:
-                print(f'[下载错误] {e}')
-
-        threading.Thread(target=_do, daemon=True).start()
-        return json.dumps({'success': True})
+        """下载指定格式 (加入下载队列)"""
+        url = self._current_url
+        out = self._download_dir
+        if fmt_type == 'audio':
+            job_id = ytdl_engine.submit_job('audio', url=url, format_id=format_id, output_dir=out)
+        elif fmt_type == 'combined':
+            job_id = ytdl_engine.submit_job('video', url=url, format_id=format_id, output_dir=out,
+                                            merge_audio=False)
+        else:
+            job_id = ytdl_engine.submit_job('video', url=url, format_id=format_id, output_dir=out,
+                                            merge_audio=True)
+        return json.dumps({'success': True, 'job_id': job_id})
 
     def download_preset(self, max_height):
         """按预设质量下载"""
-        def _do():
-            try:
-                h = int(max_height) if max_height else None
-                ytdl_engine.download_best(self._current_url, self._download_dir, h)
-            except Exception as e:
-                print(f'[下载错误] {e}')
-
-        threading.Thread(target=_do, daemon=True).start()
-        return json.dumps({'success': True})
+        h = int(max_height) if max_height else None
+        job_id = ytdl_engine.submit_job('best', url=self._current_url, output_dir=self._download_dir,
+                                        max_height=h)
+        return json.dumps({'success': True, 'job_id': job_id})
 
     def download_subtitle(self, lang, fmt, is_auto):
         """下载字幕"""
-        def _do():
-            try:
-                ytdl_engine.download_subtitle(
-                    self._current_url, lang, fmt,
-                    self._download_dir, is_auto
-                )
-            except Exception as e:
-                print(f'[字幕下载错误] {e}')
-
-        threading.Thread(target=_do, daemon=True).start()
+        job_id = ytdl_engine.submit_job('subtitle', url=self._current_url, lang=lang, fmt=fmt,
+                                        output_dir=self._download_dir, is_auto=is_auto)
+        return json.dumps({'success': True, 'job_id': job_id})
+
+    def download_subtitles(self, langs=None, auto_langs=None, fmt='vtt'):
+        """批量下载多个语言的字幕（一次提取，作为一个任务）"""
+        job_id = ytdl_engine.submit_job('subtitles', url=self._current_url, output_dir=self._download_dir,
+                                        langs=langs, auto_langs=auto_langs or [], fmts=[fmt])
+        return json.dumps({'success': True, 'job_id': job_id})
+
+    def set_max_concurrent(self, n):
+        """设置同时下载的任务数"""
+        ytdl_engine.set_max_concurrent(n)
         return json.dumps({'success': True})
 
+    def set_bandwidth_limit(self, kb_per_sec=0):
+        """设置总下载速率上限（KB/s），0 为不限速"""
+        try:
+            ytdl_engine.set_bandwidth_limit(float(kb_per_sec or 0) * 1024)
+            return json.dumps({'success': True, **ytdl_engine.bandwidth_status()})
+        except (TypeError, ValueError) as e:
+            return json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+
+    def set_staging_dir(self, path=None, buffer_kb=None):
+        """设置暂存目录（快速本地磁盘，下载完成后移到下载目录）与读写块大小（KB）"""
+        try:
+            ytdl_engine.set_staging_dir(path or None)
+            ytdl_engine.set_buffer_size(int(buffer_kb) * 1024 if buffer_kb else None)
+            return json.dumps({'success': True})
+        except (TypeError, ValueError) as e:
+            return json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+
+    def set_job_priority(self, job_id, priority='normal'):
+        """调整任务的带宽优先级：low / normal / high"""
+        try:
+            ytdl_engine.set_job_priority(job_id, priority)
+            return json.dumps({'success': True})
+        except ValueError as e:
+            return json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+
+    def cancel_download(self, job_id, delete_files=False):
+        """取消任务；delete_files=True 时删除已下载的 .part 文件"""
+        ok = ytdl_engine.cancel_job(job_id, delete_files=bool(delete_files))
+        return json.dumps({'success': ok})
+
+    def pause_download(self, job_id):
+        """暂停任务：停止传输并释放连接，保留已下载的部分"""
+        return json.dumps({'success': ytdl_engine.pause_job(job_id)})
+
+    def resume_download(self, job_id):
+        """继续已暂停的任务，从已下载的部分续传"""
+        return json.dumps({'success': ytdl_engine.resume_job(job_id)})
+
     # ─── Progress ───
 
-    def get_progress(self):
-        """获取下载进度"""
-        return json.dumps(ytdl_engine.get_progress(), ensure_ascii=False)
+    def get_progress(self, job_id=None):
+        """获取下载进度 — 指定 job_id 返回单个任务，否则返回全部任务"""
+        return json.dumps(ytdl_engine.get_progress(job_id), ensure_ascii=False)
+
+    # ─── Local Server (browser extension) ───
+
+    def start_local_server(self):
+        """启动本地 HTTP 接口，浏览器扩展可把下载交给桌面端；返回端口与令牌"""
+        try:
+            if self._server is None:
+                import local_server
+                self._server = local_server.LocalServer(self._download_dir)
+            self._server.output_dir = self._download_dir
+            self._server.start()
+            return json.dumps({'success': True, **self._server.info()}, ensure_ascii=False)
+        except OSError as e:
+            return json.dumps({'success': False, 'error': f'本地接口启动失败: {e}'}, ensure_ascii=False)
+
+    def stop_local_server(self):
+        if self._server is not None:
+            self._server.stop()
+        return json.dumps({'success': True})
+
+    def get_local_server(self):
+        info = self._server.info() if self._server is not None else {'running': False}
+        return json.dumps(info, ensure_ascii=False)
 
     # ─── Directory ───
 
@@ -110,6 +255,8 @@ class Api:
             )
             if result and len(result) > 0:
                 self._download_dir = result[0]
+                if self._server is not None:
+                    self._server.output_dir = self._download_dir
                 return json.dumps({'success': True, 'path': self._download_dir}, ensure_ascii=False)
         return json.dumps({'success': False}, ensure_ascii=False)
 
@@ -141,6 +288,7 @@ def main():
     )
 
     api.set_window(window)
+    threading.Thread(target=_warm_up_engine, args=(api,), daemon=True).start()
 
     webview.start(
         debug=('--debug' in sys.argv),
@@ -0,0 +1,388 @@
+"""
+威软YouTube视频下载工具 - 字幕处理
+纯 Python 的流式字幕管线：解析 VTT / SRT / SRV1-3 / JSON3，格式互转、
+自动字幕滚动重复行去重、双语合并。所有环节都是逐条字幕的生成器，
+内存占用与字幕总长度无关（10 小时直播的自动字幕也只保留当前几条）。
+"""
+
+import re
+import html
+import json
+import codecs
+import collections
+import xml.etree.ElementTree as ET
+
+# 可解析 / 可写出的格式（按转换时优先选用的源格式排序）
+SOURCE_FORMATS = ('vtt', 'srv3', 'json3', 'srv2', 'srv1', 'srt')
+TARGET_FORMATS = ('srt', 'vtt', 'json3', 'srv3')
+
+_CHUNK = 64 << 10
+_MAX_JSON3_EVENT = 1 << 20     # JSON3 单个事件的最大长度（正常事件只有几百字节）
+_TIMING_RE = re.compile(
+    r'((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})'
+)
+_INLINE_TAG_RE = re.compile(r'<\d{2}:\d{2}[^>]*>|</?c(?:\.[^>]*)?>')
+
+
+class Cue:
+    """一条字幕：起止时间（毫秒）与文本（多行以 \\n 分隔）"""
+
+    __slots__ = ('start', 'end', 'text')
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f'<Cue {self.start}-{self.end} {self.text!r}>'
+
+
+# ═══════════════════════════════════════
+#  Parsers
+# ═══════════════════════════════════════
+
+def parse(fp, fmt):
+    """从二进制文件对象（文件或 HTTP 响应）逐条解析字幕"""
+    try:
+        parser = _PARSERS[fmt]
+    except KeyError:
+        raise ValueError(f'不支持的字幕格式: {fmt}')
+    return parser(fp)
+
+
+def parse_vtt(fp):
+    return _parse_timed_blocks(_iter_lines(fp))
+
+
+def parse_srt(fp):
+    return _parse_timed_blocks(_iter_lines(fp))
+
+
+def _parse_timed_blocks(lines):
+    # VTT 与 SRT 的结构相同：时间行之后到空行为止是文本，序号 / 头部 / NOTE 块都不含时间行
+    start = end = None
+    text = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if start is None:
+            m = _TIMING_RE.search(line)
+            if m:
+                start, end = _parse_timestamp(m.group(1)), _parse_timestamp(m.group(2))
+            continue
+        if line:
+            # YouTube 自动字幕用只含空格的行占位，只有真正的空行才结束一条字幕
+            if line.strip():
+                text.append(line)
+            continue
+        yield Cue(start, end, _clean_text(text))
+        start = None
+        text = []
+    if start is not None:
+        yield Cue(start, end, _clean_text(text))
+
+
+def parse_srv(fp):
+    """SRV1（<text start dur> 秒）、SRV2（<text t d> 毫秒）、SRV3（<p t d> 毫秒）"""
+    stack = []
+    for event, elem in ET.iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag not in ('p', 'text'):
+            continue
+        if 't' in elem.attrib:
+            start = int(elem.get('t'))
+            end = start + int(elem.get('d') or 0)
+        else:
+            start = round(float(elem.get('start') or 0) * 1000)
+            end = start + round(float(elem.get('dur') or 0) * 1000)
+        text = ''.join(elem.itertext()).strip()
+        if elem.tag == 'text':
+            text = html.unescape(text)      # SRV1 的文本经过二次转义
+        # 从父节点移除已处理的条目，保持内存有界
+        if stack:
+            stack[-1].remove(elem)
+        if text:
+            yield Cue(start, end, text)
+
+
+def parse_json3(fp):
+    """
+    流式解析 JSON3：只逐个解码 events 数组中的元素，不载入整个文档。
+    扫描位置只向前移动，已扫描的内容随即丢弃；单个事件超过 _MAX_JSON3_EVENT 时视为格式错误
+    """
+    decoder = json.JSONDecoder()
+    chunks = _iter_text(fp)
+    key = '"events"'
+
+    # 定位 "events"：只保留可能跨块的尾部
+    buf = ''
+    while True:
+        pos = buf.find(key)
+        if pos >= 0:
+            pos += len(key)
+            break
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buf = buf[-(len(key) - 1):] + chunk
+
+    # "events" 之后只能是冒号与空白，然后是数组
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n:':
+            pos += 1
+        if pos < len(buf):
+            break
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buf, pos = chunk, 0
+    if buf[pos] != '[':
+        raise ValueError('JSON3 字幕格式错误: events 不是数组')
+    pos += 1
+
+    eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            event, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            if len(buf) - pos > _MAX_JSON3_EVENT:
+                raise ValueError('JSON3 字幕格式错误: 事件过大或文档已损坏') from None
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                buf = buf[pos:] + chunk
+                pos = 0
+            continue
+        pos = end
+        if pos > _CHUNK:
+            buf, pos = buf[pos:], 0
+        cue = _json3_cue(event)
+        if cue is not None:
+            yield cue
+
+
+def _json3_cue(event):
+    segs = event.get('segs')
+    if not segs:
+        return None
+    text = ''.join(s.get('utf8', '') for s in segs).strip()
+    if not text:
+        return None
+    start = event.get('tStartMs', 0)
+    return Cue(start, start + event.get('dDurationMs', 0), text)
+
+
+_PARSERS = {
+    'vtt': parse_vtt,
+    'srt': parse_srt,
+    'srv1': parse_srv,
+    'srv2': parse_srv,
+    'srv3': parse_srv,
+    'json3': parse_json3,
+}
+
+
+# ─── Text helpers ───
+
+def _iter_text(fp):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    while True:
+        data = fp.read(_CHUNK)
+        if not data:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(data)
+
+
+def _iter_lines(fp):
+    pending = ''
+    for chunk in _iter_text(fp):
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _parse_timestamp(value):
+    parts = value.replace(',', '.').split(':')
+    seconds = float(parts[-1])
+    minutes = int(parts[-2])
+    hours = int(parts[-3]) if len(parts) > 2 else 0
+    return round(((hours * 60 + minutes) * 60 + seconds) * 1000)
+
+
+def _clean_text(lines):
+    text = '\n'.join(_INLINE_TAG_RE.sub('', line) for line in lines)
+    return html.unescape(text) if '&' in text else text
+
+
+# ═══════════════════════════════════════
+#  Filters
+# ═══════════════════════════════════════
+
+def dedupe_rolling(cues):
+    """
+    去除自动字幕的滚动重复：YouTube 自动字幕的每条 cue 会重复上一条的最后一行，
+    并在换行时插入约 10ms 的过渡 cue。只保留每条中新出现的行，相同文本的相邻条目合并，
+    并把结束时间截到下一条的开始（滚动字幕的时间段互相重叠）。
+    """
+    prev_lines = ()
+    pending = None
+    for cue in cues:
+        lines = [line.strip() for line in cue.text.split('\n') if line.strip()]
+        new = lines
+        while new and new[0] in prev_lines:
+            new = new[1:]
+        if lines:
+            prev_lines = lines
+        if not new:
+            continue
+        text = '\n'.join(new)
+        if pending is not None:
+            if pending.text == text:
+                pending.end = max(pending.end, cue.end)
+                continue
+            if pending.end > cue.start:
+                pending.end = max(pending.start, cue.start)
+            yield pending
+        pending = Cue(cue.start, cue.end, text)
+    if pending is not None:
+        yield pending
+
+
+def merge_bilingual(primary, secondary, separator='\n'):
+    """
+    合并两种语言为双语字幕：以 primary 的时间轴为准，
+    中点落在 primary 条目时间段内的 secondary 条目附加在其下方；
+    落在空隙中的 secondary 条目单独输出。两路输入都只向前读取，内存只保存重叠的几条。
+    """
+    secondary = iter(secondary)
+    waiting = collections.deque()       # 尚未分配的 secondary 条目（按开始时间排序）
+    exhausted = False
+    for cue in primary:
+        while not exhausted and (not waiting or _midpoint(waiting[-1]) < cue.end):
+            nxt = next(secondary, None)
+            if nxt is None:
+                exhausted = True
+            else:
+                waiting.append(nxt)
+        extra = []
+        while waiting and _midpoint(waiting[0]) < cue.end:
+            other = waiting.popleft()
+            if _midpoint(other) >= cue.start:
+                extra.append(other.text)
+            else:
+                yield other
+        yield Cue(cue.start, cue.end, separator.join([cue.text] + extra) if extra else cue.text)
+    yield from waiting
+    if not exhausted:
+        yield from secondary
+
+
+def _midpoint(cue):
+    return (cue.start + cue.end) // 2
+
+
+# ═══════════════════════════════════════
+#  Writers
+# ═══════════════════════════════════════
+
+def write(cues, fp, fmt):
+    """将字幕逐条写入文本文件对象，返回写出的条数"""
+    try:
+        writer = _WRITERS[fmt]
+    except KeyError:
+        raise ValueError(f'不支持的字幕格式: {fmt}')
+    return writer(cues, fp)
+
+
+def write_srt(cues, fp):
+    n = 0
+    for n, cue in enumerate(cues, 1):
+        fp.write(f'{n}\n{_format_timestamp(cue.start, ",")} --> {_format_timestamp(cue.end, ",")}\n'
+                 f'{cue.text}\n\n')
+    return n
+
+
+def write_vtt(cues, fp):
+    fp.write('WEBVTT\n\n')
+    n = 0
+    for n, cue in enumerate(cues, 1):
+        fp.write(f'{_format_timestamp(cue.start, ".")} --> {_format_timestamp(cue.end, ".")}\n'
+                 f'{cue.text}\n\n')
+    return n
+
+
+def write_json3(cues, fp):
+    fp.write('{"wireMagic":"pb3","events":[')
+    n = 0
+    for n, cue in enumerate(cues, 1):
+        event = {'tStartMs': cue.start, 'dDurationMs': cue.end - cue.start, 'segs': [{'utf8': cue.text}]}
+        fp.write(('\n' if n == 1 else ',\n') + json.dumps(event, ensure_ascii=False))
+    fp.write('\n]}\n')
+    return n
+
+
+def write_srv3(cues, fp):
+    fp.write('<?xml version="1.0" encoding="utf-8" ?>\n<timedtext format="3">\n<body>\n')
+    n = 0
+    for n, cue in enumerate(cues, 1):
+        fp.write(f'<p t="{cue.start}" d="{cue.end - cue.start}">{html.escape(cue.text, quote=False)}</p>\n')
+    fp.write('</body>\n</timedtext>\n')
+    return n
+
+
+_WRITERS = {
+    'srt': write_srt,
+    'vtt': write_vtt,
+    'json3': write_json3,
+    'srv3': write_srv3,
+}
+
+
+def _format_timestamp(ms, sep):
+    seconds, ms = divmod(max(0, int(ms)), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}{sep}{ms:03d}'
+
+
+# ═══════════════════════════════════════
+#  File helpers
+# ═══════════════════════════════════════
+
+def convert(src, dst, src_fmt=None, dst_fmt=None, dedupe=False):
+    """转换字幕文件格式（格式默认取扩展名），dedupe=True 时去除自动字幕的滚动重复"""
+    src_fmt = src_fmt or _ext(src)
+    dst_fmt = dst_fmt or _ext(dst)
+    with open(src, 'rb') as fin, open(dst, 'w', encoding='utf-8', newline='\n') as fout:
+        cues = parse(fin, src_fmt)
+        return write(dedupe_rolling(cues) if dedupe else cues, fout, dst_fmt)
+
+
+def merge_files(primary, secondary, dst, dst_fmt=None, dedupe=False):
+    """将两个字幕文件合并为双语字幕"""
+    with open(primary, 'rb') as fa, open(secondary, 'rb') as fb, \
+            open(dst, 'w', encoding='utf-8', newline='\n') as fout:
+        a = parse(fa, _ext(primary))
+        b = parse(fb, _ext(secondary))
+        if dedupe:
+            a, b = dedupe_rolling(a), dedupe_rolling(b)
+        return write(merge_bilingual(a, b), fout, dst_fmt or _ext(dst))
+
+
+def _ext(path):
+    return path.rsplit('.', 1)[-1].lower()
@@ -8,7 +8,8 @@
 
   // ─── State ───
   let videoData = null;
-  let progressTimer = null;
+  let trackedJobId = null;
+  let trackedStatus = null;
 
   // ─── DOM References ───
   const $urlInput    = document.getElementById('url-input');
@@ -30,9 +31,18 @@
   const $progressFill = document.getElementById('progress-fill');
   const $progressText = document.getElementById('progress-text');
   const $progressSpeed = document.getElementById('progress-speed');
+  const $pauseBtn    = document.getElementById('pause-btn');
+  const $cancelBtn   = document.getElementById('cancel-btn');
   const $dirBtn      = document.getElementById('dir-btn');
   const $dirPath     = document.getElementById('dir-path');
+  const $extBtn      = document.getElementById('ext-btn');
+  const $extStatus   = document.getElementById('ext-status');
   const $versionBadge = document.getElementById('version-badge');
+  const $playlist    = document.getElementById('playlist');
+  const $playlistTitle = document.getElementById('playlist-title');
+  const $playlistCount = document.getElementById('playlist-count');
+  const $playlistList = document.getElementById('playlist-list');
+  const $playlistMore = document.getElementById('playlist-more');
 
   // ─── Wait for pywebview API ───
   function waitForApi() {
@@ -60,6 +70,9 @@
       console.error('Failed to load app info:', e);
     }
 
+    // 以 --serve 启动时本地接口已在运行
+    api.get_local_server().then(s => renderLocalServer(JSON.parse(s))).catch(() => {});
+
     // ─── Event Listeners ───
     $fetchBtn.addEventListener('click', () => fetchInfo());
 
@@ -101,6 +114,16 @@
       }
     });
 
+    // Pause / resume / cancel the tracked download
+    $pauseBtn.addEventListener('click', () => togglePause());
+    $cancelBtn.addEventListener('click', () => cancelDownload());
+
+    // Browser extension handoff (local HTTP server)
+    $extBtn.addEventListener('click', () => toggleLocalServer());
+
+    // Playlist paging
+    $playlistMore.addEventListener('click', () => loadMorePlaylist());
+
     // Preset buttons
     document.querySelectorAll('.preset-btn').forEach(btn => {
       btn.addEventListener('click', () => downloadPreset(btn.dataset.height));
@@ -112,11 +135,17 @@
     const url = $urlInput.value.trim();
     if (!url) return;
 
+    if (isPlaylistUrl(url)) {
+      fetchPlaylist(url);
+      return;
+    }
+
     const api = window.pywebview.api;
 
     // UI: show loading
     $loading.classList.remove('hidden');
     $errorMsg.classList.add('hidden');
+    $playlist.classList.add('hidden');
     $videoInfo.classList.add('hidden');
     $tabBar.classList.add('hidden');
     $panels.classList.add('hidden');
@@ -135,6 +164,7 @@
       renderVideoInfo(videoData);
       renderFormats(videoData.formats || []);
       renderSubtitles(videoData.subtitles || {});
+      loadSizeEstimates();
 
       // Show UI sections
       $videoInfo.classList.remove('hidden');
@@ -154,6 +184,117 @@
     }
   }
 
+  // Predicted download size on each preset button
+  async function loadSizeEstimates() {
+    const api = window.pywebview.api;
+    document.querySelectorAll('.preset-size').forEach(el => el.remove());
+    try {
+      const result = JSON.parse(await api.estimate_sizes());
+      if (!result.success) return;
+      const presets = result.data.presets || {};
+      document.querySelectorAll('.preset-btn').forEach(btn => {
+        const preset = presets[btn.dataset.height || 'best'];
+        if (!preset || !preset.size) return;
+        const span = document.createElement('span');
+        span.className = 'preset-size';
+        span.textContent = (preset.exact ? '' : '≈') + formatBytes(preset.size);
+        btn.appendChild(span);
+      });
+    } catch (e) {
+      console.error('Size estimate error:', e);
+    }
+  }
+
+  function formatBytes(size) {
+    const units = ['B', 'KB', 'MB', 'GB'];
+    let i = 0;
+    while (size >= 1024 && i < units.length - 1) {
+      size /= 1024;
+      i++;
+    }
+    return `${size.toFixed(1)} ${units[i]}`;
+  }
+
+  // ─── Playlist / Channel ───
+  async function fetchPlaylist(url) {
+    const api = window.pywebview.api;
+
+    $loading.classList.remove('hidden');
+    $errorMsg.classList.add('hidden');
+    $videoInfo.classList.add('hidden');
+    $tabBar.classList.add('hidden');
+    $panels.classList.add('hidden');
+    $playlist.classList.add('hidden');
+    $fetchBtn.disabled = true;
+
+    try {
+      const result = JSON.parse(await api.fetch_playlist(url));
+      if (!result.success) {
+        showError(result.error || '解析失败，请检查链接是否正确');
+        return;
+      }
+
+      const data = result.data;
+      $playlistTitle.textContent = data.title || '';
+      $playlistCount.textContent = data.count ? `${data.count} 个视频` : '';
+      $playlistList.innerHTML = '';
+      appendPlaylistEntries(data.entries || []);
+      $playlistMore.classList.toggle('hidden', !data.has_more);
+      $playlist.classList.remove('hidden');
+      $playlist.classList.add('fade-in');
+    } catch (e) {
+      showError('解析失败: ' + e.message);
+    } finally {
+      $loading.classList.add('hidden');
+      $fetchBtn.disabled = false;
+    }
+  }
+
+  async function loadMorePlaylist() {
+    const api = window.pywebview.api;
+    $playlistMore.disabled = true;
+    try {
+      const result = JSON.parse(await api.fetch_playlist_more());
+      if (!result.success) {
+        showError(result.error || '加载失败');
+        return;
+      }
+      appendPlaylistEntries(result.data.entries || []);
+      $playlistMore.classList.toggle('hidden', !result.data.has_more);
+    } catch (e) {
+      showError('加载失败: ' + e.message);
+    } finally {
+      $playlistMore.disabled = false;
+    }
+  }
+
+  function appendPlaylistEntries(entries) {
+    for (const entry of entries) {
+      const div = document.createElement('div');
+      div.className = 'format-item';
+
+      const detail = ['#' + entry.index, entry.duration, entry.uploader].filter(Boolean).join(' · ');
+      div.innerHTML = `
+        <div class="format-info">
+          <div class="format-main"></div>
+          <div class="format-detail"></div>
+        </div>
+        <button class="dl-btn">解析</button>
+      `;
+      // 标题、时长、上传者都来自远端列表，只能以文本写入
+      div.querySelector('.format-main').textContent = entry.title;
+      div.querySelector('.format-detail').textContent = detail;
+
+      div.querySelector('.dl-btn').addEventListener('click', () => {
+        $urlInput.value = entry.url;
+        $playlist.classList.add('hidden');
+        fetchInfo();
+      });
+
+      $playlistList.appendChild(div);
+    }
+  }
+
   // ─── Render Video Info ───
   function renderVideoInfo(data) {
     $videoTitle.textContent = data.title || '未知标题';
@@ -273,7 +414,30 @@
 
     $noSubtitles.classList.add('hidden');
 
-    for (const [lang, info] of entries) {
+    // Batch: every listed track in one job
+    const all = document.createElement('div');
+    all.className = 'sub-item sub-all';
+    all.innerHTML = `
+      <div class="sub-info">全部字幕 (${entries.length})</div>
+      <div class="sub-actions">
+        <button class="sub-dl-btn" data-fmt="srt">SRT</button>
+        <button class="sub-dl-btn" data-fmt="vtt">VTT</button>
+      </div>
+    `;
+    all.querySelectorAll('.sub-dl-btn').forEach(btn => {
+      btn.addEventListener('click', () => {
+        const tracks = entries.map(([key, info]) => info);
+        downloadSubtitles(
+          tracks.filter(t => !t.is_auto).map(t => t.lang),
+          tracks.filter(t => t.is_auto).map(t => t.lang),
+          btn.dataset.fmt
+        );
+      });
+    });
+    $subtitleList.appendChild(all);
+
+    for (const [key, info] of entries) {
+      const lang = info.lang || key;
       const div = document.createElement('div');
       div.className = 'sub-item';
 
@@ -303,7 +467,7 @@
     try {
       const result = JSON.parse(await api.download_format(formatId, fmtType));
       if (result.success) {
-        startProgressPolling();
+        trackJob(result.job_id);
       }
     } catch (e) {
       showError('下载启动失败: ' + e.message);
@@ -315,7 +479,7 @@
     try {
       const result = JSON.parse(await api.download_preset(maxHeight));
       if (result.success) {
-        startProgressPolling();
+        trackJob(result.job_id);
       }
     } catch (e) {
       showError('下载启动失败: ' + e.message);
@@ -331,57 +495,154 @@
     }
   }
 
-  // ─── Progress Polling ───
-  function startProgressPolling() {
+  async function downloadSubtitles(langs, autoLangs, fmt) {
+    const api = window.pywebview.api;
+    try {
+      const result = JSON.parse(await api.download_subtitles(langs, autoLangs, fmt));
+      if (result.success) {
+        trackJob(result.job_id);
+      }
+    } catch (e) {
+      showError('字幕下载失败: ' + e.message);
+    }
+  }
+
+  // ─── Progress Events ───
+  // Python 端将变化的任务批量推送到 window.onProgressEvents，无需轮询
+  window.onProgressEvents = function (batch) {
+    for (const prog of batch) {
+      if (prog.id === trackedJobId) renderProgress(prog);
+    }
+  };
+
+  async function trackJob(jobId) {
+    trackedJobId = jobId;
+    trackedStatus = 'queued';
+    setProgressActions(true);
     $progressBar.classList.remove('hidden');
     $progressFill.style.width = '0%';
     $progressText.textContent = '准备中...';
     $progressSpeed.textContent = '';
 
-    if (progressTimer) clearInterval(progressTimer);
+    // 事件可能先于 job id 返回到达，主动获取一次当前状态
+    try {
+      const prog = JSON.parse(await window.pywebview.api.get_progress(jobId));
+      if (prog && prog.id === trackedJobId) renderProgress(prog);
+    } catch (e) {
+      // Ignore, events will follow
+    }
+  }
 
-    progressTimer = setInterval(async () => {
-      try {
-        const api = window.pywebview.api;
-        const prog = JSON.parse(await api.get_progress());
+  function renderProgress(prog) {
+    trackedStatus = prog.status;
+    $pauseBtn.textContent = prog.status === 'paused' ? '继续' : '暂停';
+    if (prog.status === 'queued') {
+      // Not started yet
+      $progressText.textContent = '排队中...';
+    } else if (prog.status === 'downloading') {
+      const pct = prog.percent || 0;
+      $progressFill.style.width = pct.toFixed(1) + '%';
+      $progressText.textContent = `下载中 ${pct.toFixed(1)}%`;
+      $progressSpeed.textContent = prog.speed || '';
+    } else if (prog.status === 'paused') {
+      $progressText.textContent = `已暂停 ${(prog.percent || 0).toFixed(1)}%`;
+      $progressSpeed.textContent = '';
+    } else if (prog.status === 'merging') {
+      $progressFill.style.width = '100%';
+      $progressText.textContent = '合并中...';
+      $progressSpeed.textContent = '';
+      setProgressActions(false);
+    } else if (prog.status === 'done') {
+      $progressFill.style.width = '100%';
+      $progressText.textContent = '下载完成!';
+      $progressSpeed.textContent = '';
+      setProgressActions(false);
+      trackedJobId = null;
+      // Hide progress bar after a delay
+      setTimeout(() => {
+        if (!trackedJobId) $progressBar.classList.add('hidden');
+      }, 3000);
+    } else if (prog.status === 'error') {
+      $progressText.textContent = '下载出错: ' + (prog.error || '');
+      $progressSpeed.textContent = '';
+      setProgressActions(false);
+      trackedJobId = null;
+    } else if (prog.status === 'cancelled') {
+      $progressText.textContent = '已取消';
+      $progressSpeed.textContent = '';
+      setProgressActions(false);
+      trackedJobId = null;
+      setTimeout(() => {
+        if (!trackedJobId) $progressBar.classList.add('hidden');
+      }, 2000);
+    }
+  }
 
-        if (prog.status === 'idle') {
-          // Not started yet
-          return;
-        }
+  function setProgressActions(visible) {
+    $pauseBtn.classList.toggle('hidden', !visible);
+    $cancelBtn.classList.toggle('hidden', !visible);
+  }
 
-        if (prog.status === 'downloading') {
-          const pct = prog.percent || 0;
-          $progressFill.style.width = pct.toFixed(1) + '%';
-          $progressText.textContent = `下载中 ${pct.toFixed(1)}%`;
-          $progressSpeed.textContent = prog.speed || '';
-        } else if (prog.status === 'merging') {
-          $progressFill.style.width = '100%';
-          $progressText.textContent = '合并中...';
-          $progressSpeed.textContent = '';
-        } else if (prog.status === 'done') {
-          $progressFill.style.width = '100%';
-          $progressText.textContent = '下载完成!';
-          $progressSpeed.textContent = '';
-          clearInterval(progressTimer);
-          progressTimer = null;
-          // Hide progress bar after a delay
-          setTimeout(() => {
-            $progressBar.classList.add('hidden');
-          }, 3000);
-        } else if (prog.status === 'error') {
-          $progressText.textContent = '下载出错: ' + (prog.error || '');
-          $progressSpeed.textContent = '';
-          clearInterval(progressTimer);
-          progressTimer = null;
-        }
-      } catch (e) {
-        // Silently ignore polling errors
+  async function togglePause() {
+    if (!trackedJobId) return;
+    const api = window.pywebview.api;
+    try {
+      if (trackedStatus === 'paused') {
+        await api.resume_download(trackedJobId);
+      } else {
+        await api.pause_download(trackedJobId);
+        $progressText.textContent = '正在暂停...';
       }
-    }, 500);
+    } catch (e) {
+      console.error('Pause/resume error:', e);
+    }
+  }
+
+  async function cancelDownload() {
+    if (!trackedJobId) return;
+    try {
+      const result = JSON.parse(await window.pywebview.api.cancel_download(trackedJobId, true));
+      // 已进入合并阶段的任务无法取消，进度保持原样
+      if (result.success) $progressText.textContent = '正在取消...';
+    } catch (e) {
+      console.error('Cancel error:', e);
+    }
   }
 
   // ─── Helpers ───
+  // ─── Local Server ───
+  async function toggleLocalServer() {
+    const api = window.pywebview.api;
+    try {
+      const state = JSON.parse(await api.get_local_server());
+      if (state.running) {
+        await api.stop_local_server();
+        renderLocalServer({ running: false });
+        return;
+      }
+      const result = JSON.parse(await api.start_local_server());
+      if (!result.success) {
+        showError(result.error);
+        return;
+      }
+      renderLocalServer(result);
+      // 令牌复制到剪贴板，粘贴到浏览器扩展即可完成配对
+      if (navigator.clipboard) {
+        navigator.clipboard.writeText(result.token).catch(() => {});
+      }
+    } catch (e) {
+      console.error('Local server error:', e);
+    }
+  }
+
+  function renderLocalServer(state) {
+    $extBtn.classList.toggle('active', !!state.running);
+    $extStatus.textContent = state.running ? `扩展接入 :${state.port}` : '扩展接入';
+    $extBtn.title = state.running
+      ? `本地接口 http://127.0.0.1:${state.port}（令牌已复制：${state.token}）点击关闭`
+      : '开启本地接口，浏览器扩展可把下载交给桌面端';
+  }
+
   function showError(msg) {
     $errorMsg.textContent = msg;
     $errorMsg.classList.remove('hidden');
@@ -392,6 +653,12 @@
     return /(?:youtube\.com|youtu\.be)/i.test(url);
   }
 
+  function isPlaylistUrl(url) {
+    // watch?v=...&list=... 视为单个视频
+    if (/[?&]v=/.test(url)) return false;
+    return /[?&]list=|\/playlist\b|\/@|\/channel\/|\/c\/|\/user\//i.test(url);
+  }
+
   function shortenPath(p) {
     if (!p) return '';
     // Show last 2 segments
@@ -0,0 +1,181 @@
+"""
+威软YouTube视频下载工具 - asyncio 接口
+在事件循环中使用下载引擎：阻塞的 yt-dlp 调用放到受管理的线程池执行，
+下载任务由引擎的工作线程池运行，并返回可 await 的 JobHandle。
+取消正在 await 的协程（包括 asyncio.wait_for 超时）会取消任务本身：
+引擎在下载线程的进度回调中抛出 DownloadCancelled，传输在下一个数据块时停止。
+
+    info = await ytdl_async.fetch_info(url)
+    job = ytdl_async.submit('best', url=url, output_dir='.', max_height=1080)
+    snapshot = await asyncio.wait_for(job, timeout=600)
+
+    results = await asyncio.gather(
+        *(ytdl_async.download('best', url=u, output_dir='.', timeout=600) for u in urls),
+        return_exceptions=True)
+
+多个协程等待同一个任务时，只想停止等待而不取消任务可以使用 asyncio.shield(job)。
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+
+import ytdl_engine
+
+INFO_WORKERS = 8            # 同时进行的信息提取 / 大小探测数
+
+_executor = None
+_executor_lock = threading.Lock()
+_END = object()
+
+
+class JobError(Exception):
+    """任务以 error 状态结束；snapshot 为任务的最终进度记录"""
+
+    def __init__(self, snapshot):
+        super().__init__(snapshot.get('error') or '下载失败')
+        self.snapshot = snapshot
+
+
+class JobHandle:
+    """
+    已提交任务的句柄。await 得到最终进度记录（status 为 done）；
+    任务出错时抛出 JobError，任务被取消时抛出 asyncio.CancelledError。
+    """
+
+    def __init__(self, job_id, kind, loop):
+        self.id = job_id
+        self.kind = kind
+        self._loop = loop
+        self._future = loop.create_future()
+        self._future.add_done_callback(self._on_future_done)
+        ytdl_engine.add_job_callback(job_id, self._on_job_done)
+
+    def __await__(self):
+        return self._future.__await__()
+
+    def __repr__(self):
+        return f'<JobHandle {self.id} {self.kind} {self.status}>'
+
+    @property
+    def status(self):
+        snap = ytdl_engine.get_progress(self.id)
+        return snap['status'] if snap else 'unknown'
+
+    def progress(self):
+        """当前进度记录（与 ytdl_engine.get_progress 相同）"""
+        return ytdl_engine.get_progress(self.id)
+
+    def done(self):
+        return self._future.done()
+
+    def cancel(self, delete_files=False):
+        """取消任务；返回 False 表示任务已结束"""
+        return ytdl_engine.cancel_job(self.id, delete_files)
+
+    def pause(self):
+        """暂停任务（await 会一直等到任务继续并结束）"""
+        return ytdl_engine.pause_job(self.id)
+
+    def resume(self):
+        return ytdl_engine.resume_job(self.id)
+
+    async def wait(self, timeout=None):
+        """等待任务结束；超时后取消任务并抛出 asyncio.TimeoutError"""
+        return await asyncio.wait_for(self._future, timeout)
+
+    # ─── Bridging ───
+
+    def _on_job_done(self, snapshot):
+        # 在引擎的工作线程中调用
+        try:
+            self._loop.call_soon_threadsafe(self._resolve, snapshot)
+        except RuntimeError:
+            pass                # 事件循环已关闭
+
+    def _resolve(self, snapshot):
+        if self._future.done():
+            return
+        status = snapshot['status'] if snapshot else 'error'
+        if status == 'done':
+            self._future.set_result(snapshot)
+        elif status == 'error':
+            self._future.set_exception(JobError(snapshot or {}))
+        else:
+            self._future.cancel()
+
+    def _on_future_done(self, future):
+        # await 的协程被取消 / 超时：把取消传递给下载线程（任务已结束时无操作）
+        if future.cancelled():
+            ytdl_engine.cancel_job(self.id)
+
+
+# ═══════════════════════════════════════
+#  Jobs
+# ═══════════════════════════════════════
+
+def submit(kind, priority=None, **params):
+    """提交下载任务（参数与 ytdl_engine.submit_job 相同），返回 JobHandle；须在事件循环中调用"""
+    loop = asyncio.get_running_loop()
+    job_id = ytdl_engine.submit_job(kind, priority=priority, **params)
+    return JobHandle(job_id, kind, loop)
+
+
+async def download(kind, priority=None, timeout=None, **params):
+    """提交任务并等待完成，返回最终进度记录；超时后任务被取消并抛出 asyncio.TimeoutError"""
+    handle = submit(kind, priority=priority, **params)
+    return await handle.wait(timeout)
+
+
+# ═══════════════════════════════════════
+#  Blocking calls on the executor
+# ═══════════════════════════════════════
+
+async def run_blocking(func, *args, **kwargs):
+    """在受管理的线程池中执行阻塞的引擎调用"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def fetch_info(url, use_cache=True):
+    """获取视频信息（信息提取无法中途中止，取消只会丢弃结果）"""
+    return await run_blocking(ytdl_engine.fetch_video_info, url, use_cache)
+
+
+async def estimate_sizes(url, probe=False):
+    return await run_blocking(ytdl_engine.estimate_sizes, url, probe)
+
+
+async def format_table(url):
+    return await run_blocking(ytdl_engine.format_table, url)
+
+
+async def iter_playlist(url):
+    """逐条异步产出播放列表：第一项为列表元数据，之后为各条目（按需翻页）"""
+    entries = ytdl_engine.fetch_playlist_info(url)
+    try:
+        while True:
+            item = await run_blocking(next, entries, _END)
+            if item is _END:
+                return
+            yield item
+    finally:
+        entries.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(INFO_WORKERS, thread_name_prefix='ytdl-async')
+        return _executor
+
+
+def shutdown(wait=True):
+    """关闭信息提取线程池（下载任务由引擎管理，不受影响）"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
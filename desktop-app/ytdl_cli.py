@@ -0,0 +1,420 @@
+"""
+威软YouTube视频下载工具 - 命令行 / 守护进程入口
+无需 pywebview，直接调用 ytdl_engine 的同一套函数，适合在 Linux 下载服务器上运行。
+
+    python -m ytdl_engine info URL [--sizes [--probe]]
+    python -m ytdl_engine download URL FORMAT [-o DIR] [--audio | --no-merge]
+    python -m ytdl_engine preset URL [--max-height H]
+    python -m ytdl_engine subtitle URL --lang en [--auto-lang en] [--format srt] [--bilingual en:zh-Hans]
+    python -m ytdl_engine batch FILE|-
+    python -m ytdl_engine daemon [--listen HOST:PORT | --listen /path/to.sock] [--journal]
+
+标准输出为 JSON Lines：每行一个事件（info / submitted / progress / error …），
+进度事件即 get_progress() 的任务记录；其余日志输出到标准错误。
+batch 与 daemon 的输入也是 JSON Lines，每行一个命令：
+
+    {"op": "submit", "kind": "best", "url": "...", "max_height": 1080, "ref": "任意标识"}
+    {"op": "info", "url": "..."}
+    {"op": "progress"}            {"op": "limit", "bytes_per_sec": 0}
+    {"op": "concurrency", "n": 4} {"op": "priority", "id": "...", "priority": "high"}
+    {"op": "pause", "id": "..."}  {"op": "resume", "id": "..."}
+    {"op": "cancel", "id": "...", "delete_files": true}
+    {"op": "quit"}
+
+省略 op 时视为 submit，省略 kind 时按 best 预设下载；只有链接的行等同于 {"url": 链接}。
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+import ytdl_engine
+
+_TERMINAL = ('done', 'error', 'cancelled')
+_WAIT_POLL = 2              # 等待任务结束时轮询引擎的间隔（秒），防止漏掉推送后一直等待
+DEFAULT_EVENT_RATE = 4      # 命令行下进度事件的最大频率（次/秒）
+
+
+class JsonLines:
+    """线程安全的 JSON Lines 输出"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps(dict(event=event, **fields), ensure_ascii=False, default=str)
+        with self._lock:
+            try:
+                self._stream.write(line + '\n')
+                self._stream.flush()
+            except (OSError, ValueError):
+                pass
+
+
+class ProgressRouter:
+    """
+    引擎进度事件的接收器：把任务记录写到输出，并记录已结束的任务。
+    守护进程模式下可同时存在多个输出（stdin 会话与各个 socket 连接）。
+    """
+
+    def __init__(self):
+        self._outputs = []
+        self._cond = threading.Condition()
+        self._finished = {}
+
+    def add(self, out):
+        with self._cond:
+            self._outputs.append(out)
+
+    def remove(self, out):
+        with self._cond:
+            if out in self._outputs:
+                self._outputs.remove(out)
+
+    def __call__(self, batch):
+        with self._cond:
+            outputs = list(self._outputs)
+        for snap in batch:
+            for out in outputs:
+                out.emit('progress', **snap)
+        with self._cond:
+            for snap in batch:
+                if snap['status'] in _TERMINAL:
+                    self._finished[snap['id']] = snap['status']
+            self._cond.notify_all()
+
+    def wait(self, job_ids):
+        """
+        等待任务全部结束，返回失败的任务数。
+        最终记录可能没有推送到这里（推送前已被 JobManager 清理出历史、推送被丢弃），
+        因此定期直接查询引擎：查不到的任务视为已结束
+        """
+        while True:
+            with self._cond:
+                pending = [j for j in job_ids if j not in self._finished]
+                if not pending:
+                    return sum(self._finished[j] == 'error' for j in job_ids)
+                if self._cond.wait(_WAIT_POLL):
+                    continue
+            # 在锁外查询引擎，不与推送线程交叉持锁
+            for j in pending:
+                snap = ytdl_engine.get_progress(j)
+                status = 'unknown' if snap is None else snap['status']
+                if status == 'unknown' or status in _TERMINAL:
+                    with self._cond:
+                        self._finished.setdefault(j, status)
+
+
+# ═══════════════════════════════════════
+#  Commands
+# ═══════════════════════════════════════
+
+def cmd_info(args, out, router):
+    data = ytdl_engine.fetch_video_info(args.url, use_cache=not args.no_cache)
+    if args.sizes:
+        data['sizes'] = ytdl_engine.estimate_sizes(args.url, probe=args.probe)
+    out.emit('info', url=args.url, data=data)
+    return 0
+
+
+def cmd_download(args, out, router):
+    if args.audio:
+        params = {'kind': 'audio', 'url': args.url, 'format_id': args.format}
+    else:
+        params = {'kind': 'video', 'url': args.url, 'format_id': args.format, 'merge_audio': not args.no_merge}
+    return _run_jobs([params], args, out, router)
+
+
+def cmd_preset(args, out, router):
+    return _run_jobs([{'kind': 'best', 'url': args.url, 'max_height': args.max_height}], args, out, router)
+
+
+def cmd_subtitle(args, out, router):
+    params = {
+        'kind': 'subtitles',
+        'url': args.url,
+        'langs': None if args.all else (args.lang or []),
+        'auto_langs': args.auto_lang or [],
+        'fmts': args.format or ['srt'],
+        'bilingual': [pair.split(':', 1) for pair in args.bilingual or []],
+    }
+    return _run_jobs([params], args, out, router)
+
+
+def cmd_batch(args, out, router):
+    stream = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+    with stream:
+        commands = [cmd for cmd in map(_parse_command, stream) if cmd is not None]
+    jobs = []
+    for cmd in commands:
+        if cmd.get('op', 'submit') != 'submit':
+            out.emit('error', error=f'batch 只支持 submit 命令: {cmd.get("op")}', ref=cmd.get('ref'))
+            continue
+        jobs.append(cmd)
+    rc = _run_jobs(jobs, args, out, router)
+    return rc or int(len(jobs) < len(commands))
+
+
+def cmd_daemon(args, out, router):
+    if args.journal:
+        ytdl_engine.enable_journal()
+        for job_id in ytdl_engine.resume_jobs():
+            out.emit('resumed', id=job_id)
+
+    session = _Session(args, out, router)
+    if not args.listen:
+        # 标准输入结束后等待已提交的任务完成；quit 命令立即退出
+        router.add(out)
+        if session.serve(sys.stdin):
+            router.wait(session.job_ids)
+        return 0
+
+    server = _make_server(args.listen, args, router)
+    out.emit('listening', address=args.listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def _run_jobs(commands, args, out, router):
+    """提交一组任务，输出进度直到全部结束；有任务失败时返回 1"""
+    router.add(out)
+    job_ids = []
+    for cmd in commands:
+        try:
+            job_id = _submit(cmd, args)
+        except (TypeError, ValueError) as e:
+            out.emit('error', error=str(e), ref=cmd.get('ref'))
+            continue
+        out.emit('submitted', id=job_id, kind=cmd.get('kind', 'best'), url=cmd.get('url'), ref=cmd.get('ref'))
+        job_ids.append(job_id)
+    failed = router.wait(job_ids)
+    return 1 if failed or len(job_ids) < len(commands) else 0
+
+
+def _submit(cmd, args):
+    params = {k: v for k, v in cmd.items() if k not in ('op', 'kind', 'ref')}
+    kind = cmd.get('kind', 'best')
+    if not params.get('url'):
+        raise ValueError('缺少 url')
+    params.setdefault('output_dir', args.output_dir)
+    if kind in ('video', 'audio', 'best') and args.connections:
+        params.setdefault('connections', args.connections)
+    if kind in ('video', 'best') and args.stream_merge:
+        params.setdefault('stream_merge', True)
+    if args.priority and 'priority' not in params:
+        params['priority'] = args.priority
+    return ytdl_engine.submit_job(kind, **params)
+
+
+def _parse_command(line):
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if not line.startswith('{'):
+        return {'url': line}
+    return json.loads(line)
+
+
+# ─── Daemon ───
+
+class _Session:
+    """一个命令来源（stdin 或一个 socket 连接）：逐行读取命令，回复写到对应的输出"""
+
+    def __init__(self, args, out, router):
+        self.args = args
+        self.out = out
+        self.router = router
+        self.job_ids = []
+
+    def serve(self, stream):
+        """处理命令直到输入结束（返回 True）或收到 quit（返回 False）"""
+        for line in stream:
+            try:
+                cmd = _parse_command(line)
+            except ValueError as e:
+                self.out.emit('error', error=f'无效命令: {e}')
+                continue
+            if cmd is None:
+                continue
+            if not self.handle(cmd):
+                return False
+        return True
+
+    def handle(self, cmd):
+        op = cmd.get('op', 'submit')
+        ref = cmd.get('ref')
+        try:
+            if op == 'submit':
+                job_id = _submit(cmd, self.args)
+                self.job_ids.append(job_id)
+                self.out.emit('submitted', id=job_id, kind=cmd.get('kind', 'best'), url=cmd.get('url'), ref=ref)
+            elif op == 'info':
+                self.out.emit('info', url=cmd['url'], data=ytdl_engine.fetch_video_info(cmd['url']), ref=ref)
+            elif op == 'sizes':
+                data = ytdl_engine.estimate_sizes(cmd['url'], probe=bool(cmd.get('probe')))
+                self.out.emit('sizes', url=cmd['url'], data=data, ref=ref)
+            elif op == 'progress':
+                jobs = ytdl_engine.get_progress(cmd.get('id'))
+                for snap in (jobs if isinstance(jobs, list) else [jobs] if jobs else []):
+                    self.out.emit('progress', ref=ref, **snap)
+            elif op == 'limit':
+                ytdl_engine.set_bandwidth_limit(cmd.get('bytes_per_sec') or 0)
+                self.out.emit('ok', op=op, ref=ref, **ytdl_engine.bandwidth_status())
+            elif op == 'concurrency':
+                ytdl_engine.set_max_concurrent(cmd['n'])
+                self.out.emit('ok', op=op, ref=ref)
+            elif op == 'priority':
+                ytdl_engine.set_job_priority(cmd['id'], cmd['priority'])
+                self.out.emit('ok', op=op, ref=ref)
+            elif op in ('cancel', 'pause', 'resume'):
+                if op == 'cancel':
+                    ok = ytdl_engine.cancel_job(cmd['id'], bool(cmd.get('delete_files')))
+                else:
+                    ok = (ytdl_engine.pause_job if op == 'pause' else ytdl_engine.resume_job)(cmd['id'])
+                if ok:
+                    self.out.emit('ok', op=op, id=cmd['id'], ref=ref)
+                else:
+                    self.out.emit('error', error=f'任务不存在或状态不允许: {cmd["id"]}', op=op, ref=ref)
+            elif op == 'quit':
+                self.out.emit('bye', ref=ref)
+                return False
+            else:
+                self.out.emit('error', error=f'未知命令: {op}', ref=ref)
+        except Exception as e:
+            self.out.emit('error', error=str(e), op=op, ref=ref)
+        return True
+
+
+def _make_server(address, args, router):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            out = JsonLines(_SocketWriter(self.wfile))
+            router.add(out)
+            try:
+                _Session(args, out, router).serve(_decode_lines(self.rfile))
+            finally:
+                router.remove(out)
+
+    if ':' in address and not address.startswith(('/', '.')):
+        host, port = address.rsplit(':', 1)
+        server = socketserver.ThreadingTCPServer((host or '127.0.0.1', int(port)), Handler)
+    elif hasattr(socket, 'AF_UNIX'):
+        if os.path.exists(address):
+            os.remove(address)
+        server = socketserver.ThreadingUnixStreamServer(address, Handler)
+    else:
+        raise SystemExit(f'不支持的监听地址: {address}')
+    server.daemon_threads = True
+    return server
+
+
+class _SocketWriter:
+    def __init__(self, wfile):
+        self._wfile = wfile
+
+    def write(self, text):
+        self._wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self._wfile.flush()
+
+
+def _decode_lines(rfile):
+    for raw in rfile:
+        yield raw.decode('utf-8', errors='replace')
+
+
+# ═══════════════════════════════════════
+#  Entry
+# ═══════════════════════════════════════
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m ytdl_engine', description='威软YouTube下载引擎 - 命令行')
+    parser.add_argument('-o', '--output-dir', default=os.getcwd(), help='下载目录（默认当前目录）')
+    parser.add_argument('-j', '--jobs', type=int, default=ytdl_engine.DEFAULT_MAX_CONCURRENT, help='同时下载的任务数')
+    parser.add_argument('--connections', type=int, help='单个文件的并行连接数')
+    parser.add_argument('--stream-merge', action='store_true', help='视频与音频边下载边合并，不写分流临时文件')
+    parser.add_argument('--limit', type=float, default=0, help='总下载速率上限（KB/s），0 为不限速')
+    parser.add_argument('--priority', help='任务优先级 low / normal / high')
+    parser.add_argument('--staging-dir', help='暂存目录（快速本地磁盘），完成后移到下载目录')
+    parser.add_argument('--buffer-size', type=int, help='读写块大小（KB）')
+    parser.add_argument('--progress-rate', type=float, default=DEFAULT_EVENT_RATE, help='进度事件的最大频率（次/秒）')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('info', help='获取视频信息')
+    p.add_argument('url')
+    p.add_argument('--no-cache', action='store_true', help='忽略信息缓存')
+    p.add_argument('--sizes', action='store_true', help='附带各格式 / 组合 / 预设的预测大小')
+    p.add_argument('--probe', action='store_true', help='对估算的大小发请求确认')
+    p.set_defaults(func=cmd_info)
+
+    p = sub.add_parser('download', help='下载指定格式')
+    p.add_argument('url')
+    p.add_argument('format', help='format_id')
+    p.add_argument('--audio', action='store_true', help='作为音频下载')
+    p.add_argument('--no-merge', action='store_true', help='不自动合并最佳音频')
+    p.set_defaults(func=cmd_download)
+
+    p = sub.add_parser('preset', help='按预设质量下载')
+    p.add_argument('url')
+    p.add_argument('--max-height', type=int, help='最大分辨率，如 1080')
+    p.set_defaults(func=cmd_preset)
+
+    p = sub.add_parser('subtitle', help='下载字幕（可多个语言）')
+    p.add_argument('url')
+    p.add_argument('--lang', action='append', help='人工字幕语言，可重复')
+    p.add_argument('--auto-lang', action='append', help='自动字幕语言，可重复')
+    p.add_argument('--all', action='store_true', help='全部人工字幕')
+    p.add_argument('--format', action='append', help='输出格式 srt / vtt / json3 / srv3，可重复')
+    p.add_argument('--bilingual', action='append', metavar='A:B', help='合并两种语言的双语字幕')
+    p.set_defaults(func=cmd_subtitle)
+
+    p = sub.add_parser('batch', help='从 JSON Lines 文件批量提交任务并等待完成')
+    p.add_argument('file', help='命令文件，- 表示标准输入')
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser('daemon', help='常驻进程：从标准输入或 socket 接收命令')
+    p.add_argument('--listen', help='监听地址 HOST:PORT 或 Unix socket 路径（默认读取标准输入）')
+    p.add_argument('--journal', action='store_true', help='启用任务日志并恢复上次未完成的任务')
+    p.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # 标准输出只留给 JSON Lines；引擎与 yt-dlp 的日志改写到标准错误
+    out = JsonLines(sys.stdout)
+    sys.stdout = sys.stderr
+
+    router = ProgressRouter()
+    ytdl_engine.set_max_concurrent(args.jobs)
+    if args.limit:
+        ytdl_engine.set_bandwidth_limit(args.limit * 1024)
+    ytdl_engine.set_staging_dir(args.staging_dir)
+    if args.buffer_size:
+        ytdl_engine.set_buffer_size(args.buffer_size * 1024)
+    ytdl_engine.set_event_sink(router, args.progress_rate)
+    try:
+        return args.func(args, out, router)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        out.emit('error', error=str(e))
+        return 1
+    finally:
+        ytdl_engine.set_event_sink(None)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
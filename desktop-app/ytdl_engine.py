@@ -4,170 +4,2240 @@
 """
 
 import os
+import re
+import errno
+import gzip
+import sqlite3
+import json
+import copy
+import hashlib
+import subprocess
+import io
+import bisect
+import collections
+import contextlib
+import itertools
+import shutil
 import threading
 import time
+import urllib.parse
+import concurrent.futures
 import yt_dlp
+from yt_dlp.downloader.common import FileDownloader
+from yt_dlp.downloader.external import FFmpegFD
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.postprocessor.ffmpeg import EXT_TO_OUT_FORMATS, FFmpegPostProcessor
+from yt_dlp.postprocessor.movefilesafterdownload import MoveFilesAfterDownloadPP
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import RequestError
+from yt_dlp.utils import ContentTooShortError, DownloadCancelled, PostProcessingError, determine_protocol
+import subtitles
 
-# ─── Progress State ───
-_progress = {
-    'status': 'idle',       # idle / fetching / downloading / merging / done / error
-    'percent': 0,
-    'speed': '',
-    'eta': '',
-    'filename': '',
-    'error': '',
-}
-_lock = threading.Lock()
+# ─── Job Manager ───
+DEFAULT_MAX_CONCURRENT = 3
+DEFAULT_EVENT_RATE = 10     # 进度事件推送的最大频率（次/秒）
+_JOB_HISTORY = 100          # 保留的已结束任务记录数
+_FINISHED = ('done', 'error', 'cancelled')
+_worker_context = threading.local()     # 任务工作线程的标记：下载完成后不等待后处理
+
+
+class JobProgress:
+    """
+    单个任务的进度记录。
+    下载回调的热路径只写入原始数值（字节数、总大小、时间戳），不做格式化；
+    分段下载的多个线程会同时调用回调，增量在记录的锁内计算。
+    速度 / ETA 在读取时由字节数的 EWMA 计算，字符串也只在 snapshot() 中生成。
+    """
+
+    __slots__ = ('id', 'kind', 'url', 'created', 'status', 'error', 'filename',
+                 'stream_count', 'streams', 'updated', 'priority', 'allocated', 'cancel_reason',
+                 'files', 'cleanup', '_lock', '_speed', '_sample_time', '_sample_bytes')
 
+    SAMPLE_INTERVAL = 0.25      # EWMA 采样的最小间隔（秒）
+    ALPHA = 0.3                 # EWMA 平滑系数
+    STALL_TIMEOUT = 5           # 超过该时间没有新数据时速度视为 0
 
-def get_progress():
-    with _lock:
-        return dict(_progress)
+    def __init__(self, job_id, kind, url):
+        self.id = job_id
+        self.kind = kind
+        self.url = url
+        self.created = time.time()
+        self.status = 'queued'      # queued / downloading / merging / paused / done / error / cancelled
+        self.error = ''
+        self.filename = ''
+        self.stream_count = 1
+        self.streams = {}           # 流 → [已下载, 总大小, 已完成, 并行分段数]
+        self.updated = 0.0
+        self.priority = 'normal'
+        self.allocated = 0          # 带宽调度分配的速率（字节/秒），0 为不限速
+        self.cancel_reason = None   # 请求取消 / 暂停后为中止时的状态，下载回调据此中止传输
+        self.files = set()          # 各流的目标文件（完整路径），取消时据此清理 .part
+        self.cleanup = False        # 取消后是否删除未完成的文件
+        self._lock = threading.Lock()
+        self._speed = None
+        self._sample_time = None
+        self._sample_bytes = 0
 
+    # ─── Hot path ───
 
-def _set_progress(**kw):
-    with _lock:
-        _progress.update(kw)
+    def record(self, key, downloaded, total, segments=0):
+        """
+        写入流的最新进度，返回自上次记录以来新增的字节数。
+        分段线程在锁外读取累计字节数后各自调用回调，到达顺序可能颠倒：
+        比已记录值小的是过时的报告，直接忽略（否则回退后再前进会把同一段字节计两次）
+        """
+        with self._lock:
+            st = self.streams.get(key)
+            if st is None:
+                st = self.streams[key] = [0, 0, False, 0]
+            delta = downloaded - st[0]
+            if delta < 0:
+                return 0
+            st[0] = downloaded
+            if total:
+                st[1] = total
+            st[3] = segments
+            self.updated = time.monotonic()
+            if self.status != 'downloading':
+                self.status = 'downloading'
+            if self._sample_time is None:
+                self._sample_time, self._sample_bytes = self.updated, downloaded
+            return delta
 
+    def discard(self, key):
+        """丢弃失败的尝试（如流式合并回退到分流下载），重试时从零开始计数"""
+        with self._lock:
+            self.streams.pop(key, None)
 
-def _progress_hook(d):
-    if d['status'] == 'downloading':
-        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-        downloaded = d.get('downloaded_bytes', 0)
-        pct = (downloaded / total * 100) if total > 0 else 0
-        speed = d.get('_speed_str', d.get('speed', ''))
-        if isinstance(speed, (int, float)):
-            speed = f"{speed / 1024 / 1024:.1f} MB/s"
-        eta = d.get('_eta_str', d.get('eta', ''))
-        if isinstance(eta, (int, float)):
-            m, s = divmod(int(eta), 60)
+    def finish(self, key, total):
+        with self._lock:
+            st = self.streams.get(key)
+            if st is None:
+                st = self.streams[key] = [0, 0, False, 0]
+            st[0] = st[1] = total or st[0]
+            st[2] = True
+            st[3] = 0
+            self.updated = time.monotonic()
+            streams = list(self.streams.values())
+            if len(streams) >= self.stream_count and all(x[2] for x in streams):
+                self.status = 'merging'
+
+    # ─── Read side ───
+
+    def snapshot(self):
+        """计算速度 / ETA 并返回格式化后的进度字典"""
+        with self._lock:
+            now = time.monotonic()
+            streams = list(self.streams.values())
+            downloaded = sum(x[0] for x in streams)
+            total = sum(x[1] for x in streams)
+            if self._sample_time is None:
+                self._sample_time, self._sample_bytes = now, downloaded
+            elif now - self._sample_time >= self.SAMPLE_INTERVAL:
+                rate = max(0, downloaded - self._sample_bytes) / (now - self._sample_time)
+                self._speed = rate if self._speed is None else self.ALPHA * rate + (1 - self.ALPHA) * self._speed
+                self._sample_time, self._sample_bytes = now, downloaded
+            speed = self._speed or 0
+            if self.status != 'downloading' or now - self.updated > self.STALL_TIMEOUT:
+                speed = 0
+
+        if self.status == 'done':
+            pct = 100
+        elif self.status == 'merging':
+            pct = 99
+        else:
+            pct = round(min(downloaded / total * 100, 99), 1) if total > 0 else 0
+        eta = ''
+        if speed > 0 and total > downloaded:
+            m, s = divmod(int((total - downloaded) / speed), 60)
             eta = f"{m}:{s:02d}"
-        _set_progress(status='downloading', percent=round(pct, 1), speed=str(speed), eta=str(eta))
-    elif d['status'] == 'finished':
-        _set_progress(status='merging', percent=99, speed='', eta='')
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'url': self.url,
+            'status': self.status,
+            'percent': pct,
+            'speed': f"{speed / 1024 / 1024:.1f} MB/s" if speed else '',
+            'eta': eta,
+            'filename': self.filename,
+            'error': self.error,
+            'segments': sum(x[3] for x in streams),
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'speed_bps': round(speed),
+            'priority': self.priority,
+            'allocated_bps': round(self.allocated),
+            'created': self.created,
+        }
+
+
+class JobManager:
+    """
+    下载任务管理器：每个任务分配独立的 job id 与进度记录，
+    由有界工作线程池执行，并发数可在运行时调整。
+    设置事件接收器后，发生变化的任务记录会被合并、限频后批量推送。
+    """
+
+    _IDLE_TIMEOUT = 30      # 空闲工作线程的退出时间（秒）
+
+    def __init__(self, max_workers=DEFAULT_MAX_CONCURRENT):
+        self._cond = threading.Condition()
+        self._jobs = collections.OrderedDict()
+        self._queue = collections.deque()
+        self._max_workers = max(1, int(max_workers))
+        self._workers = 0
+        self._idle = 0
+        self._ids = itertools.count(1)
+        self._sink = None
+        self._event_interval = 1.0 / DEFAULT_EVENT_RATE
+        self._dirty = set()
+        self._dirty_event = threading.Event()
+        self._pusher = None
+        self._journal = None
+        self._callbacks = {}
+        self._params = {}           # job id → (kind, params)，暂停的任务据此重新排队
+
+    # ─── Records ───
+
+    def create(self, kind, url, job_id=None):
+        """创建进度记录，返回 job id"""
+        with self._cond:
+            if job_id is None:
+                job_id = f'{int(time.time()):x}-{next(self._ids)}'
+            self._jobs[job_id] = JobProgress(job_id, kind, url)
+            self._prune()
+            self._mark_dirty(job_id)
+            return job_id
+
+    def progress(self, job_id):
+        """返回任务的 JobProgress（供下载回调直接写入）"""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id, **kw):
+        journal = None
+        with self._cond:
+            rec = self._jobs.get(job_id)
+            if rec is not None:
+                for key, value in kw.items():
+                    setattr(rec, key, value)
+                self._mark_dirty(job_id)
+                if 'status' in kw:
+                    journal = self._journal
+        if journal is not None:
+            journal.update(job_id, status=kw['status'], error=kw.get('error'))
+
+    def touch(self, job_id):
+        """热路径：标记任务进度已变化（不加锁）"""
+        if self._sink is not None:
+            self._dirty.add(job_id)
+            if not self._dirty_event.is_set():
+                self._dirty_event.set()
+
+    def get(self, job_id=None):
+        """返回单个任务的进度，或按创建顺序返回全部任务"""
+        with self._cond:
+            if job_id is not None:
+                rec = self._jobs.get(job_id)
+                return rec.snapshot() if rec is not None else None
+            return [rec.snapshot() for rec in self._jobs.values()]
+
+    def cancel(self, job_id, reason='cancelled', cleanup=False):
+        """
+        请求中止任务：排队中 / 已暂停的任务立即结束；运行中的任务在下一个数据块时
+        由下载回调抛出 DownloadCancelled，释放连接与工作线程后以 reason（cancelled / paused）结束。
+        cleanup=True 时在传输停止后删除未完成的文件。
+        返回 False 表示任务不存在、已结束或已进入合并 / 后处理阶段（之后没有下载回调，无法中止）。
+        """
+        with self._cond:
+            rec = self._jobs.get(job_id)
+            if rec is None or rec.status in _FINISHED or rec.status == 'merging':
+                return False
+            rec.cancel_reason = reason
+            rec.cleanup = rec.cleanup or cleanup
+            queued = [item for item in self._queue if item[0] == job_id]
+            for item in queued:
+                self._queue.remove(item)
+            idle = bool(queued) or rec.status == 'paused'
+        if idle:
+            self.update(job_id, status=reason, error='')
+            self._finish(job_id)
+        return True
+
+    def resume(self, job_id):
+        """继续已暂停的任务（沿用原 job id 重新排队，从 .part 文件续传）"""
+        with self._cond:
+            rec = self._jobs.get(job_id)
+            if rec is None:
+                return False
+            if rec.status != 'paused':
+                # 暂停请求尚未生效（传输还没停下）：撤销请求即可
+                if rec.cancel_reason == 'paused':
+                    rec.cancel_reason = None
+                    return True
+                return False
+            if job_id not in self._params:
+                return False
+            rec.cancel_reason = None
+            kind, params = self._params[job_id]
+        if rec.priority != 'normal':
+            _bandwidth.set_priority(job_id, rec.priority)
+        self.update(job_id, status='queued')
+        self._enqueue(job_id, kind, params)
+        return True
+
+    def add_done_callback(self, job_id, callback):
+        """任务结束（done / error / cancelled）后以最终记录调用 callback(snapshot)；已结束时立即调用"""
+        with self._cond:
+            rec = self._jobs.get(job_id)
+            if rec is None:
+                raise KeyError(job_id)
+            if rec.status not in _FINISHED:
+                self._callbacks.setdefault(job_id, []).append(callback)
+                return
+            snap = rec.snapshot()
+        callback(snap)
+
+    def _finish(self, job_id):
+        with self._cond:
+            rec = self._jobs.get(job_id)
+            if rec is not None and rec.status not in _FINISHED:
+                return          # 已暂停：回调等任务继续后真正结束时再调用
+            cleanup = rec is not None and rec.cleanup and rec.status == 'cancelled'
+            self._params.pop(job_id, None)
+            callbacks = self._callbacks.pop(job_id, ())
+            snap = rec.snapshot() if rec is not None else None
+        if cleanup:
+            _remove_partial_files(rec)
+        for callback in callbacks:
+            try:
+                callback(snap)
+            except Exception as e:
+                print(f'[任务回调失败] {e}')
+
+    # ─── Events ───
+
+    def set_event_sink(self, sink, max_rate=DEFAULT_EVENT_RATE):
+        """sink(batch) 接收发生变化的任务记录列表；传入 None 停止推送"""
+        with self._cond:
+            self._sink = sink
+            self._event_interval = 1.0 / max(0.1, float(max_rate))
+            self._dirty.clear()
+            if sink is not None and self._pusher is None:
+                self._pusher = threading.Thread(target=self._push_loop, daemon=True)
+                self._pusher.start()
+        self._dirty_event.set()
+
+    def _mark_dirty(self, job_id):
+        # caller holds self._cond
+        if self._sink is not None:
+            self._dirty.add(job_id)
+            self._dirty_event.set()
+
+    def _push_loop(self):
+        while True:
+            self._dirty_event.wait()
+            with self._cond:
+                sink = self._sink
+                if sink is None:
+                    self._pusher = None
+                    return
+                self._dirty_event.clear()
+                dirty, self._dirty = self._dirty, set()
+                batch = [self._jobs[jid].snapshot() for jid in list(dirty) if jid in self._jobs]
+                interval = self._event_interval
+            if batch:
+                try:
+                    sink(batch)
+                except Exception as e:
+                    print(f'[进度推送失败] {e}')
+            time.sleep(interval)
+
+    def _prune(self):
+        finished = [jid for jid, rec in self._jobs.items() if rec.status in _FINISHED]
+        for jid in finished[:max(0, len(finished) - _JOB_HISTORY)]:
+            del self._jobs[jid]
+
+    # ─── Journal ───
+
+    def set_journal(self, journal):
+        with self._cond:
+            self._journal = journal
+        if journal is not None:
+            threading.Thread(target=self._checkpoint_loop, args=(journal,), daemon=True).start()
+
+    def resume_unfinished(self):
+        """重新排队日志中未完成的任务（沿用原 job id），返回 job id 列表"""
+        journal = self._journal
+        if journal is None:
+            return []
+        resumed = []
+        for job_id, kind, params, status in journal.unfinished():
+            if kind not in _JOB_KINDS:
+                continue
+            with self._cond:
+                if job_id in self._jobs:
+                    continue
+            self.create(kind, params.get('url', ''), job_id=job_id)
+            if status == 'paused':
+                # 暂停的任务恢复为暂停状态，由用户决定何时继续
+                with self._cond:
+                    self._params[job_id] = (kind, params)
+                self.update(job_id, status='paused')
+                continue
+            self._enqueue(job_id, kind, params)
+            resumed.append(job_id)
+        return resumed
+
+    def _checkpoint_loop(self, journal):
+        """定期将运行中任务的字节进度写入日志"""
+        while self._journal is journal:
+            time.sleep(journal.CHECKPOINT_INTERVAL)
+            with self._cond:
+                running = [rec for rec in self._jobs.values() if rec.status in ('downloading', 'merging')]
+            for rec in running:
+                snap = rec.snapshot()
+                journal.update(rec.id, downloaded=snap['downloaded_bytes'], total=snap['total_bytes'],
+                               filename=snap['filename'])
+
+    # ─── Worker Pool ───
+
+    def submit(self, kind, priority=None, **params):
+        """将任务加入队列，返回 job id；优先级无效时抛出 ValueError，不会留下任务记录"""
+        if priority is not None:
+            _priority_weight(priority)
+        job_id = self.create(kind, params.get('url', ''))
+        if priority is not None:
+            _bandwidth.set_priority(job_id, priority)
+        if self._journal is not None:
+            self._journal.add(job_id, kind, params)
+        self._enqueue(job_id, kind, params)
+        return job_id
+
+    def _enqueue(self, job_id, kind, params):
+        with self._cond:
+            self._params[job_id] = (kind, params)
+            self._queue.append((job_id, kind, params))
+            self._spawn()
+            self._cond.notify()
+
+    def set_max_workers(self, n):
+        with self._cond:
+            self._max_workers = max(1, int(n))
+            self._spawn()
+            self._cond.notify_all()
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def _spawn(self):
+        # caller holds self._cond
+        pending = len(self._queue) - self._idle
+        while pending > 0 and self._workers < self._max_workers:
+            self._workers += 1
+            pending -= 1
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        _worker_context.active = True
+        while True:
+            with self._cond:
+                while not self._queue and self._workers <= self._max_workers:
+                    self._idle += 1
+                    notified = self._cond.wait(self._IDLE_TIMEOUT)
+                    self._idle -= 1
+                    if not notified:
+                        break
+                if not self._queue or self._workers > self._max_workers:
+                    self._workers -= 1
+                    return
+                job_id, kind, params = self._queue.popleft()
+            self._run(job_id, kind, params)
+
+    def _run(self, job_id, kind, params):
+        try:
+            rec = self.progress(job_id)
+            if rec is not None and rec.cancel_reason is not None:
+                raise DownloadCancelled(rec.cancel_reason)
+            _JOB_KINDS[kind](job_id=job_id, **params)
+        except Exception as e:
+            _fail_job(job_id, e)
+            if not isinstance(e, DownloadCancelled):
+                print(f'[下载错误] {e}')
+        finally:
+            _bandwidth.release(job_id)
+            self._finish(job_id)
+
+
+_manager = JobManager()
+
+
+def submit_job(kind, priority=None, **params):
+    """提交下载任务 kind: video / audio / subtitle / subtitles / best，priority: low / normal / high 或数值权重"""
+    if kind not in _JOB_KINDS:
+        raise ValueError(f'未知任务类型: {kind}')
+    fmt = params.get('format_id')
+    if isinstance(fmt, FormatRecord):
+        # 任务参数会写入日志，格式表记录在此转换为 format_id
+        params['format_id'] = fmt.format_id
+        if kind == 'video':
+            params.setdefault('merge_audio', fmt.type == 'video')
+    return _manager.submit(kind, priority=priority, **params)
+
+
+def get_progress(job_id=None):
+    return _manager.get(job_id)
+
+
+def cancel_job(job_id, delete_files=False):
+    """
+    取消任务：排队中的立即移除，下载中的在下一个数据块时中止；delete_files=True 时删除 .part 等未完成文件。
+    任务已进入合并 / 后处理阶段时返回 False
+    """
+    return _manager.cancel(job_id, cleanup=delete_files)
+
+
+def pause_job(job_id):
+    """暂停任务：中止传输并释放连接，保留 .part 文件以便继续"""
+    return _manager.cancel(job_id, reason='paused')
+
+
+def resume_job(job_id):
+    """继续已暂停的任务，从已下载的部分续传"""
+    return _manager.resume(job_id)
+
+
+def add_job_callback(job_id, callback):
+    """任务结束后调用 callback(snapshot)（在工作线程中调用）；任务已结束时立即调用"""
+    _manager.add_done_callback(job_id, callback)
+
+
+def set_max_concurrent(n):
+    """设置同时进行的下载数"""
+    _manager.set_max_workers(n)
+
+
+def set_event_sink(sink, max_rate=DEFAULT_EVENT_RATE):
+    """注册进度事件接收器：变化的任务记录按 max_rate 限频批量推送"""
+    _manager.set_event_sink(sink, max_rate)
+
+
+def enable_journal(path=None):
+    """启用持久化任务日志（默认位于应用数据目录）"""
+    _manager.set_journal(JobJournal(path or os.path.join(APP_DATA_DIR, 'jobs.db')))
+
+
+def resume_jobs():
+    """重新排队上次未完成的任务，已有的 .part 文件会续传"""
+    return _manager.resume_unfinished()
+
+
+def set_bandwidth_limit(bytes_per_sec):
+    """设置所有下载的总速率上限（字节/秒），0 为不限速，可在下载进行中调整"""
+    _bandwidth.set_limit(bytes_per_sec)
+
+
+def set_job_priority(job_id, priority):
+    """调整任务的带宽优先级：low / normal / high 或数值权重"""
+    _bandwidth.set_priority(job_id, priority)
+    _manager.touch(job_id)
+
+
+def bandwidth_status():
+    return _bandwidth.status()
+
+
+def _ensure_job(job_id, kind, url):
+    return job_id if job_id is not None else _manager.create(kind, url)
+
+
+def _set_progress(job_id, **kw):
+    _manager.update(job_id, **kw)
+
+
+def _fail_job(job_id, error):
+    """记录任务失败；已请求取消的任务以取消原因（cancelled 等）结束而不是 error"""
+    progress = _manager.progress(job_id)
+    if progress is not None and progress.cancel_reason is not None:
+        _set_progress(job_id, status=progress.cancel_reason, error='')
+    else:
+        _set_progress(job_id, status='error', error=str(error))
+
+
+class _ProgressHook:
+    """
+    任务的 yt-dlp 进度回调：每个数据块调用一次，只把原始数值写入 JobProgress。
+    合并格式按流分别记录，百分比不会在视频 / 音频两条流之间归零。
+    """
+
+    __slots__ = ('job_id', 'progress')
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.progress = _manager.progress(job_id)
+
+    def __call__(self, d):
+        progress = self.progress
+        if progress is None:
+            return
+        if progress.cancel_reason is not None:
+            # 在下载线程内抛出，yt-dlp 与分段下载器会停止传输并保留 .part 文件
+            raise DownloadCancelled(progress.cancel_reason)
+        info = d.get('info_dict')
+        key = info.get('format_id') if info else d.get('filename')
+        if d['status'] == 'downloading':
+            if key not in progress.streams and d.get('filename'):
+                progress.files.add(d['filename'])
+            progress.stream_count = d.get('stream_count', 1)
+            delta = progress.record(key, d.get('downloaded_bytes') or 0,
+                                    d.get('total_bytes') or d.get('total_bytes_estimate') or 0,
+                                    len(d.get('segment_speeds') or ()))
+            if not progress.filename:
+                progress.filename = os.path.basename(d.get('filename') or '')
+            if delta > 0 and _bandwidth.limit:
+                _manager.touch(self.job_id)
+                # 在下载线程内等待令牌：回调返回前不会读取下一个数据块
+                _bandwidth.consume(self.job_id, delta, progress)
+                return
+        elif d['status'] == 'error':
+            progress.discard(key)               # 失败的尝试不计入进度（如流式合并回退到分流下载）
+        elif d['status'] == 'finished':
+            if not progress.filename:
+                progress.filename = os.path.basename(d.get('filename') or '')
+            progress.finish(key, d.get('total_bytes'))
+        else:
+            return
+        _manager.touch(self.job_id)
 
 
 # ═══════════════════════════════════════
-#  Fetch Video Info
+#  Bandwidth Scheduler
 # ═══════════════════════════════════════
 
-def fetch_video_info(url):
-    """获取视频信息，返回格式化的字典"""
-    _set_progress(status='fetching', percent=0, error='')
+_PRIORITY_WEIGHTS = {'low': 1, 'normal': 4, 'high': 16}
 
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'skip_download': True,
-        'no_color': True,
-    }
 
+def _priority_weight(priority):
+    """优先级 → 权重：low / normal / high 或正数权重，无效时抛出 ValueError"""
+    if isinstance(priority, str):
+        if priority not in _PRIORITY_WEIGHTS:
+            raise ValueError(f'未知优先级: {priority}')
+        return _PRIORITY_WEIGHTS[priority]
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        weight = float(priority)
+    except (TypeError, ValueError):
+        raise ValueError(f'未知优先级: {priority}') from None
+    if not weight > 0 or weight == float('inf'):
+        raise ValueError(f'优先级权重必须为正数: {priority}')
+    return weight
 
-        if not info:
-            raise Exception('无法获取视频信息')
 
-        # Parse formats
-        formats = []
-        seen = set()
-        for f in (info.get('formats') or []):
-            fid = f.get('format_id', '')
-            if fid in seen:
-                continue
-            seen.add(fid)
+class _TokenBucket:
+    """欠账式令牌桶：取出令牌后余额为负时返回需要等待的秒数"""
 
-            vcodec = f.get('vcodec', 'none')
-            acodec = f.get('acodec', 'none')
-            has_video = vcodec != 'none' and vcodec is not None
-            has_audio = acodec != 'none' and acodec is not None
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate=0):
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.burst = max(rate * 0.25, 64 << 10)     # 最多积攒 0.25 秒的额度
+        self.tokens = min(self.tokens, self.burst)
+
+    def take(self, n, now):
+        if not self.rate:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= n
+        return -self.tokens / self.rate if self.tokens < 0 else 0
 
-            if not has_video and not has_audio:
-                continue
 
-            height = f.get('height') or 0
-            ext = f.get('ext', '?')
-            filesize = f.get('filesize') or f.get('filesize_approx') or 0
-            fps_val = f.get('fps') or 0
-            tbr = f.get('tbr') or 0
+class _JobShare:
+    __slots__ = ('progress', 'weight', 'bucket', 'demand', 'window_bytes', 'throttled', 'waiting', 'last_active')
 
-            if has_video:
-                quality_label = f.get('format_note', '') or (f'{height}p' if height else '')
-                ftype = 'combined' if has_audio else 'video'
+    def __init__(self, progress, weight, now):
+        self.progress = progress
+        self.weight = weight
+        self.bucket = _TokenBucket()
+        self.demand = float('inf')  # 新任务的需求未知，先按不受限处理
+        self.window_bytes = 0
+        self.throttled = True
+        self.waiting = False        # 正在下载线程内等待令牌（整个分配周期都可能在等待中度过）
+        self.last_active = now
+
+    def assign(self, rate):
+        self.bucket.set_rate(rate)
+        self.progress.allocated = rate
+
+
+class BandwidthScheduler:
+    """
+    全局带宽调度：所有下载在进度回调中按实际写入的字节数领取令牌。
+    总速率由全局令牌桶限制；各任务的速率按优先级权重注水式分配 ——
+    用不满份额的任务只分到实际需求，剩余带宽按权重分给其他任务，总吞吐不受损失。
+    """
+
+    REALLOCATE_INTERVAL = 0.5   # 重新分配速率的间隔（秒）
+    ACTIVE_WINDOW = 2.0         # 超过该时间没有数据的任务不参与分配（合并、排队中）
+    HEADROOM = 1.25             # 需求受限的任务预留的增长余量
+    MIN_RATE = 16 << 10         # 单个任务的最低分配速率
+    MAX_SLEEP = 0.25            # 单次等待的上限：欠账分多次还清，其间检查取消 / 暂停
+
+    def __init__(self, limit=0):
+        self._lock = threading.Lock()
+        self._global = _TokenBucket()
+        self._shares = {}           # job id → _JobShare
+        self._weights = {}          # job id → 权重
+        self._last_alloc = time.monotonic()
+        self.limit = 0
+        self.set_limit(limit)
+
+    def set_limit(self, bytes_per_sec):
+        """设置总速率上限（字节/秒），0 或 None 为不限速"""
+        limit = max(0, int(bytes_per_sec or 0))
+        with self._lock:
+            self.limit = limit
+            self._global.set_rate(limit)
+            if limit:
+                self._reallocate(time.monotonic())
             else:
-                quality_label = f.get('format_note', '') or f'{int(tbr)}kbps'
-                ftype = 'audio'
-
-            formats.append({
-                'format_id': fid,
-                'type': ftype,
-                'quality': quality_label,
-                'height': height,
-                'fps': fps_val,
-                'ext': ext,
-                'filesize': filesize,
-                'vcodec': (vcodec if has_video else ''),
-                'acodec': (acodec if has_audio else ''),
-                'tbr': tbr,
-            })
+                for share in self._shares.values():
+                    share.assign(0)
+
+    def set_priority(self, job_id, priority):
+        """设置任务优先级：low / normal / high 或正数权重；任务不存在或已结束时抛出 ValueError"""
+        weight = _priority_weight(priority)
+        progress = _manager.progress(job_id)
+        if progress is None or progress.status in _FINISHED:
+            raise ValueError(f'任务不存在或已结束: {job_id}')
+        progress.priority = priority
+        with self._lock:
+            self._weights[job_id] = weight
+            share = self._shares.get(job_id)
+            if share is not None:
+                share.weight = weight
+                if self.limit:
+                    self._reallocate(time.monotonic())
+
+    def release(self, job_id):
+        with self._lock:
+            self._weights.pop(job_id, None)
+            share = self._shares.pop(job_id, None)
+            if share is not None:
+                share.assign(0)
+
+    def status(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'jobs': {job_id: round(s.bucket.rate) for job_id, s in self._shares.items()},
+            }
+
+    def consume(self, job_id, nbytes, progress):
+        """
+        领取 nbytes 的令牌，额度不足时在调用线程内等待到欠账还清。
+        HttpFD 的可变缓冲区一次最多读取数 MiB，欠账可能远超单次等待，因此分多次等待，
+        每次按当前分配的速率重新计算；任务被取消 / 暂停时提前返回，由进度回调中止传输。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self.limit:
+                return
+            share = self._shares.get(job_id)
+            if share is None:
+                weight = self._weights.get(job_id, _PRIORITY_WEIGHTS['normal'])
+                share = self._shares[job_id] = _JobShare(progress, weight, now)
+                self._reallocate(now)
+            share.window_bytes += nbytes
+            share.last_active = now
+            if now - self._last_alloc >= self.REALLOCATE_INTERVAL:
+                self._measure(now)
+                self._reallocate(now)
+            wait = max(share.bucket.take(nbytes, now), self._global.take(nbytes, now))
+            if wait <= 0:
+                return
+            share.throttled = share.waiting = True
+        try:
+            while wait > 0 and progress.cancel_reason is None:
+                time.sleep(min(wait, self.MAX_SLEEP))
+                now = time.monotonic()
+                with self._lock:
+                    if not self.limit or self._shares.get(job_id) is not share:
+                        return
+                    share.last_active = now
+                    if now - self._last_alloc >= self.REALLOCATE_INTERVAL:
+                        self._measure(now)
+                        self._reallocate(now)
+                    wait = max(share.bucket.take(0, now), self._global.take(0, now))
+        finally:
+            share.waiting = False
+
+    def _measure(self, now):
+        # caller holds self._lock
+        window = max(now - self._last_alloc, 1e-3)
+        self._last_alloc = now
+        for share in self._shares.values():
+            # 被限速过（或整个周期都在等待令牌）的任务实际需求未知，视为无限
+            share.demand = float('inf') if share.throttled or share.waiting else share.window_bytes / window
+            share.window_bytes = 0
+            share.throttled = False
+
+    def _reallocate(self, now):
+        # caller holds self._lock
+        pool = []
+        for share in self._shares.values():
+            if now - share.last_active < self.ACTIVE_WINDOW:
+                pool.append(share)
+            else:
+                share.assign(0)
+
+        # 注水分配：需求低于公平份额的任务按需求分配，余量在其余任务间按权重重新划分
+        remaining = self.limit
+        while pool:
+            total_weight = sum(s.weight for s in pool)
+            rest = []
+            for share in pool:
+                if share.demand < remaining * share.weight / total_weight:
+                    share.assign(max(share.demand * self.HEADROOM, self.MIN_RATE))
+                    remaining -= share.demand
+                else:
+                    rest.append(share)
+            if len(rest) == len(pool):
+                for share in rest:
+                    share.assign(max(remaining * share.weight / total_weight, self.MIN_RATE))
+                break
+            pool = rest
+
+
+_bandwidth = BandwidthScheduler()
+
+
+# ═══════════════════════════════════════
+#  Job Journal
+# ═══════════════════════════════════════
+
+class JobJournal:
+    """
+    持久化任务日志 (SQLite)：记录每个任务的类型、参数（链接 / 格式 / 输出目录）与字节进度。
+    程序异常退出后，状态仍为 queued / downloading / merging 的任务会在下次启动时重新排队。
+    """
+
+    CHECKPOINT_INTERVAL = 2     # 字节进度写入间隔（秒）
+    KEEP_FINISHED = 7 * 86400   # 已结束任务保留时长（秒）
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id          TEXT PRIMARY KEY,
+                    kind        TEXT NOT NULL,
+                    params      TEXT NOT NULL,
+                    url         TEXT,
+                    format      TEXT,
+                    output_dir  TEXT,
+                    status      TEXT NOT NULL,
+                    error       TEXT DEFAULT '',
+                    downloaded  INTEGER DEFAULT 0,
+                    total       INTEGER DEFAULT 0,
+                    filename    TEXT DEFAULT '',
+                    created     REAL,
+                    updated     REAL
+                )''')
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'error', 'cancelled') AND updated < ?",
+                (time.time() - self.KEEP_FINISHED,))
+
+    def add(self, job_id, kind, params):
+        fmt = params.get('format_id') or params.get('max_height') or params.get('lang') or ''
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO jobs (id, kind, params, url, format, output_dir, status, created, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(params, ensure_ascii=False), params.get('url', ''), str(fmt),
+                 params.get('output_dir', ''), 'queued', now, now))
+
+    def update(self, job_id, **fields):
+        fields = {k: v for k, v in fields.items() if v is not None}
+        if not fields:
+            return
+        fields['updated'] = time.time()
+        columns = ', '.join(f'{k} = ?' for k in fields)
+        with self._lock, self._db:
+            self._db.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def unfinished(self):
+        """返回 [(job_id, kind, params, status)]，按创建顺序（含已暂停的任务）"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, params, status FROM jobs "
+                "WHERE status IN ('queued', 'downloading', 'merging', 'paused') "
+                'ORDER BY created').fetchall()
+        return [(job_id, kind, json.loads(params), status) for job_id, kind, params, status in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ═══════════════════════════════════════
+#  Segmented Download
+# ═══════════════════════════════════════
+
+DEFAULT_CONNECTIONS = 4     # 每个任务的默认并行连接/分片数
+
+
+class SegmentedHttpFD(HttpFD):
+    """
+    分段并行下载器：渐进式文件按字节范围切分，多连接并行拉取，
+    原地写入预分配的 .part 文件。分段大小随实测吞吐自适应；
+    服务器不支持 Range 或文件较小时回退到 HttpFD。
+    """
+
+    MIN_SPLIT = 4 << 20         # 小于此大小的文件不分段
+    MIN_SEGMENT = 256 << 10
+    MAX_SEGMENT = 10 << 20      # YouTube 对过大的 Range 请求会限速
+    SEGMENT_SECONDS = 2.0       # 目标：每段约 2 秒完成
+    BLOCK_SIZE = 64 << 10
+
+    @staticmethod
+    def suitable(info, params):
+        return ((params.get('concurrent_fragment_downloads') or 1) > 1
+                and not info.get('requested_formats')
+                and (info.get('protocol') or determine_protocol(info)) in ('http', 'https'))
+
+    def real_download(self, filename, info_dict):
+        url = info_dict['url']
+        headers = dict(info_dict.get('http_headers') or {})
+        total = self._probe_size(url, headers)
+        if not total or total < self.MIN_SPLIT:
+            return super().real_download(filename, info_dict)
+        self.report_destination(filename)
+        return _SegmentedTransfer(self, filename, info_dict, total).run()
+
+    def _probe_size(self, url, headers):
+        try:
+            resp = self.ydl.urlopen(Request(url, headers=dict(headers, Range='bytes=0-0')))
+        except RequestError:
+            return None
+        try:
+            m = re.search(r'/(\d+)$', resp.headers.get('Content-Range') or '')
+            return int(m.group(1)) if resp.status == 206 and m else None
+        finally:
+            resp.close()
+
+
+class _SegmentedTransfer:
+    """单个文件的一次分段下载（含断点状态文件 .part.segments）"""
+
+    def __init__(self, fd, filename, info_dict, total):
+        self.fd = fd
+        self.filename = filename
+        self.info_dict = info_dict
+        self.url = info_dict['url']
+        self.headers = dict(info_dict.get('http_headers') or {})
+        self.total = total
+        self.tmpfilename = fd.temp_name(filename)
+        self.state_file = self.tmpfilename + '.segments'
+        self.connections = max(1, min(int(fd.params.get('concurrent_fragment_downloads') or 1), 16))
+        self.retries = fd.params.get('retries', 10)
+        self.block_size = int(fd.params.get('buffersize') or fd.BLOCK_SIZE)
+        self.lock = threading.Lock()
+        self.done = []                  # 已完成的 [start, end] 区间
+        self.pending = collections.deque()
+        self.segment_size = 1 << 20
+        self.segment_speed = None       # 单连接吞吐的 EWMA
+        self.active = {}                # 线程 → [分段起点, 已写入位置, 实时速度]
+        self.error = None
+        self.start_time = time.time()
+        self.resumed = 0
+        self.downloaded = 0
+        self.last_save = 0
+
+    def run(self):
+        self._prepare_file()
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.connections)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        if self.error is not None or self.downloaded < self.total:
+            self._save_state(force=True)
+            raise self.error or ContentTooShortError(self.downloaded, self.total)
+
+        _silent_remove(self.state_file)
+        self.fd.try_rename(self.tmpfilename, self.filename)
+        self.fd._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': self.total,
+            'total_bytes': self.total,
+            'filename': self.filename,
+            'elapsed': time.time() - self.start_time,
+        }, self.info_dict)
+        return True
+
+    # ─── File & resume state ───
+
+    def _prepare_file(self):
+        resume = self.fd.params.get('continuedl', True) and self._load_state()
+        if not resume:
+            self.done = []
+            self.pending = collections.deque([(0, self.total - 1)])
+            with open(self.tmpfilename, 'wb') as fp:
+                _preallocate(fp, self.total)
+        self.downloaded = self.resumed = sum(e - s + 1 for s, e in self.done)
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, encoding='utf-8') as fp:
+                state = json.load(fp)
+            if state['total'] != self.total or os.path.getsize(self.tmpfilename) != self.total:
+                return False
+        except (OSError, ValueError, KeyError):
+            return False
+        self.done = sorted(map(tuple, state['done']))
+        pos = 0
+        for s, e in self.done:
+            if s > pos:
+                self.pending.append((pos, s - 1))
+            pos = max(pos, e + 1)
+        if pos < self.total:
+            self.pending.append((pos, self.total - 1))
+        self.fd.report_resuming_byte(sum(e - s + 1 for s, e in self.done))
+        return True
+
+    def _save_state(self, force=False):
+        now = time.time()
+        with self.lock:
+            if not force and now - self.last_save < 2:
+                return
+            self.last_save = now
+            ranges = self.done + [(a[0], a[1] - 1) for a in self.active.values() if a[1] > a[0]]
+            state = {'total': self.total, 'done': _merge_ranges(ranges)}
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as fp:
+                json.dump(state, fp)
+        except OSError:
+            pass
+
+    # ─── Workers ───
+
+    def _next_range(self):
+        with self.lock:
+            if self.error is not None or not self.pending:
+                return None
+            start, end = self.pending[0]
+            size = self.segment_size
+            if end - start + 1 <= size * 3 // 2:
+                self.pending.popleft()
+                return start, end
+            self.pending[0] = (start + size, end)
+            return start, start + size - 1
+
+    def _worker(self):
+        try:
+            # 不使用缓冲：状态文件记录的区间必须已经写入文件
+            with open(self.tmpfilename, 'r+b', buffering=0) as fp:
+                while True:
+                    rng = self._next_range()
+                    if rng is None:
+                        return
+                    self._fetch(fp, *rng)
+        except Exception as err:
+            with self.lock:
+                self.error = self.error or err
+
+    def _fetch(self, fp, start, end):
+        pos = start
+        key = threading.get_ident()
+        for attempt in itertools.count():
+            seg_start, seg_pos = time.time(), pos
+            try:
+                resp = self.fd.ydl.urlopen(Request(self.url, headers=dict(self.headers, Range=f'bytes={pos}-{end}')))
+                try:
+                    if resp.status != 206:
+                        raise ContentTooShortError(0, end - pos + 1)
+                    fp.seek(pos)
+                    while pos <= end:
+                        block = resp.read(min(self.block_size, end - pos + 1))
+                        if not block:
+                            break
+                        view = memoryview(block)
+                        while view:
+                            view = view[fp.write(view):]
+                        pos += len(block)
+                        self._advance(key, start, pos, len(block), pos - seg_pos, time.time() - seg_start)
+                finally:
+                    resp.close()
+                if pos > end:
+                    self._segment_done(key, start, end, end - seg_pos + 1, time.time() - seg_start)
+                    return
+                raise ContentTooShortError(pos - start, end - start + 1)
+            except (RequestError, OSError, ContentTooShortError) as err:
+                if attempt >= self.retries:
+                    with self.lock:
+                        if pos > start:
+                            self.done.append((start, pos - 1))
+                        self.pending.appendleft((pos, end))
+                        self.active.pop(key, None)
+                        self.error = self.error or err
+                    return
+                self.fd.report_retry(err, attempt + 1, self.retries, fatal=False)
+                time.sleep(min(2 ** attempt, 10))
+
+    def _advance(self, key, start, pos, n, seg_bytes, seg_elapsed):
+        now = time.time()
+        with self.lock:
+            self.downloaded += n
+            self.active[key] = (start, pos, seg_bytes / seg_elapsed if seg_elapsed > 0 else None)
+            downloaded = self.downloaded
+            segment_speeds = [a[2] for a in self.active.values()]
+        speed = self.fd.calc_speed(self.start_time, now, downloaded - self.resumed)
+        self.fd._hook_progress({
+            'status': 'downloading',
+            'downloaded_bytes': downloaded,
+            'total_bytes': self.total,
+            'tmpfilename': self.tmpfilename,
+            'filename': self.filename,
+            'speed': speed,
+            'eta': self.fd.calc_eta(speed, self.total - downloaded),
+            'elapsed': now - self.start_time,
+            'segment_speeds': segment_speeds,
+        }, self.info_dict)
+        self._save_state()
+
+    def _segment_done(self, key, start, end, nbytes, elapsed):
+        with self.lock:
+            self.done.append((start, end))
+            self.active.pop(key, None)
+            if elapsed > 0:
+                rate = nbytes / elapsed
+                self.segment_speed = rate if self.segment_speed is None else 0.7 * self.segment_speed + 0.3 * rate
+                size = int(self.segment_speed * self.fd.SEGMENT_SECONDS) & ~(self.fd.BLOCK_SIZE - 1)
+                self.segment_size = max(self.fd.MIN_SEGMENT, min(self.fd.MAX_SEGMENT, size))
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for s, e in sorted(ranges):
+        if merged and s <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return merged
+
+
+def _preallocate(fp, size):
+    """为文件预分配 size 字节（支持时使用 posix_fallocate）"""
+    fp.truncate(size)
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fp.fileno(), 0, size)
+        except OSError:
+            pass
+
+
+# ═══════════════════════════════════════
+#  Streaming Mux
+# ═══════════════════════════════════════
+
+class _StreamMuxError(Exception):
+    pass
+
+
+class StreamMuxFD(FileDownloader):
+    """
+    流式合并：ffmpeg 同时读取视频流与音频流，直接写出最终文件，不再生成分流临时文件，
+    磁盘写入量与所需空间都只有最终文件的大小。进度取自 ffmpeg -progress 报告的已写出字节数，
+    取消时结束 ffmpeg 进程。无法断点续传，也不受带宽调度限制；失败时由调用方改用分流下载再合并。
+    """
+
+    _FORMATS = ('mp4', 'mkv', 'webm', 'mov')
+
+    @staticmethod
+    def suitable(info, params):
+        fmts = info.get('requested_formats') or ()
+        return (len(fmts) > 1
+                and info.get('ext') in StreamMuxFD._FORMATS
+                and not _bandwidth.limit
+                and all((f.get('protocol') or determine_protocol(f)) in ('http', 'https') for f in fmts)
+                and FFmpegFD.available())
+
+    def real_download(self, filename, info_dict):
+        fmts = info_dict['requested_formats']
+        tmpfilename = self.temp_name(filename)
+        ffpp = FFmpegPostProcessor(downloader=self.ydl)
+        args = [ffpp.executable, '-y', '-hide_banner', '-nostdin', '-xerror', '-loglevel', 'error', '-nostats',
+                '-progress', 'pipe:1']
+        for f in fmts:
+            headers = f.get('http_headers') or info_dict.get('http_headers') or {}
+            if headers:
+                args += ['-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items())]
+            args += ['-i', f['url']]
+        for i, f in enumerate(fmts):
+            args += ['-map', f"{i}:{'a' if f.get('vcodec') == 'none' else 'v'}:0"]
+        ext = info_dict['ext']
+        args += ['-c', 'copy', '-f', EXT_TO_OUT_FORMATS.get(ext, ext), ffpp._ffmpeg_filename_argument(tmpfilename)]
+
+        total = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in fmts)
+        status = {'status': 'downloading', 'filename': filename, 'tmpfilename': tmpfilename,
+                  'downloaded_bytes': 0, 'total_bytes_estimate': total}
+        proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stderr = []
+        reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+        reader.start()
+        try:
+            for line in proc.stdout:
+                key, _, value = line.partition(b'=')
+                if key == b'total_size' and value.strip().isdigit():
+                    status['downloaded_bytes'] = int(value)
+                    self._hook_progress(dict(status), info_dict)
+            retval = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            self.try_remove(tmpfilename)
+            raise
+        finally:
+            reader.join()
+        if retval != 0:
+            self.try_remove(tmpfilename)
+            self._hook_progress({'status': 'error', 'filename': filename}, info_dict)
+            message = (stderr[0] if stderr else b'').decode('utf-8', 'replace').strip().splitlines()
+            raise _StreamMuxError(message[-1] if message else f'ffmpeg exited with code {retval}')
+        size = os.path.getsize(tmpfilename)
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({'status': 'finished', 'filename': filename, 'downloaded_bytes': size,
+                             'total_bytes': size}, info_dict)
+        return True
+
+
+# ═══════════════════════════════════════
+#  YoutubeDL Pool
+# ═══════════════════════════════════════
+
+_BASE_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'no_color': True,
+    'noprogress': True,         # 进度只通过 progress_hooks 上报
+}
+
+# 每种配置对应一组长期复用的 YoutubeDL 实例
+_PROFILES = {
+    'info': {'skip_download': True},
+    'video': {'merge_output_format': 'mp4'},
+    'audio': {},
+    'subtitle': {'skip_download': True},
+}
+
+_UNSET = object()
+
+# 解析后的默认提取器列表（进程内共享）：YoutubeDL 每次构造都要按 allowed_extractors
+# 展开上千个提取器名称，耗时上百毫秒，池中的每个实例只需复制一次结果
+_default_extractors = None
+_extractors_lock = threading.Lock()
+
+# 预热时实例化的提取器：只加载 YouTube 相关模块，其余提取器仍保持懒加载
+_WARM_EXTRACTORS = ('Youtube', 'YoutubeTab')
+
+# register_extractor 注册的额外提取器类（如离线基准的测试提取器）
+_extra_extractors = []
+
+
+class PooledYDL(yt_dlp.YoutubeDL):
+    """可复用的 YoutubeDL：按任务替换 outtmpl / format / progress_hooks 等选项，结束后还原"""
+
+    def __init__(self, profile):
+        super().__init__(dict(_BASE_OPTS, **_PROFILES[profile]))
+        self.pool_profile = profile
+        self.last_used = time.time()
+        self._job_hooks = []
+        self._saved_opts = {}
+        self._saved_selector = _UNSET
+        self._stream_count = 1
+        self._stream_info = None
+        self._stream_results = {}
+        self._deferred = []
+        self.add_progress_hook(self._dispatch_progress)
+
+    def add_default_info_extractors(self):
+        global _default_extractors
+        with _extractors_lock:
+            cached = _default_extractors
+            if cached is None:
+                super().add_default_info_extractors()
+                # 少数提取器以实例注册（如 UnsupportedURL），它们绑定了所属实例，只记录类型
+                _default_extractors = tuple((ie, False) if isinstance(ie, type) else (type(ie), True)
+                                            for ie in self._ies.values())
+        if cached is not None:
+            for ie, instantiate in cached:
+                self.add_info_extractor(ie() if instantiate else ie)
+        if _extra_extractors:
+            # 注册的提取器排在最前，先于 Generic 等通配提取器匹配；
+            # 它们不在 yt-dlp 的提取器注册表中，须以实例加入（get_info_extractor 按名称查找类）
+            defaults, self._ies = self._ies, {}
+            for ie in _extra_extractors:
+                self.add_info_extractor(ie())
+            self._ies.update(defaults)
+
+    def begin_job(self, opts):
+        opts = dict(opts)
+        self._job_hooks = list(opts.pop('progress_hooks', ()))
+        for key, value in opts.items():
+            if key == 'outtmpl':
+                self._saved_opts[key] = self.params['outtmpl'].get('default', _UNSET)
+                self.params['outtmpl']['default'] = value
+            else:
+                self._saved_opts[key] = self.params.get(key, _UNSET)
+                self.params[key] = value
+        if 'format' in opts:
+            # format_selector 只在 __init__ 中根据 params['format'] 构建一次，换格式时需要重建
+            self._saved_selector = self.format_selector
+            self.format_selector = self._build_selector(opts['format'])
+
+    def _build_selector(self, spec):
+        if spec in (None, '-') or callable(spec):
+            return spec
+        return self.build_format_selector(spec)
+
+    def end_job(self):
+        for key, value in self._saved_opts.items():
+            target = self.params['outtmpl'] if key == 'outtmpl' else self.params
+            target_key = 'default' if key == 'outtmpl' else key
+            if value is _UNSET:
+                target.pop(target_key, None)
+            else:
+                target[target_key] = value
+        if self._saved_selector is not _UNSET:
+            self.format_selector = self._saved_selector
+            self._saved_selector = _UNSET
+        self._saved_opts = {}
+        self._job_hooks = []
+        self._deferred = []
+        self._download_retcode = 0
+        self.last_used = time.time()
+
+    def process_info(self, info_dict):
+        if self._reuse_download(info_dict):
+            return
+        if not self.params.get('skip_download'):
+            _staging.check_space(info_dict, self.params.get('paths'),
+                                 self.params.get('stream_merge') and StreamMuxFD.suitable(info_dict, self.params))
+        if not self._stream_merge(info_dict):
+            fmts = info_dict.get('requested_formats') or ()
+            self._stream_count = max(1, len(fmts))
+            self._stream_info = info_dict if self.params.get('parallel_streams') and len(fmts) > 1 else None
+            self._stream_results = {}
+            try:
+                super().process_info(info_dict)
+            finally:
+                self._stream_info = None
+                self._stream_results = {}
+                self._stream_count = 1
+        if (info_dict.get('__write_download_archive') and not self.params.get('skip_download')
+                and not info_dict.get('__postprocess_deferred')):
+            _download_index.add(info_dict, info_dict.get('filepath'))
+
+    def _stream_merge(self, info_dict):
+        """stream_merge 任务的合并格式先尝试流式合并；返回 False 时 info_dict 已还原，改走分流下载"""
+        if not self.params.get('stream_merge') or not StreamMuxFD.suitable(info_dict, self.params):
+            return False
+        backup = dict(info_dict, requested_formats=[dict(f) for f in info_dict['requested_formats']])
+        # 让 yt-dlp 把合并格式当作一次下载交给 dl()，由 dl() 换成 StreamMuxFD
+        saved = self.params.get('external_downloader', _UNSET)
+        self.params['external_downloader'] = {'default': 'ffmpeg'}
+        try:
+            super().process_info(info_dict)
+            return True
+        except DownloadCancelled:
+            raise
+        except (_StreamMuxError, yt_dlp.utils.DownloadError) as e:
+            print(f'[流式合并失败，改用分流下载] {e}')
+        finally:
+            if saved is _UNSET:
+                self.params.pop('external_downloader', None)
+            else:
+                self.params['external_downloader'] = saved
+        info_dict.clear()
+        info_dict.update(backup)
+        return False
+
+    def post_process(self, filename, info, files_to_move=None):
+        # 合并 / 修复等本次下载附带的后处理以及从暂存区移出文件都移交后处理池，下载槽位在字节落盘后即可释放；
+        # 实例上注册的后处理器与实例绑定，存在时仍在本线程执行
+        staged = os.path.dirname(os.path.abspath(filename)) != info.get('__finaldir', os.path.dirname(
+            os.path.abspath(filename)))
+        if (not self.params.get('defer_postprocess') or not (info.get('__postprocessors') or staged)
+                or any(self._pps[key] for key in ('post_process', 'after_move'))):
+            return _post_process(self, filename, info, files_to_move, _job_move_opts(self.params))
+        self._deferred.append((filename, dict(info), files_to_move, _job_move_opts(self.params)))
+        info['filepath'] = filename
+        info['__postprocess_deferred'] = True
+        return info
+
+    def take_deferred(self):
+        """取出本任务推迟执行的后处理：[(文件名, info, files_to_move, 移动选项)]"""
+        deferred, self._deferred = self._deferred, []
+        return deferred
+
+    def _reuse_download(self, info_dict):
+        """下载索引命中时复用已有文件（不在同一目录时链接过去），返回 True 表示无需下载"""
+        if self.params.get('skip_download') or not _download_index.enabled:
+            return False
+        target = self.prepare_filename(info_dict)
+        if not target or os.path.exists(target):
+            return False            # 目标已存在时由 yt-dlp 按“已下载”处理，随后照常写入索引
+        entry = _download_index.lookup(info_dict, os.path.dirname(os.path.abspath(target)))
+        if entry is None:
+            return False
+        path, size = entry
+        if os.path.dirname(os.path.abspath(path)) != os.path.dirname(os.path.abspath(target)):
+            try:
+                _link_file(path, target)
+            except OSError as e:
+                print(f'[索引复用失败] {e}')
+                return False
+            _download_index.add(info_dict, target)
+            path = target
+        info_dict['filepath'] = path
+        self._stream_count = 1
+        self._dispatch_progress({'status': 'finished', 'filename': path, 'total_bytes': size,
+                                 'info_dict': info_dict})
+        return True
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if info.get('requested_formats') and self.params.get('external_downloader') and name != '-':
+            fd = StreamMuxFD(self, self.params)
+            for ph in self._progress_hooks:
+                fd.add_progress_hook(ph)
+            return fd.download(name, dict(info))
+        if not subtitle and not test and name != '-':
+            fid = info.get('format_id')
+            if fid in self._stream_results:
+                return self._stream_results.pop(fid)
+            if self._stream_info is not None:
+                return self._dl_streams(name, info)
+        return self._dl_single(name, info, subtitle, test)
+
+    def _dl_single(self, name, info, subtitle=False, test=False):
+        if subtitle or test or name == '-' or not SegmentedHttpFD.suitable(info, self.params):
+            return super().dl(name, info, subtitle, test)
+        fd = SegmentedHttpFD(self, self.params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        return fd.download(name, dict(info), subtitle)
+
+    def _dl_streams(self, name, info):
+        """合并格式：第一条流开始下载时，其余各流同时在后台线程中下载"""
+        merged_info, self._stream_info = self._stream_info, None
+        first = info['format_id']
+        suffix = f".f{first}.{info['ext']}"
+        if not name.endswith(suffix):
+            return self._dl_single(name, info)
+        base = name[:-len(suffix)]
+
+        results, errors, threads = {}, [], []
+
+        def run(fname, stream_info):
+            try:
+                results[stream_info['format_id']] = self._dl_single(fname, stream_info)
+            except BaseException as e:
+                errors.append(e)
+
+        for f in merged_info['requested_formats']:
+            if f['format_id'] == first:
+                continue
+            stream_info = dict(merged_info)
+            del stream_info['requested_formats']
+            stream_info.update(f)
+            t = threading.Thread(target=run, args=(f"{base}.f{f['format_id']}.{f['ext']}", stream_info),
+                                 daemon=True)
+            t.start()
+            threads.append(t)
+        try:
+            result = self._dl_single(name, info)
+        finally:
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+        self._stream_results = results
+        return result
+
+    def _dispatch_progress(self, d):
+        d['stream_count'] = self._stream_count
+        for hook in self._job_hooks:
+            hook(d)
+
+
+class YdlPool:
+    """
+    按配置分组的 YoutubeDL 实例池。
+    取出的实例由单个任务独占；空闲超过 idle_timeout 的实例会被关闭。
+    """
+
+    def __init__(self, max_idle=2, idle_timeout=300):
+        self._max_idle = max_idle
+        self._idle_timeout = idle_timeout
+        self._idle = {p: [] for p in _PROFILES}
+        self._lock = threading.Lock()
+        self._janitor = None
+
+    @contextlib.contextmanager
+    def checkout(self, profile, opts=None):
+        ydl = self._acquire(profile)
+        ydl.begin_job(opts or {})
+        try:
+            yield ydl
+        finally:
+            ydl.end_job()
+            self._release(ydl)
+
+    def close_all(self):
+        with self._lock:
+            instances = [y for idle in self._idle.values() for y in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        for ydl in instances:
+            ydl.close()
+
+    def _acquire(self, profile):
+        with self._lock:
+            idle = self._idle[profile]
+            if idle:
+                return idle.pop()
+        return PooledYDL(profile)
+
+    def _release(self, ydl):
+        evicted = None
+        with self._lock:
+            idle = self._idle[ydl.pool_profile]
+            idle.append(ydl)
+            if len(idle) > self._max_idle:
+                evicted = idle.pop(0)
+            if self._janitor is None:
+                self._janitor = threading.Thread(target=self._evict_loop, daemon=True)
+                self._janitor.start()
+        if evicted is not None:
+            evicted.close()
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(self._idle_timeout / 2)
+            deadline = time.time() - self._idle_timeout
+            with self._lock:
+                stale = []
+                for idle in self._idle.values():
+                    stale.extend(y for y in idle if y.last_used < deadline)
+                    idle[:] = [y for y in idle if y.last_used >= deadline]
+                if not any(self._idle.values()):
+                    self._janitor = None
+            for ydl in stale:
+                ydl.close()
+            if self._janitor is None:
+                return
+
+
+_ydl_pool = YdlPool()
+
+
+def register_extractor(ie):
+    """注册额外的提取器类，优先于内置提取器匹配；关闭空闲实例，之后创建的实例都会加载它"""
+    if ie not in _extra_extractors:
+        _extra_extractors.append(ie)
+    _ydl_pool.close_all()
+
+
+def warmup():
+    """
+    预热：在后台线程中调用，提前构建 info 实例的提取器注册表并加载 YouTube 提取器，
+    使第一次解析链接时不再承担这部分开销
+    """
+    with _ydl_pool.checkout('info') as ydl:
+        for key in _WARM_EXTRACTORS:
+            ydl.get_info_extractor(key)
+
+
+# ═══════════════════════════════════════
+#  Fetch Video Info
+# ═══════════════════════════════════════
+
+def fetch_video_info(url, use_cache=True):
+    """获取视频信息，返回格式化的字典（优先命中元数据缓存）；返回副本，调用方可以添加字段"""
+    entry = _info_cache.lookup(url) if use_cache else None
+    if entry is None:
+        entry = _extract_info(url)
+    return dict(entry['result'])
+
+
+def _extract_info(url):
+    """完整提取视频信息并写入缓存，返回缓存条目"""
+    with _ydl_pool.checkout('info') as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    if not info:
+        raise Exception('无法获取视频信息')
 
-        # Sort: combined first, then video-only by height desc, then audio by tbr desc
-        type_order = {'combined': 0, 'video': 1, 'audio': 2}
-        formats.sort(key=lambda x: (
-            type_order.get(x['type'], 9),
-            -x['height'],
-            -x['tbr']
-        ))
-
-        # Parse subtitles
-        subtitles = []
-        for lang, subs in (info.get('subtitles') or {}).items():
+    info = yt_dlp.YoutubeDL.sanitize_info(info)
+    result = _parse_info(info)
+    video_id = info.get('id') or extract_video_id(url)
+    _info_cache.put(video_id, info, result, url=url)
+    return {'id': video_id, 'info': info, 'result': result}
+
+
+def _resolve_info(url):
+    """返回可直接用于下载的原始 info：命中缓存时复用，流地址过期后才重新提取"""
+    entry = _info_cache.lookup(url)
+    if entry is None:
+        entry = _extract_info(url)
+    info = copy.deepcopy(entry['info'])
+    # 提取时按默认格式做过一次选择；留下的 requested_formats 会覆盖下载时的选择结果
+    # （单一格式也会被当成合并格式下载），与 yt-dlp 的 --load-info-json 一样去掉
+    info.pop('requested_formats', None)
+    return info
+
+
+def _download_info(ydl, url):
+    """从已提取的 info 开始下载，省去 ydl.download 中的再次提取"""
+    ydl.process_ie_result(_resolve_info(url), download=True)
+
+
+def _parse_info(info):
+    """将 yt-dlp 的原始信息解析为界面使用的字典"""
+    formats = FormatTable(info).to_list()
+
+    # Parse subtitles
+    subtitles = []
+    for lang, subs in (info.get('subtitles') or {}).items():
+        subtitles.append({
+            'lang': lang,
+            'name': _lang_name(lang),
+            'is_auto': False,
+        })
+    for lang, subs in (info.get('automatic_captions') or {}).items():
+        # Only include a subset of auto-captions
+        if lang in ('zh-Hans', 'zh-Hant', 'zh', 'en', 'ja', 'ko', 'es', 'fr', 'de', 'pt', 'ru', 'ar', 'hi'):
             subtitles.append({
                 'lang': lang,
-                'name': _lang_name(lang),
-                'is_auto': False,
+                'name': _lang_name(lang) + ' (自动)',
+                'is_auto': True,
             })
-        for lang, subs in (info.get('automatic_captions') or {}).items():
-            # Only include a subset of auto-captions
-            if lang in ('zh-Hans', 'zh-Hant', 'zh', 'en', 'ja', 'ko', 'es', 'fr', 'de', 'pt', 'ru', 'ar', 'hi'):
-                subtitles.append({
-                    'lang': lang,
-                    'name': _lang_name(lang) + ' (自动)',
-                    'is_auto': True,
-                })
 
+    duration = info.get('duration') or 0
+    minutes = duration // 60
+    seconds = duration % 60
+
+    result = {
+        'id': info.get('id', ''),
+        'title': info.get('title', '未知视频'),
+        'author': info.get('uploader', info.get('channel', '未知')),
+        'duration': f'{minutes}:{seconds:02d}',
+        'duration_sec': duration,
+        'view_count': info.get('view_count', 0),
+        'thumbnail': info.get('thumbnail', ''),
+        'formats': formats,
+        'subtitles': subtitles,
+    }
+
+    return result
+
+
+# ═══════════════════════════════════════
+#  Format Table
+# ═══════════════════════════════════════
+
+_VCODEC_FAMILIES = (('avc', 'avc'), ('h264', 'avc'), ('hev', 'hevc'), ('hvc', 'hevc'), ('h265', 'hevc'),
+                    ('vp09', 'vp9'), ('vp9', 'vp9'), ('vp8', 'vp8'), ('av01', 'av1'), ('av1', 'av1'))
+_ACODEC_FAMILIES = (('mp4a', 'aac'), ('aac', 'aac'), ('opus', 'opus'), ('vorbis', 'vorbis'), ('mp3', 'mp3'),
+                    ('ac-3', 'ac3'), ('ac3', 'ac3'), ('ec-3', 'eac3'), ('eac3', 'eac3'), ('flac', 'flac'))
+_TYPE_ORDER = {'combined': 0, 'video': 1, 'audio': 2}
+
+
+def _codec_family(codec, families):
+    codec = (codec or '').lower()
+    for prefix, family in families:
+        if codec.startswith(prefix):
+            return family
+    return codec.split('.', 1)[0]
+
+
+class FormatRecord:
+    """
+    格式表中的一条记录。
+    str(record) 即 format_id，可直接作为 download_video / download_audio 的格式参数。
+    """
+
+    __slots__ = ('format_id', 'type', 'quality', 'height', 'fps', 'ext', 'filesize', 'size', 'size_source',
+                 'vcodec', 'acodec', 'codec', 'tbr', 'order', 'language_preference', 'drc')
+
+    def __init__(self, f, duration, order=0):
+        vcodec = f.get('vcodec', 'none')
+        acodec = f.get('acodec', 'none')
+        has_video = vcodec not in ('none', None)
+        has_audio = acodec not in ('none', None)
+        self.format_id = f.get('format_id', '')
+        self.height = f.get('height') or 0
+        self.fps = f.get('fps') or 0
+        self.ext = f.get('ext', '?')
+        self.tbr = f.get('tbr') or 0
+        # yt-dlp 排序后的位置（越大越好）、音轨语言偏好（原声最高）与动态范围压缩音轨标记，
+        # 用于按 yt-dlp 的 bestaudio 顺序挑选音轨
+        self.order = order
+        lang_pref = f.get('language_preference')
+        self.language_preference = lang_pref if lang_pref is not None else -1
+        self.drc = 'DRC' in (f.get('format_note') or '') or self.format_id.endswith('-drc')
+        self.filesize = f.get('filesize') or f.get('filesize_approx') or 0
+        # 未给出大小时按平均码率估算（kbps × 秒 → 字节）
+        self.size = self.filesize or int(self.tbr * duration * 125)
+        if f.get('filesize'):
+            self.size_source = 'exact'
+        elif self.filesize:
+            self.size_source = 'approx'
+        else:
+            self.size_source = 'bitrate' if self.size else ''
+        self.vcodec = vcodec if has_video else ''
+        self.acodec = acodec if has_audio else ''
+        if has_video:
+            self.quality = f.get('format_note', '') or (f'{self.height}p' if self.height else '')
+            self.type = 'combined' if has_audio else 'video'
+            self.codec = _codec_family(vcodec, _VCODEC_FAMILIES)
+        else:
+            self.quality = f.get('format_note', '') or f'{int(self.tbr)}kbps'
+            self.type = 'audio'
+            self.codec = _codec_family(acodec, _ACODEC_FAMILIES)
+
+    def __str__(self):
+        return self.format_id
+
+    def __repr__(self):
+        return f'<FormatRecord {self.format_id} {self.type} {self.quality} {self.codec}/{self.ext}>'
+
+    def to_dict(self):
+        return {
+            'format_id': self.format_id,
+            'type': self.type,
+            'quality': self.quality,
+            'height': self.height,
+            'fps': self.fps,
+            'ext': self.ext,
+            'filesize': self.filesize,
+            'size': self.size,
+            'size_source': self.size_source,
+            'filesize_str': ('≈' if self.size_source in ('approx', 'bitrate') else '') + format_filesize(self.size),
+            'vcodec': self.vcodec,
+            'acodec': self.acodec,
+            'tbr': self.tbr,
+        }
+
+
+class FormatTable:
+    """
+    视频的格式表：按类型 / 分辨率 / 编码 / 容器建立索引。
+    每个索引内的记录按质量从高到低排列（分辨率、帧率、码率），
+    查询只需在最小的候选列表上做一次线性过滤，典型耗时为微秒级。
+
+        table.query('video', max_height=1080, max_size=500 << 20, codec='avc')
+        table.query('audio', min_tbr=128, prefer='smallest')
+    """
+
+    def __init__(self, info):
         duration = info.get('duration') or 0
-        minutes = duration // 60
-        seconds = duration % 60
-
-        result = {
-            'id': info.get('id', ''),
-            'title': info.get('title', '未知视频'),
-            'author': info.get('uploader', info.get('channel', '未知')),
-            'duration': f'{minutes}:{seconds:02d}',
-            'duration_sec': duration,
-            'view_count': info.get('view_count', 0),
-            'thumbnail': info.get('thumbnail', ''),
-            'formats': formats,
-            'subtitles': subtitles,
+        records = {}
+        for order, f in enumerate(info.get('formats') or []):
+            fid = f.get('format_id', '')
+            if fid in records:
+                continue
+            rec = FormatRecord(f, duration, order)
+            if rec.type == 'audio' and not rec.acodec:
+                continue
+            records[fid] = rec
+        self.records = sorted(records.values(), key=lambda r: (_TYPE_ORDER[r.type], -r.height, -r.fps, -r.tbr))
+        self._by_id = records
+        self._index = collections.defaultdict(list)     # (维度, 值) → 记录列表（保持质量顺序）
+        for rec in self.records:
+            self._index['type', rec.type].append(rec)
+            self._index['codec', rec.type, rec.codec].append(rec)
+            self._index['ext', rec.type, rec.ext].append(rec)
+        # 每种类型按高度降序排列的负高度，用于二分定位 max_height
+        self._heights = {kind: [-r.height for r in self._index['type', kind]] for kind in _TYPE_ORDER}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, format_id):
+        return self._by_id[format_id]
+
+    def to_list(self):
+        return [rec.to_dict() for rec in self.records]
+
+    def select(self, kind='video', max_height=None, min_height=None, codec=None, ext=None,
+               max_size=None, min_tbr=None, max_tbr=None):
+        """返回满足条件的全部记录（质量从高到低）"""
+        if codec is not None:
+            candidates = self._index.get(('codec', kind, codec), ())
+        elif ext is not None:
+            candidates = self._index.get(('ext', kind, ext), ())
+        elif max_height is not None:
+            candidates = self._index.get(('type', kind), ())
+            candidates = candidates[bisect.bisect_left(self._heights[kind], -max_height):]
+        else:
+            candidates = self._index.get(('type', kind), ())
+        return [
+            r for r in candidates
+            if (max_height is None or r.height <= max_height)
+            and (min_height is None or r.height >= min_height)
+            and (ext is None or r.ext == ext)
+            and (max_size is None or (r.size and r.size <= max_size))
+            and (min_tbr is None or r.tbr >= min_tbr)
+            and (max_tbr is None or r.tbr <= max_tbr)
+        ]
+
+    def query(self, kind='video', prefer='best', **filters):
+        """返回满足条件的最佳（prefer='best'）或最小（prefer='smallest'）记录，没有时返回 None"""
+        matches = self.select(kind, **filters)
+        if not matches:
+            return None
+        if prefer == 'smallest':
+            return min(matches, key=lambda r: (r.size or float('inf'), r.tbr))
+        return matches[0]
+
+    def best_audio(self, max_size=None):
+        """
+        与 yt-dlp 的 bestaudio 顺序一致的最佳音轨：原声（language_preference）优先、非 DRC 优先，
+        其次按 yt-dlp 的格式排序；多音轨视频不会因码率更高而选中配音或 DRC 音轨
+        """
+        matches = self.select('audio', max_size=max_size)
+        if not matches:
+            return None
+        return min(matches, key=lambda r: (-r.language_preference, r.drc, -r.order))
+
+    def preset(self, max_height=None, codec=None, max_size=None):
+        """
+        组合最佳视频 + 最佳音频（best_audio），返回可直接用作下载格式的规格字符串，没有合适格式时返回 None。
+        限制总大小时从高到低尝试视频，取第一个还能放下音频的组合。
+        """
+        for video in self.select('video', max_height=max_height, codec=codec, max_size=max_size):
+            audio = self.best_audio(max_size - video.size if max_size else None)
+            if audio is not None:
+                return f'{video.format_id}+{audio.format_id}'
+            if not max_size:
+                break
+        combined = self.query('combined', max_height=max_height, codec=codec, max_size=max_size)
+        return combined.format_id if combined is not None else None
+
+
+def format_table(url):
+    """返回视频的格式表（命中缓存时不发起网络请求）"""
+    entry = _info_cache.lookup(url) or _extract_info(url)
+    table = entry.get('table')
+    if table is None:
+        table = entry['table'] = FormatTable(entry['info'])
+    return table
+
+
+# ─── Size Estimation ───
+
+PRESET_HEIGHTS = (2160, 1440, 1080, 720, 480, None)    # 与界面的预设按钮一致
+_PROBE_CONNECTIONS = 8
+
+
+def estimate_sizes(url, probe=False):
+    """
+    预测下载大小（字节）：每个格式、每个视频 + 音频组合、每个 download_best 预设。
+    缺少 filesize 时按 tbr × 时长估算；probe=True 时对估算值发 HEAD 请求确认，
+    确认结果写回信息缓存，之后的查询与下载都直接使用。
+    """
+    if probe:
+        _probe_sizes(url)
+    table = format_table(url)
+    videos = table.select('video')
+    audios = table.select('audio')
+    presets = {}
+    for height in PRESET_HEIGHTS:
+        spec = table.preset(max_height=height)
+        parts = [table[fid] for fid in spec.split('+')] if spec else []
+        presets[str(height or 'best')] = {
+            'format': spec,
+            'size': sum(r.size for r in parts) if all(r.size for r in parts) else 0,
+            'exact': bool(parts) and all(r.size_source == 'exact' for r in parts),
         }
+    return {
+        'formats': {r.format_id: {'size': r.size, 'source': r.size_source} for r in table.records},
+        'pairs': {f'{v.format_id}+{a.format_id}': v.size + a.size
+                  for v in videos for a in audios if v.size and a.size},
+        'presets': presets,
+    }
 
-        _set_progress(status='idle', percent=0)
-        return result
 
-    except Exception as e:
-        _set_progress(status='error', error=str(e))
+def _probe_sizes(url):
+    """对没有确切大小的直链格式并发请求 Content-Length，结果写回缓存"""
+    entry = _info_cache.lookup(url) or _extract_info(url)
+    info = copy.deepcopy(entry['info'])
+    targets = [f for f in (info.get('formats') or [])
+               if not f.get('filesize') and f.get('url') and determine_protocol(f) in ('http', 'https')]
+    if not targets:
+        return
+    found = []
+
+    def worker():
+        while targets:
+            try:
+                f = targets.pop()
+            except IndexError:
+                return
+            size = _content_length(ydl, f['url'], f.get('http_headers') or {})
+            if size:
+                f['filesize'] = size
+                found.append(f)
+
+    with _ydl_pool.checkout('info') as ydl:
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(min(_PROBE_CONNECTIONS, len(targets)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    if found:
+        _info_cache.put(entry['id'], info, _parse_info(info), url=url)
+
+
+def _content_length(ydl, url, headers):
+    """HEAD 请求获取文件大小；服务器不支持 HEAD 时退回 Range: bytes=0-0"""
+    try:
+        resp = ydl.urlopen(Request(url, headers=headers, method='HEAD'))
+        try:
+            length = resp.headers.get('Content-Length')
+            if resp.status == 200 and length and length.isdigit():
+                return int(length)
+        finally:
+            resp.close()
+    except RequestError:
+        pass
+    try:
+        resp = ydl.urlopen(Request(url, headers=dict(headers, Range='bytes=0-0')))
+    except RequestError:
+        return None
+    try:
+        m = re.search(r'/(\d+)$', resp.headers.get('Content-Range') or '')
+        return int(m.group(1)) if resp.status == 206 and m else None
+    finally:
+        resp.close()
+
+
+# ═══════════════════════════════════════
+#  Playlist / Channel
+# ═══════════════════════════════════════
+
+def fetch_playlist_info(url):
+    """
+    流式获取播放列表 / 频道（扁平提取）。
+    生成器：第一项为列表信息，之后逐条产出视频条目；
+    条目只包含 id / 标题等基本信息，完整格式解析留到选中时再调用 fetch_video_info。
+    """
+    opts = {'extract_flat': 'in_playlist', 'lazy_playlist': True}
+    with _ydl_pool.checkout('info', opts) as ydl:
+        result = ydl.extract_info(url, download=False, process=False)
+        # 频道首页等链接会先重定向到实际的列表页
+        while result and result.get('_type') in ('url', 'url_transparent'):
+            result = ydl.extract_info(result['url'], download=False, process=False,
+                                      ie_key=result.get('ie_key'))
+        if not result:
+            raise Exception('无法获取列表信息')
+
+        if result.get('_type') not in ('playlist', 'multi_video'):
+            yield {'id': result.get('id', ''), 'title': result.get('title', ''),
+                   'uploader': result.get('uploader', ''), 'count': 1}
+            yield _flat_entry(result, 1)
+            return
+
+        yield {
+            'id': result.get('id', ''),
+            'title': result.get('title', '未知列表'),
+            'uploader': result.get('uploader') or result.get('channel') or '',
+            'count': result.get('playlist_count'),
+        }
+        for index, entry in enumerate(result.get('entries') or (), 1):
+            if entry:
+                yield _flat_entry(entry, index)
+
+
+def _flat_entry(entry, index):
+    duration = int(entry.get('duration') or 0)
+    thumbs = entry.get('thumbnails') or []
+    return {
+        'index': index,
+        'id': entry.get('id', ''),
+        'title': entry.get('title') or entry.get('id', ''),
+        'url': entry.get('webpage_url') or entry.get('url') or '',
+        'duration': f'{duration // 60}:{duration % 60:02d}' if duration else '',
+        'uploader': entry.get('uploader') or entry.get('channel') or '',
+        'thumbnail': entry.get('thumbnail') or (thumbs[-1].get('url') if thumbs else ''),
+    }
+
+
+# ═══════════════════════════════════════
+#  Staging
+# ═══════════════════════════════════════
+
+_COPY_BUFFER = 1 << 20
+
+
+class StagingArea:
+    """
+    暂存区：.part、分段状态、分流文件与合并输出先写在快速的本地磁盘上，完成后再移到下载目录
+    （网络共享 / 机械硬盘只承受一次顺序写入）。每个下载目录对应暂存区下的一个子目录，
+    同名文件不会互相覆盖，中断的任务也能在原位置续传。
+    """
+
+    SPACE_MARGIN = 1.05         # 空间检查预留的余量
+
+    def __init__(self):
+        self.path = None
+        self.buffer_size = None
+
+    def opts(self, output_dir):
+        """任务的 YoutubeDL 选项：paths（下载目录 + 暂存目录）与写入缓冲大小"""
+        paths = {'home': output_dir}
+        if self.path:
+            key = hashlib.sha1(os.path.abspath(output_dir).encode('utf-8')).hexdigest()[:12]
+            paths['temp'] = os.path.join(self.path, key)
+        opts = {'paths': paths}
+        if self.buffer_size:
+            opts.update(buffersize=self.buffer_size, noresizebuffer=True)
+        return opts
+
+    def check_space(self, info, paths, streaming=False):
+        """
+        开始传输前检查空间：暂存区放得下各流与合并输出，下载目录放得下最终文件。
+        暂存区不够时本任务直接写入下载目录；下载目录也不够时抛出 OSError(ENOSPC)。
+        """
+        fmts = info.get('requested_formats') or (info,)
+        size = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in fmts)
+        if not size or not paths:
+            return
+        # 分流下载再合并时，各流与合并输出同时存在
+        work = size if streaming or len(fmts) == 1 else size * 2
+        home = paths.get('home') or '.'
+        staging = paths.get('temp')
+        if staging and _free_space(staging) < work * self.SPACE_MARGIN:
+            print(f'[暂存区空间不足] {staging}：改为直接写入下载目录')
+            del paths['temp']
+            staging = None
+        if staging and _same_volume(staging, home):
+            return
+        need = (size if staging else work) * self.SPACE_MARGIN
+        free = _free_space(home)
+        if free < need:
+            raise OSError(errno.ENOSPC, f'磁盘空间不足：需要 {format_filesize(need)}，'
+                                        f'可用 {format_filesize(free)}', home)
+
+
+def _free_space(path):
+    return shutil.disk_usage(_existing_parent(path)).free
+
+
+def _same_volume(a, b):
+    try:
+        return os.stat(_existing_parent(a)).st_dev == os.stat(_existing_parent(b)).st_dev
+    except OSError:
+        return False
+
+
+def _existing_parent(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+
+def _move_file(src, dst, buffer_size=None):
+    """
+    原子地把文件移到 dst：同一卷内直接重命名；跨卷时先复制到 dst 所在目录的临时文件
+    （按最终大小预分配，减少碎片），复制完成后再重命名，下载目录中不会出现写了一半的文件。
+    """
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp = dst + '.part'
+    try:
+        with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+            _preallocate(fdst, os.fstat(fsrc.fileno()).st_size)
+            shutil.copyfileobj(fsrc, fdst, buffer_size or _COPY_BUFFER)
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        _silent_remove(tmp)
         raise
+    os.remove(src)
+
+
+class _StagedMovePP(MoveFilesAfterDownloadPP):
+    """
+    代替 yt-dlp 的 MoveFiles：文件移出暂存区时使用 _move_file（跨卷复制也是原子的）。
+    块大小与下载目录由任务传入：推迟执行时所用的 YoutubeDL 只有基础参数
+    """
+
+    def __init__(self, downloader=None, buffer_size=None, home=None):
+        super().__init__(downloader)
+        self.buffer_size = buffer_size
+        self.home = home
+
+    def run(self, info):
+        finaldir = (info.get('__finaldir') or self.home
+                    or os.path.dirname(os.path.abspath(info['filepath'])))
+        finalpath = os.path.join(finaldir, os.path.basename(info['filepath']))
+        moves = dict(info['__files_to_move'])
+        moves[info['filepath']] = finalpath
+        for oldfile, newfile in moves.items():
+            newfile = newfile or os.path.join(finaldir, os.path.basename(oldfile))
+            if os.path.abspath(oldfile) == os.path.abspath(newfile) or not os.path.exists(oldfile):
+                continue
+            try:
+                _move_file(oldfile, newfile, self.buffer_size)
+            except OSError as e:
+                raise PostProcessingError(f'无法移动文件到下载目录: {e}') from e
+        info['filepath'] = finalpath
+        return [], info
+
+
+def _job_move_opts(params):
+    """从任务的 YoutubeDL 参数中取出移动文件所需的选项，随推迟的后处理一起保存"""
+    return {'buffer_size': params.get('buffersize'), 'home': (params.get('paths') or {}).get('home')}
+
+
+def _post_process(ydl, filename, info, files_to_move=None, move_opts=None):
+    """同 YoutubeDL.post_process，只是把移动文件的后处理换成 _StagedMovePP"""
+    info['filepath'] = filename
+    info['__files_to_move'] = files_to_move or {}
+    info = ydl.run_all_pps('post_process', info, additional_pps=info.get('__postprocessors'))
+    info = ydl.run_pp(_StagedMovePP(ydl, **(move_opts or {})), info)
+    del info['__files_to_move']
+    return ydl.run_all_pps('after_move', info)
+
+
+_staging = StagingArea()
+
+
+def set_staging_dir(path):
+    """设置暂存目录（建议为本地 SSD），None 为直接写入下载目录"""
+    _staging.path = os.path.abspath(path) if path else None
+
+
+def set_buffer_size(nbytes):
+    """设置下载与移动文件时的读写块大小（字节），None 为默认（自适应）"""
+    _staging.buffer_size = max(4096, int(nbytes)) if nbytes else None
+
+
+# ═══════════════════════════════════════
+#  Post-processing
+# ═══════════════════════════════════════
+
+DEFAULT_POSTPROCESS_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+class PostProcessPool:
+    """
+    后处理阶段：ffmpeg 合并 / 转封装 / 修复在独立的有界线程池中启动与等待，
+    同时运行的 ffmpeg 进程数不超过 max_workers，与下一批下载并行进行；暂存区的文件也在此移到下载目录。
+    任务在此阶段保持 merging 状态，完成后才以 done / error / cancelled 结束。
+    """
+
+    def __init__(self, max_workers=DEFAULT_POSTPROCESS_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def submit(self, job_id, deferred):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='ytdl-postprocess')
+            return self._executor.submit(self._run, job_id, deferred)
+
+    def _ydl(self):
+        # 每个后处理线程一个不加载提取器的 YoutubeDL，只为后处理器提供参数与输出
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            ydl = self._local.ydl = yt_dlp.YoutubeDL(dict(_BASE_OPTS), auto_init=False)
+        return ydl
+
+    def _run(self, job_id, deferred):
+        progress = _manager.progress(job_id)
+        try:
+            if progress is not None and progress.cancel_reason == 'cancelled':
+                raise DownloadCancelled('cancelled')
+            if progress is not None:
+                progress.cancel_reason = None       # 合并无法暂停：忽略进入此阶段前的暂停请求
+            ydl = self._ydl()
+            for filename, info, files_to_move, move_opts in deferred:
+                for pp in info.get('__postprocessors') or ():
+                    pp.set_downloader(ydl)
+                info = _post_process(ydl, filename, info, files_to_move, move_opts)
+                _download_index.add(info, info.get('filepath'))
+            _set_progress(job_id, status='done')
+        except Exception as e:
+            _fail_job(job_id, e)
+            if not isinstance(e, DownloadCancelled):
+                print(f'[后处理错误] {e}')
+            raise
+        finally:
+            _manager._finish(job_id)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_postprocessor = PostProcessPool()
+
+
+def _complete_download(job_id, deferred):
+    """
+    下载结束：没有待执行的后处理时任务立即完成；否则交给后处理池。
+    在任务工作线程中直接返回以释放下载槽位，其它线程直接调用时等待后处理完成。
+    """
+    if not deferred:
+        _set_progress(job_id, status='done')
+        return True
+    _set_progress(job_id, status='merging')
+    future = _postprocessor.submit(job_id, deferred)
+    if not getattr(_worker_context, 'active', False):
+        future.result()
+    return True
 
 
 # ═══════════════════════════════════════
 #  Download Video / Audio
 # ═══════════════════════════════════════
 
-def download_video(url, format_id, output_dir, merge_audio=True):
-    """下载视频，支持自动合并音频"""
-    _set_progress(status='downloading', percent=0, speed='', eta='', error='', filename='')
+def download_video(url, format_id, output_dir, merge_audio=True, connections=None, stream_merge=False,
+                   job_id=None):
+    """
+    下载视频，支持自动合并音频；format_id 也可以是格式表的查询结果。
+    stream_merge=True 时视频与音频边下载边合并，只写出最终文件（见 StreamMuxFD）
+    """
+    if isinstance(format_id, FormatRecord):
+        merge_audio = merge_audio and format_id.type == 'video'
+        format_id = format_id.format_id
+    job_id = _ensure_job(job_id, 'video', url)
+    _set_progress(job_id, status='downloading', error='')
 
     # Build format spec
     if merge_audio:
@@ -178,44 +2248,47 @@ def download_video(url, format_id, output_dir, merge_audio=True):
 
     ydl_opts = {
         'format': format_spec,
-        'outtmpl': os.path.join(output_dir, '%(title)s_%(height)sp.%(ext)s'),
-        'merge_output_format': 'mp4',
-        'progress_hooks': [_progress_hook],
-        'quiet': True,
-        'no_warnings': True,
-        'no_color': True,
+        'outtmpl': '%(title)s_%(height)sp.%(ext)s',
+        **_staging.opts(output_dir),
+        'progress_hooks': [_ProgressHook(job_id)],
+        'concurrent_fragment_downloads': connections or DEFAULT_CONNECTIONS,
+        'defer_postprocess': True,
+        'parallel_streams': True,
+        'stream_merge': stream_merge,
     }
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        _set_progress(status='done', percent=100)
-        return True
+        with _ydl_pool.checkout('video', ydl_opts) as ydl:
+            _download_info(ydl, url)
+            deferred = ydl.take_deferred()
+        return _complete_download(job_id, deferred)
     except Exception as e:
-        _set_progress(status='error', error=str(e))
+        _fail_job(job_id, e)
         raise
 
 
-def download_audio(url, format_id, output_dir):
+def download_audio(url, format_id, output_dir, connections=None, job_id=None):
     """下载音频"""
-    _set_progress(status='downloading', percent=0, speed='', eta='', error='', filename='')
+    format_id = str(format_id)
+    job_id = _ensure_job(job_id, 'audio', url)
+    _set_progress(job_id, status='downloading', error='')
 
     ydl_opts = {
         'format': format_id,
-        'outtmpl': os.path.join(output_dir, '%(title)s_audio.%(ext)s'),
-        'progress_hooks': [_progress_hook],
-        'quiet': True,
-        'no_warnings': True,
-        'no_color': True,
+        'outtmpl': '%(title)s_audio.%(ext)s',
+        **_staging.opts(output_dir),
+        'progress_hooks': [_ProgressHook(job_id)],
+        'concurrent_fragment_downloads': connections or DEFAULT_CONNECTIONS,
+        'defer_postprocess': True,
     }
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        _set_progress(status='done', percent=100)
-        return True
+        with _ydl_pool.checkout('audio', ydl_opts) as ydl:
+            _download_info(ydl, url)
+            deferred = ydl.take_deferred()
+        return _complete_download(job_id, deferred)
     except Exception as e:
-        _set_progress(status='error', error=str(e))
+        _fail_job(job_id, e)
         raise
 
 
@@ -223,67 +2296,606 @@ def download_audio(url, format_id, output_dir):
 #  Download Subtitle
 # ═══════════════════════════════════════
 
-def download_subtitle(url, lang, fmt, output_dir, is_auto=False):
-    """下载字幕 fmt: 'srt' or 'vtt'"""
-    _set_progress(status='downloading', percent=50, error='')
+def download_subtitle(url, lang, fmt, output_dir, is_auto=False, job_id=None):
+    """下载字幕 fmt: 'srt' / 'vtt' 等；视频没有该格式时在进程内转换"""
+    job_id = _ensure_job(job_id, 'subtitle', url)
+    download_subtitles(url, output_dir, langs=() if is_auto else [lang], auto_langs=[lang] if is_auto else (),
+                       fmts=(fmt,), job_id=job_id)
+    return True
 
-    sub_key = 'automatic_captions' if is_auto else 'subtitles'
 
-    ydl_opts = {
-        'skip_download': True,
-        'writesubtitles': not is_auto,
-        'writeautomaticsub': is_auto,
-        'subtitleslangs': [lang],
-        'subtitlesformat': fmt,
-        'outtmpl': os.path.join(output_dir, '%(title)s'),
-        'quiet': True,
-        'no_warnings': True,
-        'no_color': True,
-    }
+_SUBTITLE_CONNECTIONS = 8
+
+
+def download_subtitles(url, output_dir, langs=None, auto_langs=(), fmts=('vtt',), bilingual=(), job_id=None):
+    """
+    批量下载字幕：一次提取，多个语言 / 格式的字幕轨并发请求，整个批次作为一个任务报告进度。
+    langs / auto_langs 分别选择人工字幕与自动字幕，None 表示全部可用语言，空序列表示不下载。
+    bilingual 为 (主语言, 副语言) 对的列表，每对输出一条合并后的双语字幕。
+    视频没有请求的格式时由 subtitles 模块流式转换，自动字幕同时去除滚动重复行。
+    返回 {'files': [...], 'failed': [...]}。
+    """
+    job_id = _ensure_job(job_id, 'subtitles', url)
+    _set_progress(job_id, status='downloading', error='')
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        _set_progress(status='done', percent=100)
-        return True
+        info = _resolve_info(url)
+        with _ydl_pool.checkout('subtitle', {'outtmpl': os.path.join(output_dir, '%(title)s')}) as ydl:
+            tracks = _subtitle_tracks(info, ydl.prepare_filename(info), langs, auto_langs, fmts, bilingual)
+            if not tracks:
+                raise Exception('没有匹配的字幕')
+            batch = _SubtitleBatch(ydl, tracks, job_id)
+            batch.run()
+            if batch.progress is not None and batch.progress.cancel_reason is not None:
+                raise DownloadCancelled(batch.progress.cancel_reason)
     except Exception as e:
-        _set_progress(status='error', error=str(e))
+        _fail_job(job_id, e)
         raise
 
+    failed = [name for name, _ in batch.failed]
+    if not batch.files:
+        _set_progress(job_id, status='error', error=f'字幕下载失败: {batch.failed[0][1]}')
+        raise Exception(f'字幕下载失败: {batch.failed[0][1]}')
+    _set_progress(job_id, status='done',
+                  error=f'{len(failed)} 个字幕下载失败: {", ".join(failed)}' if failed else '')
+    return {'files': batch.files, 'failed': failed}
+
+
+def _subtitle_tracks(info, base, langs, auto_langs, fmts, bilingual=()):
+    """列出要下载的字幕轨：[(名称, 目标文件, 目标格式, [(字幕条目, 是否自动字幕)])]"""
+    tracks = []
+    manual_langs = set()
+    for key, selected in (('subtitles', langs), ('automatic_captions', auto_langs)):
+        is_auto = key == 'automatic_captions'
+        available = info.get(key) or {}
+        for lang in (available if selected is None else selected):
+            entries = _subtitle_entries(available, lang)
+            if not entries:
+                continue
+            if is_auto:
+                # 同一语言同时下载人工与自动字幕时，自动字幕加 .auto 后缀区分
+                suffix = '.auto' if lang in manual_langs else ''
+            else:
+                manual_langs.add(lang)
+                suffix = ''
+            chosen = {}
+            for fmt in fmts:
+                fmt, entry = _subtitle_source(entries, fmt)
+                chosen.setdefault(fmt, entry)
+            for fmt, entry in chosen.items():
+                name = f'{lang}{suffix}.{fmt}'
+                tracks.append((name, f'{base}.{name}', fmt, [(entry, is_auto)]))
+
+    for pair in bilingual:
+        sources = []
+        for lang in pair:
+            for key in ('subtitles', 'automatic_captions'):
+                entries = _subtitle_entries(info.get(key) or {}, lang)
+                if entries:
+                    sources.append((_subtitle_source(entries, 'srt')[1], key == 'automatic_captions'))
+                    break
+        if len(sources) == 2:
+            fmt = next((f for f in fmts if f in subtitles.TARGET_FORMATS), 'srt')
+            name = f'{pair[0]}+{pair[1]}.{fmt}'
+            tracks.append((name, f'{base}.{name}', fmt, sources))
+    return tracks
+
+
+def _subtitle_entries(available, lang):
+    return [e for e in (available.get(lang) or []) if e.get('url') or e.get('data')]
+
+
+def _subtitle_source(entries, fmt):
+    """返回 (输出格式, 源条目)：优先原生格式，其次可转换的源格式，最后取该轨道的最佳格式"""
+    by_ext = {e.get('ext'): e for e in entries}
+    if fmt in by_ext:
+        return fmt, by_ext[fmt]
+    if fmt in subtitles.TARGET_FORMATS:
+        for src in subtitles.SOURCE_FORMATS:
+            if src in by_ext:
+                return fmt, by_ext[src]
+    return entries[-1].get('ext'), entries[-1]
+
+
+class _SubtitleBatch:
+    """
+    并发下载一组字幕轨。每条轨道作为任务的一个流记录字节数；
+    尚未开始的轨道按已完成轨道的平均大小估算总量，百分比不会因为轨道陆续开始而回退。
+    """
+
+    def __init__(self, ydl, tracks, job_id):
+        self.ydl = ydl
+        self.pending = collections.deque(tracks)
+        self.names = [track[0] for track in tracks]
+        self.job_id = job_id
+        self.progress = _manager.progress(job_id)
+        self.lock = threading.Lock()
+        self.sizes = []
+        self.files = []
+        self.failed = []
+        if self.progress is not None:
+            self.progress.stream_count = len(tracks)
+
+    def run(self):
+        workers = [threading.Thread(target=self._worker, daemon=True)
+                   for _ in range(min(_SUBTITLE_CONNECTIONS, len(self.pending)))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+    def _worker(self):
+        while True:
+            if self.progress is not None and self.progress.cancel_reason is not None:
+                return
+            try:
+                name, path, fmt, sources = self.pending.popleft()
+            except IndexError:
+                return
+            try:
+                size = self._write(path, fmt, sources)
+            except (RequestError, OSError, ValueError, SyntaxError) as err:
+                with self.lock:
+                    self.failed.append((name, str(err)))
+                self._record(name, 0)
+                continue
+            with self.lock:
+                self.files.append(path)
+            self._record(name, size)
+
+    def _write(self, path, fmt, sources):
+        entry, is_auto = sources[0]
+        if len(sources) == 1 and not is_auto and entry.get('ext') == fmt:
+            data = self._fetch(entry)
+            with open(path, 'wb') as fp:
+                fp.write(data)
+            return len(data)
+
+        # 需要转换 / 去重 / 合并：边下载边解析，逐条写出
+        streams = []
+        try:
+            cues = []
+            for entry, is_auto in sources:
+                fp = self._open(entry)
+                streams.append(fp)
+                parsed = subtitles.parse(fp, entry.get('ext'))
+                cues.append(subtitles.dedupe_rolling(parsed) if is_auto else parsed)
+            merged = cues[0] if len(cues) == 1 else subtitles.merge_bilingual(*cues)
+            with open(path, 'w', encoding='utf-8', newline='\n') as out:
+                subtitles.write(merged, out, fmt)
+        finally:
+            for fp in streams:
+                fp.close()
+        return os.path.getsize(path)
+
+    def _open(self, entry):
+        if entry.get('data') is not None:
+            return io.BytesIO(entry['data'].encode('utf-8'))
+        return self.ydl.urlopen(Request(entry['url'], headers=entry.get('http_headers') or {}))
+
+    def _fetch(self, entry):
+        if entry.get('data') is not None:
+            return entry['data'].encode('utf-8')
+        resp = self.ydl.urlopen(Request(entry['url'], headers=entry.get('http_headers') or {}))
+        try:
+            return resp.read()
+        finally:
+            resp.close()
+
+    def _record(self, name, size):
+        progress = self.progress
+        if progress is None:
+            return
+        with self.lock:
+            if size:
+                self.sizes.append(size)
+            estimate = sum(self.sizes) // len(self.sizes) if self.sizes else 0
+            progress.finish(name, size)
+            for other in self.names:
+                st = progress.streams.get(other)
+                if st is None:
+                    progress.record(other, 0, estimate)
+                elif not st[2]:
+                    st[1] = estimate
+        _manager.touch(self.job_id)
+
 
 # ═══════════════════════════════════════
 #  Best Format Presets
 # ═══════════════════════════════════════
 
-def download_best(url, output_dir, max_height=None):
-    """下载最佳质量（可限制最大分辨率）"""
-    _set_progress(status='downloading', percent=0, speed='', eta='', error='')
+def download_best(url, output_dir, max_height=None, connections=None, stream_merge=False, job_id=None):
+    """下载最佳质量（可限制最大分辨率），stream_merge 同 download_video"""
+    job_id = _ensure_job(job_id, 'best', url)
+    _set_progress(job_id, status='downloading', error='')
 
-    if max_height:
-        format_spec = f'bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]/best'
-    else:
-        format_spec = 'bestvideo+bestaudio/best'
+    try:
+        # 从格式表直接选出具体格式（需要提取信息，失败时同样标记任务出错）；
+        # 表中没有可用组合时交给 yt-dlp 的格式选择
+        format_spec = format_table(url).preset(max_height=max_height)
+        if format_spec is None:
+            if max_height:
+                format_spec = f'bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]/best'
+            else:
+                format_spec = 'bestvideo+bestaudio/best'
 
-    ydl_opts = {
-        'format': format_spec,
-        'outtmpl': os.path.join(output_dir, '%(title)s_%(height)sp.%(ext)s'),
-        'merge_output_format': 'mp4',
-        'progress_hooks': [_progress_hook],
-        'quiet': True,
-        'no_warnings': True,
-        'no_color': True,
-    }
+        ydl_opts = {
+            'format': format_spec,
+            'outtmpl': '%(title)s_%(height)sp.%(ext)s',
+            **_staging.opts(output_dir),
+            'progress_hooks': [_ProgressHook(job_id)],
+            'concurrent_fragment_downloads': connections or DEFAULT_CONNECTIONS,
+            'defer_postprocess': True,
+            'parallel_streams': True,
+            'stream_merge': stream_merge,
+        }
 
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        _set_progress(status='done', percent=100)
-        return True
+        with _ydl_pool.checkout('video', ydl_opts) as ydl:
+            _download_info(ydl, url)
+            deferred = ydl.take_deferred()
+        return _complete_download(job_id, deferred)
     except Exception as e:
-        _set_progress(status='error', error=str(e))
+        _fail_job(job_id, e)
         raise
 
 
+# ═══════════════════════════════════════
+#  Metadata Cache
+# ═══════════════════════════════════════
+
+APP_DATA_DIR = os.path.join(
+    os.environ.get('APPDATA') or os.path.join(os.path.expanduser('~'), '.config'),
+    'WeiruanYTDL',
+)
+
+_VIDEO_ID_RE = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/)|youtu\.be/)'
+    r'([0-9A-Za-z_-]{11})'
+)
+_EXPIRE_RE = re.compile(r'/expire/(\d+)')
+_EXPIRY_MARGIN = 300        # 签名链接到期前提前失效（秒）
+
+
+def extract_video_id(url):
+    """从 YouTube 链接中提取视频 id，无法识别时返回 None"""
+    m = _VIDEO_ID_RE.search(url or '')
+    return m.group(1) if m else None
+
+
+def _stream_expiry(info):
+    """返回签名流地址中最早的过期时间戳，找不到时返回 None"""
+    expiry = None
+    for f in (info.get('formats') or []):
+        for key in ('url', 'manifest_url', 'fragment_base_url'):
+            u = f.get(key)
+            if not u:
+                continue
+            qs = urllib.parse.parse_qs(urllib.parse.urlsplit(u).query)
+            values = qs.get('expire') or _EXPIRE_RE.findall(u)
+            for v in values:
+                try:
+                    ts = int(v)
+                except ValueError:
+                    continue
+                expiry = ts if expiry is None else min(expiry, ts)
+    return expiry
+
+
+class InfoCache:
+    """
+    视频信息两级缓存：内存 LRU + 磁盘 (gzip JSON)。
+    以视频 id 为键，同时保存原始 info 与解析结果；
+    条目在签名流地址过期前失效，找不到过期时间时使用默认 TTL。
+    """
+
+    def __init__(self, cache_dir, max_entries=32, ttl=6 * 3600, max_disk_entries=500):
+        self._dir = cache_dir
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_disk_entries = max_disk_entries
+        self._mem = collections.OrderedDict()
+        self._aliases = collections.OrderedDict()     # 非 YouTube 链接 → 视频 id
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0}
+
+    def lookup(self, url):
+        """按链接查找缓存条目"""
+        video_id = extract_video_id(url)
+        if video_id is None:
+            with self._lock:
+                video_id = self._aliases.get(url)
+        return self.get(video_id) if video_id else None
+
+    def get(self, video_id):
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(video_id)
+            if entry is not None:
+                if entry['expires'] > now:
+                    self._mem.move_to_end(video_id)
+                    self._stats['memory_hits'] += 1
+                    return entry
+                del self._mem[video_id]
+                self._stats['expired'] += 1
+
+        entry = self._load(video_id)
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry['expires'] <= now:
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                self._remove_file(video_id)
+                return None
+            self._stats['disk_hits'] += 1
+            self._remember(video_id, entry)
+            return entry
+
+    def put(self, video_id, info, result, url=None):
+        if not video_id:
+            return
+        expiry = _stream_expiry(info)
+        expires = (expiry - _EXPIRY_MARGIN) if expiry else time.time() + self._ttl
+        entry = {'id': video_id, 'expires': expires, 'info': info, 'result': result}
+        with self._lock:
+            if url and extract_video_id(url) is None:
+                self._aliases[url] = video_id
+                while len(self._aliases) > 256:
+                    self._aliases.popitem(last=False)
+            self._remember(video_id, entry)
+            self._puts += 1
+            sweep = self._puts % 50 == 1
+        self._store(video_id, entry)
+        if sweep:
+            self.sweep()
+
+    def invalidate(self, video_id):
+        with self._lock:
+            self._mem.pop(video_id, None)
+            self._remove_file(video_id)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, memory_entries=len(self._mem))
+
+    def sweep(self):
+        """删除已过期的磁盘条目，并将条目数限制在 max_disk_entries 以内"""
+        try:
+            names = [n for n in os.listdir(self._dir) if n.endswith('.json.gz')]
+        except OSError:
+            return
+        now = time.time()
+        alive = []
+        for name in names:
+            path = os.path.join(self._dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            # 文件修改时间被设置为条目过期时间
+            if mtime <= now:
+                _silent_remove(path)
+            else:
+                alive.append((mtime, path))
+        alive.sort()
+        for _, path in alive[:max(0, len(alive) - self._max_disk_entries)]:
+            _silent_remove(path)
+
+    # ─── Internals ───
+
+    def _remember(self, video_id, entry):
+        # caller holds self._lock
+        self._mem[video_id] = entry
+        self._mem.move_to_end(video_id)
+        while len(self._mem) > self._max_entries:
+            self._mem.popitem(last=False)
+
+    def _path(self, video_id):
+        if not re.fullmatch(r'[0-9A-Za-z_-]{1,64}', video_id):
+            video_id = hashlib.sha1(video_id.encode('utf-8')).hexdigest()
+        return os.path.join(self._dir, f'{video_id}.json.gz')
+
+    def _load(self, video_id):
+        path = self._path(video_id)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, video_id, entry):
+        path = self._path(video_id)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+            with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=3) as fp:
+                json.dump(entry, fp, ensure_ascii=False)
+            os.utime(tmp, (time.time(), entry['expires']))
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            _silent_remove(tmp)
+            print(f'[缓存写入失败] {e}')
+
+    def _remove_file(self, video_id):
+        _silent_remove(self._path(video_id))
+
+
+def _silent_remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_partial_files(progress):
+    """删除任务的未完成文件：.part 与分段状态；合并格式已下载完的单流文件也是中间文件"""
+    merged = len(progress.files) > 1
+    for name in progress.files:
+        for path in (name + '.part', name + '.part.segments', name + '.ytdl'):
+            _silent_remove(path)
+        if merged:
+            _silent_remove(name)
+
+
+_info_cache = InfoCache(os.path.join(APP_DATA_DIR, 'info_cache'))
+
+
+def cache_stats():
+    """返回元数据缓存的命中/未命中计数"""
+    return _info_cache.stats()
+
+
+# ═══════════════════════════════════════
+#  Download Index
+# ═══════════════════════════════════════
+
+_FICLONE = 0x40049409       # Linux ioctl：写时复制克隆（Btrfs / XFS 等）
+
+
+class DownloadIndex:
+    """
+    已下载文件的持久索引 (SQLite)：以 (提取器:视频 id, 格式 id, 扩展名) 为键，记录文件路径、大小与抽样校验和。
+    下载前先查索引，命中且文件未被改动时直接复用，不同输出目录则克隆 / 硬链接过去，不再重复下载。
+    校验和只取文件头、中、尾各 1 MiB 与文件大小计算，多 GB 的文件也只需读取 3 MiB。
+    """
+
+    SAMPLE_SIZE = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        # caller holds self._lock；首次使用时才打开数据库
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            with self._db:
+                self._db.execute('''
+                    CREATE TABLE IF NOT EXISTS files (
+                        video_id    TEXT NOT NULL,
+                        formats     TEXT NOT NULL,
+                        ext         TEXT NOT NULL,
+                        path        TEXT NOT NULL,
+                        size        INTEGER NOT NULL,
+                        checksum    TEXT NOT NULL,
+                        created     REAL,
+                        PRIMARY KEY (video_id, formats, ext, path)
+                    )''')
+        return self._db
+
+    @staticmethod
+    def key(info):
+        video_id = info.get('id')
+        if not video_id or not info.get('format_id'):
+            return None
+        return (f"{info.get('extractor_key') or info.get('extractor') or ''}:{video_id}",
+                str(info['format_id']), info.get('ext') or '')
+
+    @classmethod
+    def checksum(cls, path):
+        size = os.path.getsize(path)
+        h = hashlib.sha256(str(size).encode())
+        with open(path, 'rb') as fp:
+            for offset in sorted({0, max(0, size // 2 - cls.SAMPLE_SIZE // 2), max(0, size - cls.SAMPLE_SIZE)}):
+                fp.seek(offset)
+                h.update(fp.read(cls.SAMPLE_SIZE))
+        return h.hexdigest()
+
+    def add(self, info, path):
+        key = self.key(info)
+        if key is None or not path or not os.path.isfile(path):
+            return
+        path = os.path.abspath(path)
+        try:
+            size, checksum = os.path.getsize(path), self.checksum(path)
+        except OSError:
+            return
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (*key, path, size, checksum, time.time()))
+
+    def lookup(self, info, prefer_dir=None):
+        """返回 (路径, 大小)：优先 prefer_dir 中的文件；已删除或被改动的文件从索引中移除"""
+        key = self.key(info)
+        if key is None:
+            return None
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT path, size, checksum FROM files WHERE video_id = ? AND formats = ? AND ext = ? '
+                'ORDER BY created DESC', key).fetchall()
+        rows.sort(key=lambda row: os.path.dirname(row[0]) != prefer_dir)
+        stale = []
+        found = None
+        for path, size, checksum in rows:
+            try:
+                if os.path.getsize(path) == size and self.checksum(path) == checksum:
+                    found = (path, size)
+                    break
+            except OSError:
+                pass
+            stale.append(path)
+        if stale:
+            with self._lock:
+                with self._db:
+                    self._db.executemany(
+                        'DELETE FROM files WHERE video_id = ? AND formats = ? AND ext = ? AND path = ?',
+                        [(*key, path) for path in stale])
+        return found
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def _link_file(src, dst):
+    """把已有文件放到新位置：优先写时复制克隆，其次硬链接，都不支持时（跨卷 / FAT）复制"""
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    tmp = dst + '.part'
+    try:
+        import fcntl
+        with open(src, 'rb') as s, open(tmp, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        os.replace(tmp, dst)
+        return 'reflink'
+    except (ImportError, OSError):
+        _silent_remove(tmp)
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return 'copy'
+
+
+_download_index = DownloadIndex(os.path.join(APP_DATA_DIR, 'downloads.db'))
+
+
+def set_download_reuse(enabled):
+    """开启 / 关闭下载索引复用（关闭后仍记录新下载的文件）"""
+    _download_index.enabled = bool(enabled)
+
+
+# ─── Job kinds accepted by submit_job ───
+_JOB_KINDS = {
+    'video': download_video,
+    'audio': download_audio,
+    'subtitle': download_subtitle,
+    'subtitles': download_subtitles,
+    'best': download_best,
+}
+
+
 # ═══════════════════════════════════════
 #  Helpers
 # ═══════════════════════════════════════
@@ -310,3 +2922,12 @@ def format_filesize(size):
             return f'{size:.1f} {unit}'
         size /= 1024
     return f'{size:.1f} TB'
+
+
+if __name__ == '__main__':
+    # python -m ytdl_engine：命令行入口。先把本模块登记为 ytdl_engine，
+    # 命令行模块导入时拿到的就是这一份，而不是再加载一个副本
+    import sys
+    sys.modules['ytdl_engine'] = sys.modules[__name__]
+    import ytdl_cli
+    sys.exit(ytdl_cli.main())